@@ -7,6 +7,7 @@ from flask_restful import Api
 from flask_cors import CORS
 
 from API.Endpoints.LogsEndpoint import LogsEndpoint
+from API.Endpoints.MetricsEndpoint import MetricsEndpoint
 from API.Endpoints.APIexchangeInfoEndpoint import APIExchangeInfoEndpoint
 from API.Endpoints.BalanceEndpoint import BalanceEndpoint
 from API.Endpoints.JWTEndpoint import JWTEndpoint
@@ -64,6 +65,9 @@ class APIServer:
         self.api.add_resource(APIExchangeInfoEndpoint, APIServer.API_PREFIX + '/info',
                               resource_class_kwargs={'trade_handler': self.th})
 
+        self.api.add_resource(MetricsEndpoint, APIServer.API_PREFIX + '/metrics',
+                              resource_class_kwargs={'trade_handler': self.th})
+
         self.api.add_resource(JWTEndpoint, APIServer.API_PREFIX + '/auth',
                               resource_class_kwargs={'trade_handler': self.th})
 
@@ -7,6 +7,6 @@ class BalanceEndpoint(BotAPIResource):
     @jwt_required()
     def get(self, force='0'):
         if force == '1':
-            self.th.balances.update_balances(self.th.fx.get_all_balances_dict())
+            self.th.balances.refresh(self.th.fx.get_all_balances_dict, force=True)
 
         return self.th.balances.bal_dict
@@ -0,0 +1,15 @@
+from API.Endpoints.BotAPIResource import BotAPIResource
+from flask_jwt_extended import jwt_required
+
+
+class MetricsEndpoint(BotAPIResource):
+
+    @jwt_required()
+    def get(self):
+        return {'dispatcher': self.th.get_dispatcher_metrics(),
+                'ticker_shards': self.th.fx.get_ticker_shards_health(),
+                'latency': self.th.get_latency_metrics(),
+                'capture': self.th.fx.get_capture_metrics(),
+                'rest': self.th.fx.get_rest_metrics(),
+                'balances': self.th.balances.get_metrics(),
+                'clock': self.th.fx.get_clock_metrics()}
@@ -0,0 +1,79 @@
+'''
+Micro-benchmark of the ticker frame decoding.
+Reports frames/s and CPU time per frame for every installed JSON backend comparing plain full decoding
+with FrameDecoder (stream filtering and field projection).
+
+Usage: python -m Benchmarks.frame_decoder_benchmark
+'''
+import json
+import random
+import time
+
+from Bot.Exchange.Binance.FrameDecoder import FrameDecoder, JSON_BACKENDS
+
+SYMBOLS_COUNT = 2000
+TRADED_SYMBOLS = 20
+ARR_FRAMES = 50
+STREAM_FRAMES = 50000
+
+
+def ticker(symbol):
+    price = random.uniform(0.0001, 50000)
+    return {'e': '24hrTicker', 'E': int(time.time() * 1000), 's': symbol,
+            'p': '{:.8f}'.format(price * 0.01), 'P': '1.000', 'w': '{:.8f}'.format(price),
+            'x': '{:.8f}'.format(price), 'c': '{:.8f}'.format(price), 'Q': '10.00000000',
+            'b': '{:.8f}'.format(price * 0.999), 'B': '31.21000000',
+            'a': '{:.8f}'.format(price * 1.001), 'A': '40.66000000',
+            'o': '{:.8f}'.format(price), 'h': '{:.8f}'.format(price * 1.05), 'l': '{:.8f}'.format(price * 0.95),
+            'v': '12345.00000000', 'q': '18.00000000', 'O': 0, 'C': 86400000, 'F': 0, 'L': 18150, 'n': 18151}
+
+
+def generate_frames():
+    symbols = ['SYM{}BTC'.format(i) for i in range(SYMBOLS_COUNT)]
+    traded = symbols[:TRADED_SYMBOLS]
+    streams = {'{}@ticker'.format(s.lower()) for s in traded}
+
+    arr_frames = [json.dumps([ticker(s) for s in symbols], separators=(',', ':')) for _ in range(ARR_FRAMES)]
+
+    # half of the combined stream frames belong to symbols which were unsubscribed
+    stream_frames = []
+    for i in range(STREAM_FRAMES):
+        s = random.choice(traded if i % 2 else symbols[TRADED_SYMBOLS:TRADED_SYMBOLS * 2])
+        stream_frames.append(json.dumps({'stream': '{}@ticker'.format(s.lower()), 'data': ticker(s)},
+                                        separators=(',', ':')))
+
+    return arr_frames, stream_frames, streams
+
+
+def measure(name, frames, fn):
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+
+    for f in frames:
+        fn(f)
+
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+
+    print('{:<32}{:>14.1f}{:>18.2f}'.format(name, len(frames) / wall, cpu / len(frames) * 1e6))
+
+
+def main():
+    arr_frames, stream_frames, streams = generate_frames()
+
+    print('{:<32}{:>14}{:>18}'.format('backend / mode', 'frames/s', 'CPU us/frame'))
+
+    for backend, loads in JSON_BACKENDS.items():
+        decoder = FrameDecoder(backend)
+
+        measure('{} full !ticker@arr'.format(backend), arr_frames, loads)
+        measure('{} decoder !ticker@arr'.format(backend), arr_frames,
+                lambda f: decoder.decode_ticker(f, streams))
+
+        measure('{} full streams'.format(backend), stream_frames, loads)
+        measure('{} decoder streams'.format(backend), stream_frames,
+                lambda f: decoder.decode_ticker(f, streams))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+'''
+Benchmark of FXConnector REST calls against the local stand-in server (Benchmarks.rest_standin_server).
+Each round places and cancels a limit order. Rounds run sequentially without keep-alive, sequentially over
+the warm connection pool and concurrently across symbols through the REST thread pool.
+Reports requests/s, p50/p99 latency and connections opened. Ladders of limit orders are then placed one by one
+and as a batch, their latency is the time to place the whole ladder.
+
+Usage: python -m Benchmarks.rest_benchmark [--rounds 200] [--symbols 10] [--ladder 10] [--delay-ms 20] [--pool 10]
+                                           [--port 9080]
+'''
+import argparse
+import logging
+import os
+import time
+
+from Benchmarks.rest_standin_server import StandInRestServer
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p / 100), len(values) - 1)] if values else 0
+
+
+def order_round(fx, symbol, latencies):
+    started = time.perf_counter()
+    order = fx.create_limit_order(symbol, 'SELL', 1, 1)
+    placed = time.perf_counter()
+    fx.cancel_order(symbol, order['orderId'])
+    done = time.perf_counter()
+
+    latencies.extend([placed - started, done - placed])
+
+
+def run(name, server, fn, rounds, unit='req'):
+    latencies = []
+    connections = server.stats['connections']
+    started = time.perf_counter()
+
+    fn(latencies, rounds)
+
+    elapsed = time.perf_counter() - started
+    print('{:<28} {:>8.0f} {}/s  p50 {:>6.1f}ms  p99 {:>6.1f}ms  {} connections'.format(
+        name, len(latencies) / elapsed, unit, percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000,
+        server.stats['connections'] - connections))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m Benchmarks.rest_benchmark')
+    parser.add_argument('--rounds', type=int, default=200, help='place/cancel rounds of each run')
+    parser.add_argument('--symbols', type=int, default=10)
+    parser.add_argument('--ladder', type=int, default=10, help='orders of a ladder placed at once')
+    parser.add_argument('--delay-ms', type=float, default=20, help='stand-in response delay')
+    parser.add_argument('--pool', type=int, default=10, help='connections and threads (REST_POOL_SIZE)')
+    parser.add_argument('--port', type=int, default=9080)
+    args = parser.parse_args()
+
+    server = StandInRestServer(args.port, args.delay_ms).start()
+
+    os.environ['REST_URL'] = server.url()
+    os.environ['REST_POOL_SIZE'] = str(args.pool)
+
+    # imported once the environment points to the stand-in server
+    from Bot.FXConnector import FXConnector
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    fx = FXConnector('key', 'secret')
+    # the stand-in does not enforce exchange limits, so the governor should not throttle the runs
+    fx.governor.set_rate_limits([{'rateLimitType': 'REQUEST_WEIGHT', 'interval': 'MINUTE', 'intervalNum': 1,
+                                  'limit': 10 ** 9},
+                                 {'rateLimitType': 'ORDERS', 'interval': 'SECOND', 'intervalNum': 10,
+                                  'limit': 10 ** 9}])
+    symbols = ['SYM{}BTC'.format(i) for i in range(args.symbols)]
+
+    def sequential(latencies, rounds):
+        for i in range(rounds):
+            order_round(fx, symbols[i % len(symbols)], latencies)
+
+    def concurrent(latencies, rounds):
+        for f in [fx.submit(order_round, fx, symbols[i % len(symbols)], latencies) for i in range(rounds)]:
+            f.result()
+
+    fx.client.session.headers['Connection'] = 'close'
+    run('sequential, no keep-alive', server, sequential, args.rounds)
+
+    del fx.client.session.headers['Connection']
+    run('sequential, keep-alive', server, sequential, args.rounds)
+    run('concurrent, keep-alive', server, concurrent, args.rounds)
+
+    ladder = [{'side': 'SELL', 'price': 1 + i / 100, 'volume': 1} for i in range(args.ladder)]
+
+    def sequential_ladder(latencies, rounds):
+        for i in range(rounds):
+            started = time.perf_counter()
+            for o in ladder:
+                fx.create_limit_order(symbols[0], o['side'], o['price'], o['volume'])
+            latencies.append(time.perf_counter() - started)
+            fx.cancel_open_orders(symbols[0])
+
+    def batch_ladder(latencies, rounds):
+        for i in range(rounds):
+            started = time.perf_counter()
+            fx.create_limit_orders(symbols[0], ladder)
+            latencies.append(time.perf_counter() - started)
+            fx.cancel_open_orders(symbols[0])
+
+    run('{}-order ladder, sequential'.format(args.ladder), server, sequential_ladder, args.rounds // 10, 'ladder')
+    run('{}-order ladder, batch'.format(args.ladder), server, batch_ladder, args.rounds // 10, 'ladder')
+
+    fx.transport.shutdown()
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+'''
+Local stand-in for the part of the Binance REST API used by FXConnector.
+Serves HTTP/1.1 keep-alive connections with a configurable response delay, orders are kept in memory.
+
+Point the bot at it with REST_URL=http://localhost:9080/api
+
+Usage: python -m Benchmarks.rest_standin_server [--port 9080] [--delay-ms 20]
+'''
+import argparse
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qsl
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # responses are written in one segment, as a real server would, so delayed ACKs don't add latency
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def do_PUT(self):
+        self.handle_request('PUT')
+
+    def do_DELETE(self):
+        self.handle_request('DELETE')
+
+    def handle_request(self, method):
+        url = urlparse(self.path)
+        params = dict(parse_qsl(url.query))
+
+        length = int(self.headers.get('Content-Length', 0))
+        if length:
+            params.update(parse_qsl(self.rfile.read(length).decode()))
+
+        self.server.stats['requests'] += 1
+        if self.server.delay:
+            time.sleep(self.server.delay)
+
+        status, body = self.server.route(method, url.path, params)
+        data = json.dumps(body).encode()
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class StandInRestServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=9080, delay_ms=20):
+        super().__init__(('localhost', port), StandInHandler)
+        self.delay = delay_ms / 1000
+        self.lock = threading.Lock()
+        self.order_ids = itertools.count(1)
+        self.orders = {}
+        self.stats = {'requests': 0, 'connections': 0}
+        self.thread = None
+
+    def url(self):
+        return 'http://localhost:{}/api'.format(self.server_address[1])
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name='Stand-in REST Server Thread', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def process_request(self, request, client_address):
+        self.stats['connections'] += 1
+        super().process_request(request, client_address)
+
+    def route(self, method, path, params):
+        now = int(time.time() * 1000)
+        endpoint = path.split('/', 3)[-1]
+
+        if endpoint in ('ping', 'userDataStream'):
+            return 200, {'listenKey': 'standin'} if endpoint == 'userDataStream' else {}
+
+        if endpoint == 'time':
+            return 200, {'serverTime': now}
+
+        if endpoint == 'account':
+            return 200, {'balances': [{'asset': 'BTC', 'free': '1.00000000', 'locked': '0.00000000'}]}
+
+        if endpoint == 'order' and method == 'POST':
+            with self.lock:
+                order = {'symbol': params['symbol'], 'orderId': next(self.order_ids),
+                         'clientOrderId': params.get('newClientOrderId', 'standin'), 'transactTime': now,
+                         'price': params.get('price', '0'), 'origQty': params.get('quantity', '0'),
+                         'executedQty': '0.00000000', 'status': 'NEW', 'type': params['type'],
+                         'side': params['side'], 'stopPrice': params.get('stopPrice', '0')}
+                self.orders[order['orderId']] = order
+            if params.get('newOrderRespType') == 'ACK':
+                return 200, {k: order[k] for k in ('symbol', 'orderId', 'clientOrderId', 'transactTime')}
+            return 200, order
+
+        if endpoint == 'order' and method == 'DELETE':
+            with self.lock:
+                order = self.orders.pop(int(params.get('orderId', 0)), None)
+            if not order:
+                return 400, {'code': -2011, 'msg': 'Unknown order sent.'}
+            return 200, dict(order, status='CANCELED')
+
+        if endpoint == 'openOrders' and method == 'DELETE':
+            with self.lock:
+                orders = [self.orders.pop(i) for i, o in list(self.orders.items()) if o['symbol'] == params['symbol']]
+            if not orders:
+                return 400, {'code': -2011, 'msg': 'Unknown order sent.'}
+            return 200, [dict(o, status='CANCELED') for o in orders]
+
+        if endpoint in ('openOrders', 'allOrders'):
+            with self.lock:
+                orders = [o for o in self.orders.values() if o['symbol'] == params.get('symbol')]
+            return 200, orders
+
+        return 404, {'code': -1000, 'msg': 'Stand-in does not support {} {}'.format(method, path)}
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m Benchmarks.rest_standin_server')
+    parser.add_argument('--port', type=int, default=9080)
+    parser.add_argument('--delay-ms', type=float, default=20, help='response delay of every request')
+    args = parser.parse_args()
+
+    server = StandInRestServer(args.port, args.delay_ms).start()
+    print('Serving on {}'.format(server.url()))
+
+    try:
+        while True:
+            time.sleep(10)
+            print(server.stats)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+'''
+Benchmark of BinanceWebsocket against the local stand-in server (Benchmarks.ws_standin_server).
+Reports ticker messages/s handled, reconnect time after forced drops and memory/thread growth
+across repeated start_ticker/stop_sockets cycles.
+
+Usage: python -m Benchmarks.websocket_benchmark [--streams 200] [--max-streams 200] [--rate 20] [--seconds 10]
+                                                [--drops 5] [--close-code 1011] [--cycles 20] [--port 9443]
+'''
+import argparse
+import gc
+import os
+import resource
+import threading
+import time
+
+from Benchmarks.ws_standin_server import StandInServer
+
+WAIT_TIMEOUT = 30
+
+
+class StandInClient:
+    def stream_get_listen_key(self):
+        return 'benchmark'
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except IOError:
+        pass
+
+    # peak RSS where /proc is not available
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def wait_connected(bs, since=0):
+    '''
+    :return: seconds until all ticker shards are connected after "since"
+    '''
+    started = time.perf_counter()
+
+    while time.perf_counter() - started < WAIT_TIMEOUT:
+        shards = list(bs.shards)
+        if shards and all(s.is_open() and s.connected_at and s.connected_at > since for s in shards):
+            return time.perf_counter() - started
+
+        time.sleep(0.005)
+
+    raise TimeoutError('Ticker shards are not connected in {}s'.format(WAIT_TIMEOUT))
+
+
+class Counter:
+    def __init__(self):
+        self.messages = 0
+
+    def __call__(self, msg):
+        self.messages += len(msg) if isinstance(msg, list) else 1
+
+
+def measure_throughput(bs, counter, seconds):
+    counter.messages = 0
+    cpu_started = time.process_time()
+    time.sleep(seconds)
+
+    messages = counter.messages
+    cpu = time.process_time() - cpu_started
+
+    # the stand-in server runs in the same process, so CPU time includes generating the frames
+    print('Throughput: {:.0f} msg/s, {:.1f} CPU us/msg (incl. server), {} shards'.format(
+        messages / seconds, cpu * 1e6 / messages if messages else 0, len(bs.shards)))
+
+
+def measure_reconnects(server, bs, drops, close_code):
+    times = []
+
+    for _ in range(drops):
+        dropped_at = time.time()
+        server.drop_all(close_code)
+
+        # a socket connected just before may not be registered by the server yet, so it is dropped again
+        while any(s.is_open() and s.connected_at < dropped_at for s in bs.shards):
+            time.sleep(0.05)
+            server.drop_all(close_code)
+
+        times.append(wait_connected(bs, dropped_at))
+
+    print('Reconnect after close {}: avg {:.3f}s, max {:.3f}s over {} drops'.format(
+        close_code, sum(times) / len(times), max(times), len(times)))
+
+
+def measure_cycles(bs, symbols, counter, cycles):
+    gc.collect()
+    rss, threads = rss_mb(), threading.active_count()
+    started = time.perf_counter()
+
+    for _ in range(cycles):
+        bs.stop_sockets()
+        bs.start_ticker(symbols, counter)
+        bs.start()
+        wait_connected(bs, time.time())
+
+    elapsed = time.perf_counter() - started
+    gc.collect()
+
+    print('{} start/stop cycles: {:.3f}s per cycle, RSS {:.1f} -> {:.1f} MB, threads {} -> {}'.format(
+        cycles, elapsed / cycles, rss, rss_mb(), threads, threading.active_count()))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m Benchmarks.websocket_benchmark')
+    parser.add_argument('--streams', type=int, default=200, help='subscribed ticker streams')
+    parser.add_argument('--max-streams', type=int, default=200, help='streams per connection (WS_MAX_STREAMS)')
+    parser.add_argument('--rate', type=float, default=20, help='frames per second of each stream')
+    parser.add_argument('--seconds', type=float, default=10, help='throughput measurement time')
+    parser.add_argument('--drops', type=int, default=5)
+    parser.add_argument('--close-code', type=int, default=1011)
+    parser.add_argument('--cycles', type=int, default=20)
+    parser.add_argument('--port', type=int, default=9443)
+    args = parser.parse_args()
+
+    server = StandInServer(args.port, rate=args.rate, user_rate=1).start()
+
+    os.environ['WS_URL'] = server.url()
+    os.environ['WS_MAX_STREAMS'] = str(args.max_streams)
+
+    # imported once the environment points to the stand-in server
+    from Bot.Exchange.Binance.BinanceWebsocket import BinanceWebsocket
+    from Bot.Exchange.NetworkRuntime import NetworkRuntime
+
+    runtime = NetworkRuntime()
+    runtime.ensure_running()
+
+    counter = Counter()
+    symbols = ['SYM{}BTC'.format(i) for i in range(args.streams)]
+
+    bs = BinanceWebsocket(StandInClient(), runtime)
+    bs.start_ticker(symbols, counter)
+    bs.start_user_info(lambda msg: None)
+    bs.start()
+
+    print('Connected in {:.3f}s'.format(wait_connected(bs)))
+
+    measure_throughput(bs, counter, args.seconds)
+    measure_reconnects(server, bs, args.drops, args.close_code)
+    measure_cycles(bs, symbols, counter, args.cycles)
+
+    bs.stop_sockets()
+    server.stop()
+    print('Server: {}'.format(server.stats))
+
+
+if __name__ == '__main__':
+    main()
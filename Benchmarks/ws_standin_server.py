@@ -0,0 +1,232 @@
+'''
+Local stand-in for the Binance websocket API.
+Serves combined streams ("/stream?streams=...") with SUBSCRIBE/UNSUBSCRIBE requests, single raw streams ("/ws/<stream>"),
+"!ticker@arr" and user data streams ("/ws/<listen key>") with synthetic payloads. Connections can be dropped
+periodically or on demand with a given close code.
+
+Point the bot at it with WS_URL=ws://localhost:9443/
+
+Usage: python -m Benchmarks.ws_standin_server [--port 9443] [--symbols 100] [--rate 10] [--user-rate 1]
+                                              [--drop-every 0] [--close-code 1011]
+'''
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from urllib.parse import urlparse, parse_qs
+
+import websockets
+from websockets import ConnectionClosed
+
+
+class StandInServer:
+    def __init__(self, port=9443, symbols=100, rate=10, user_rate=1, drop_every=0, close_code=1011):
+        '''
+        :param symbols: number of symbols in "!ticker@arr"
+        :param rate: frames per second of each stream
+        :param user_rate: user data events per second of each user data stream
+        :param drop_every: seconds after which every connection is closed, 0 disables drops
+        :param close_code: close code of dropped connections
+        '''
+        self.port = port
+        self.symbols = ['SYM{}BTC'.format(i) for i in range(symbols)]
+        self.rate = rate
+        self.user_rate = user_rate
+        self.drop_every = drop_every
+        self.close_code = close_code
+
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.connections = set()
+        self.prices = {}
+
+        self.stats = {'connections': 0, 'frames': 0, 'requests': 0, 'drops': 0}
+
+    def url(self):
+        return 'ws://localhost:{}/'.format(self.port)
+
+    def start(self):
+        started = threading.Event()
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            self.server = self.loop.run_until_complete(websockets.serve(self.handler, 'localhost', self.port))
+            started.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run, name='Stand-in Server Thread', daemon=True)
+        self.thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        async def shutdown():
+            # closes connections with 1001 "going away"
+            self.server.close()
+            await self.server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(1)
+
+    def drop_all(self, code=None):
+        '''
+        Closes all connections with the close code, thread safe
+        '''
+        for ws in list(self.connections):
+            asyncio.run_coroutine_threadsafe(self.drop(ws, code), self.loop)
+
+    async def drop(self, ws, code=None):
+        self.stats['drops'] += 1
+        await ws.close(code or self.close_code, 'stand-in drop')
+
+    def price(self, symbol):
+        p = self.prices.get(symbol, random.uniform(0.0001, 50000))
+        p *= random.uniform(0.999, 1.001)
+        self.prices[symbol] = p
+        return p
+
+    def payload(self, stream):
+        symbol, stream_type = stream.split('@', 1)
+        symbol = symbol.upper()
+        p = self.price(symbol)
+        now = int(time.time() * 1000)
+
+        if stream_type == 'bookTicker':
+            return {'u': now, 's': symbol, 'b': '{:.8f}'.format(p * 0.9995), 'B': '1.00000000',
+                    'a': '{:.8f}'.format(p * 1.0005), 'A': '1.00000000'}
+
+        if stream_type == 'aggTrade':
+            return {'e': 'aggTrade', 'E': now, 's': symbol, 'a': now, 'p': '{:.8f}'.format(p), 'q': '1.00000000',
+                    'f': now, 'l': now, 'T': now, 'm': True, 'M': True}
+
+        return {'e': '24hrTicker', 'E': now, 's': symbol, 'p': '0.00000000', 'P': '0.000', 'w': '{:.8f}'.format(p),
+                'x': '{:.8f}'.format(p), 'c': '{:.8f}'.format(p), 'Q': '1.00000000',
+                'b': '{:.8f}'.format(p * 0.9995), 'B': '1.00000000', 'a': '{:.8f}'.format(p * 1.0005),
+                'A': '1.00000000', 'o': '{:.8f}'.format(p), 'h': '{:.8f}'.format(p), 'l': '{:.8f}'.format(p),
+                'v': '1000.00000000', 'q': '1.00000000', 'O': 0, 'C': now, 'F': 0, 'L': 1, 'n': 1}
+
+    def user_event(self):
+        now = int(time.time() * 1000)
+
+        if random.random() < 0.5:
+            return {'e': 'outboundAccountPosition', 'E': now, 'u': now,
+                    'B': [{'a': 'BTC', 'f': '{:.8f}'.format(random.uniform(0, 1)), 'l': '0.00000000'}]}
+
+        return {'e': 'executionReport', 'E': now, 's': random.choice(self.symbols), 'c': 'standin', 'S': 'SELL',
+                'o': 'LIMIT', 'q': '1.00000000', 'p': '1.00000000', 'P': '0.00000000', 'X': 'NEW',
+                'i': random.randint(1, 10 ** 9), 'z': '0.00000000'}
+
+    async def handler(self, ws, path):
+        self.connections.add(ws)
+        self.stats['connections'] += 1
+
+        url = urlparse(path)
+        tasks = []
+
+        try:
+            if self.drop_every:
+                tasks.append(asyncio.ensure_future(self.drop_later(ws)))
+
+            if url.path.startswith('/stream'):
+                streams = set(parse_qs(url.query).get('streams', [''])[0].split('/')) - {''}
+                tasks.append(asyncio.ensure_future(self.push_streams(ws, streams, True)))
+                await self.serve_requests(ws, streams)
+            elif url.path == '/ws/!ticker@arr':
+                tasks.append(asyncio.ensure_future(self.push_arr(ws)))
+                await self.serve_requests(ws, set())
+            elif url.path.startswith('/ws/') and '@' in url.path:
+                streams = {url.path[len('/ws/'):]}
+                tasks.append(asyncio.ensure_future(self.push_streams(ws, streams, False)))
+                await self.serve_requests(ws, streams)
+            else:
+                # anything else is a listen key
+                tasks.append(asyncio.ensure_future(self.push_user_data(ws)))
+                await self.serve_requests(ws, set())
+        except ConnectionClosed:
+            pass
+        finally:
+            for t in tasks:
+                t.cancel()
+
+            self.connections.discard(ws)
+
+    async def serve_requests(self, ws, streams):
+        async for message in ws:
+            request = json.loads(message)
+            self.stats['requests'] += 1
+
+            params = request.get('params', [])
+            if request.get('method') == 'SUBSCRIBE':
+                streams.update(params)
+                result = None
+            elif request.get('method') == 'UNSUBSCRIBE':
+                streams.difference_update(params)
+                result = None
+            elif request.get('method') == 'LIST_SUBSCRIPTIONS':
+                result = sorted(streams)
+            else:
+                await ws.send(json.dumps({'code': 2, 'msg': 'Invalid request', 'id': request.get('id')}))
+                continue
+
+            await ws.send(json.dumps({'result': result, 'id': request.get('id')}))
+
+    async def push_streams(self, ws, streams, combined):
+        while True:
+            started = time.monotonic()
+
+            for stream in list(streams):
+                data = self.payload(stream)
+                await ws.send(json.dumps({'stream': stream, 'data': data} if combined else data, separators=(',', ':')))
+                self.stats['frames'] += 1
+
+            await asyncio.sleep(max(1 / self.rate - (time.monotonic() - started), 0))
+
+    async def push_arr(self, ws):
+        while True:
+            await ws.send(json.dumps([self.payload('{}@ticker'.format(s.lower())) for s in self.symbols],
+                                     separators=(',', ':')))
+            self.stats['frames'] += 1
+            await asyncio.sleep(1)
+
+    async def push_user_data(self, ws):
+        if not self.user_rate:
+            return
+
+        while True:
+            await ws.send(json.dumps(self.user_event(), separators=(',', ':')))
+            self.stats['frames'] += 1
+            await asyncio.sleep(1 / self.user_rate)
+
+    async def drop_later(self, ws):
+        await asyncio.sleep(self.drop_every)
+        await self.drop(ws)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m Benchmarks.ws_standin_server')
+    parser.add_argument('--port', type=int, default=9443)
+    parser.add_argument('--symbols', type=int, default=100, help='symbols in !ticker@arr')
+    parser.add_argument('--rate', type=float, default=10, help='frames per second of each stream')
+    parser.add_argument('--user-rate', type=float, default=1, help='user data events per second')
+    parser.add_argument('--drop-every', type=float, default=0, help='seconds after which connections are closed')
+    parser.add_argument('--close-code', type=int, default=1011)
+    args = parser.parse_args()
+
+    server = StandInServer(args.port, args.symbols, args.rate, args.user_rate, args.drop_every, args.close_code).start()
+    print('Serving on {}'.format(server.url()))
+
+    try:
+        while True:
+            time.sleep(10)
+            print(server.stats)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
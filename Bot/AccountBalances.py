@@ -1,4 +1,6 @@
-from datetime import datetime
+from threading import Condition
+
+from Utils import Clock
 
 
 class Balance:
@@ -23,6 +25,16 @@ class Balance:
 
 
 class AccountBalances:
+    '''
+    Balances cache fed by user stream events. Every update increments "version", so a caller can tell whether
+    balances changed after its orders were placed or canceled. The account is requested over REST only when
+    the stream doesn't deliver the change in time or balances are older than MAX_AGE_S,
+    concurrent callers share one in-flight request.
+    '''
+    # a balance event usually follows an order change within milliseconds
+    EVENT_TIMEOUT_S = 0.5
+    MAX_AGE_S = 300
+
     __shared_state = {}
 
     def __init__(self):
@@ -30,13 +42,113 @@ class AccountBalances:
         if not self.__dict__:
             self.bal_dict = {}
             self.last_updated = None
+            self.last_update_time = None
+            self.version = 0
+            # version of the last update of each asset
+            self.asset_versions = {}
+            # exchange time (ms) of the last stream snapshot of each asset
+            self.asset_update_times = {}
+            self.cond = Condition()
+            self.refreshing = False
+            self.refresh_version = 0
+            self.refreshes = 0
+
+    def update_balances(self, new_balances, update_time=None):
+        '''
+        :param update_time: time of the last account update in ms, "u" of "outboundAccountPosition" event
+        '''
+        with self.cond:
+            if update_time is not None:
+                for asset in new_balances:
+                    self.asset_update_times[asset] = max(self.asset_update_times.get(asset, 0), update_time)
+
+            self._update(new_balances)
+
+    def apply_delta(self, asset, delta, clear_time=None):
+        '''
+        Applies "balanceUpdate" event: deposit, withdrawal or transfer of the asset
+        :param clear_time: time of the change in ms, "T" of the event
+        '''
+        with self.cond:
+            # "outboundAccountPosition" of the same change can arrive first, its balance already includes the delta
+            if clear_time is not None and self.asset_update_times.get(asset, 0) >= clear_time:
+                return
+
+            bal = self.bal_dict.get(asset, {'f': 0., 'l': 0.})
+            self._update({asset: {'f': bal['f'] + delta, 'l': bal['l']}})
+
+    def _update(self, new_balances, since_version=None):
+        self.version += 1
+
+        for asset, bal in new_balances.items():
+            # a REST snapshot doesn't override events received while it was requested
+            if since_version is not None and self.asset_versions.get(asset, 0) > since_version:
+                continue
+
+            if asset in self.bal_dict:
+                # Balance objects hold the dict of the asset
+                self.bal_dict[asset].update(bal)
+            else:
+                self.bal_dict[asset] = dict(bal)
 
-    def update_balances(self, new_balances):
-        self.bal_dict.update(new_balances)
-        self.last_updated = datetime.now()
+            self.asset_versions[asset] = self.version
+
+        self.last_updated = Clock.now()
+        self.last_update_time = Clock.monotonic()
+        self.cond.notify_all()
 
     def update_required(self, dt):
         return self.last_updated < dt
 
+    def is_stale(self):
+        return self.last_update_time is None or Clock.monotonic() - self.last_update_time >= AccountBalances.MAX_AGE_S
+
+    def refresh(self, fetch, version=None, force=False, asset=None):
+        '''
+        :param fetch: returns {asset: {'f': free, 'l': locked}}, e.g. FXConnector.get_all_balances_dict
+        :param version: balances version read before the caller changed orders, waits for a newer one from
+        the user stream. Without it balances are requested only if stale
+        :param force: always request balances
+        :param asset: asset changed by the caller, updates of other assets don't satisfy the wait
+        '''
+        with self.cond:
+            if not force:
+                if version is not None:
+                    if self.cond.wait_for(lambda: self.get_version(asset) > version, AccountBalances.EVENT_TIMEOUT_S):
+                        return
+                elif not self.is_stale():
+                    return
+
+            # the in-flight request is shared if it started after the caller's change
+            if self.refreshing and (version is None or self.refresh_version > version):
+                self.cond.wait_for(lambda: not self.refreshing)
+                return
+
+            self.cond.wait_for(lambda: not self.refreshing)
+            self.refreshing = True
+            self.refresh_version = since_version = self.version
+
+        try:
+            balances = fetch()
+        except Exception:
+            with self.cond:
+                self.refreshing = False
+                self.cond.notify_all()
+            raise
+
+        with self.cond:
+            self.refreshing = False
+            self.refreshes += 1
+            self._update(balances, since_version)
+
+    def get_version(self, asset=None):
+        return self.version if asset is None else self.asset_versions.get(asset, 0)
+
+    def get_metrics(self):
+        with self.cond:
+            return {'version': self.version,
+                    'rest_refreshes': self.refreshes,
+                    'age': Clock.monotonic() - self.last_update_time if self.last_update_time is not None else None}
+
     def get_balance(self, asset):
         return Balance(lambda: self.bal_dict[asset])
@@ -5,6 +5,7 @@ from Bot.CustomSerializable import CustomSerializable
 from Bot.TradeEnums import Side
 from Bot.Target import EntryTarget, Target, ExitTarget
 from Bot.Value import Value
+from Utils import Utils
 
 
 class EntryExitSettings(CustomSerializable):
@@ -16,6 +17,7 @@ class EntryExitSettings(CustomSerializable):
                  sl_threshold=None,
                  is_entry=True,
                  smart=False,
+                 oco=False,
                  **kvargs):
 
         if 'threshold' in kvargs:
@@ -26,6 +28,8 @@ class EntryExitSettings(CustomSerializable):
         self.side = Side(side.lower()) if side else None
         self.smart = smart
         self.is_entry = is_entry
+        # exit targets are placed together with the stop-loss as OCO orders
+        self.oco = bool(Utils.s2b(oco)) and not is_entry
 
         self.targets: [Target] = []
 
@@ -67,6 +71,9 @@ class EntryExitSettings(CustomSerializable):
         if self.smart is not None:
             d['smart'] = self.smart
 
+        if self.oco:
+            d['oco'] = self.oco
+
         # if self.sl_threshold and (self.sl_threshold != EntryExitSettings.DEFAULT_THRESHOLD):
         #     d['threshold'] = self.sl_threshold
 
@@ -86,7 +93,8 @@ class EntryExitSettings(CustomSerializable):
 
     def describe(self):
         description = 'Entry:' if self.is_entry else 'Exit:'
-        description += '\nSide:{}, Smart:{},Threshold:{}\n'.format(self.side, self.smart, self.sl_threshold)
+        description += '\nSide:{}, Smart:{},Threshold:{}{}\n'.format(self.side, self.smart, self.sl_threshold,
+                                                                    ', OCO' if self.oco else '')
         if self.targets:
             for t in self.targets:
                 description += t.__str__() + '\n'
@@ -0,0 +1,237 @@
+import heapq
+import time
+import traceback
+import zlib
+from collections import deque
+from threading import Thread, Condition
+
+from Utils.Logger import Logger
+
+
+class DispatchWorker(Thread, Logger):
+    '''
+    Executes events of its symbols off the websocket thread. Queued events (e.g. execution reports) have priority
+    over ticks and are never dropped, a backlog over "max_events" is only reported. Only the latest tick of each
+    symbol and price source is kept and it is passed to the tick handler once the symbol's batching window expires,
+    even if no new ticks arrive.
+    '''
+    def __init__(self, id, tick_handler, get_window, max_events, clock):
+        Thread.__init__(self)
+        Logger.__init__(self)
+
+        self.tick_handler = tick_handler
+        self.get_window = get_window
+        self.max_events = max_events
+        self.clock = clock
+
+        self.pending = {}
+        self.deadlines = []
+        self.events = deque()
+        self.cond = Condition()
+        self.stopped = False
+
+        self.metrics = {
+            'ticks_received': 0,
+            'ticks_replaced': 0,
+            'ticks_dispatched': 0,
+            'events_received': 0,
+            'events_processed': 0,
+            'events_over_limit': 0,
+            'max_events_queued': 0
+        }
+
+        self.name = 'Dispatch Worker Thread {}'.format(id)
+        self.daemon = True
+
+    def push(self, symbol, source, price, replace=True):
+        '''
+        :param replace: False keeps the pending price of the source, e.g. a REST snapshot must not replace a socket tick
+        '''
+        with self.cond:
+            self.metrics['ticks_received'] += 1
+
+            if symbol in self.pending:
+                if source in self.pending[symbol]:
+                    if not replace:
+                        return
+
+                    self.metrics['ticks_replaced'] += 1
+
+                self.pending[symbol][source] = price
+                return
+
+            self.pending[symbol] = {source: price}
+            heapq.heappush(self.deadlines, (self.clock() + self.get_window(symbol) / 1000, symbol))
+            self.cond.notify()
+
+    def submit(self, fn, *args):
+        with self.cond:
+            self.metrics['events_received'] += 1
+
+            # execution reports can't be replayed, so the queue grows instead of dropping them
+            if len(self.events) >= self.max_events:
+                self.metrics['events_over_limit'] += 1
+
+                if len(self.events) == self.max_events:
+                    self.logWarning('Event queue is over {} events, strategies are behind'.format(self.max_events))
+
+            self.events.append((fn, args))
+            self.metrics['max_events_queued'] = max(self.metrics['max_events_queued'], len(self.events))
+            self.cond.notify()
+            return True
+
+    def discard(self, symbol):
+        with self.cond:
+            if self.pending.pop(symbol, None) is None:
+                return
+
+            # a stale deadline would flush the next tick of the symbol before its window expires
+            self.deadlines = [d for d in self.deadlines if d[1] != symbol]
+            heapq.heapify(self.deadlines)
+
+    def next_timeout(self):
+        if not self.deadlines:
+            return None
+
+        return max(self.deadlines[0][0] - self.clock(), 0)
+
+    def process_events(self):
+        while True:
+            with self.cond:
+                if not self.events:
+                    return
+
+                fn, args = self.events.popleft()
+
+            try:
+                fn(*args)
+            except Exception:
+                self.logError(traceback.format_exc())
+            finally:
+                with self.cond:
+                    self.metrics['events_processed'] += 1
+
+    def flush_due(self, now=None):
+        if now is None:
+            now = self.clock()
+
+        due = []
+        with self.cond:
+            while self.deadlines and self.deadlines[0][0] <= now:
+                _, symbol = heapq.heappop(self.deadlines)
+                prices = self.pending.pop(symbol, None)
+
+                if prices:
+                    due.append((symbol, prices))
+
+            self.metrics['ticks_dispatched'] += len(due)
+
+        for symbol, prices in due:
+            # events which arrived in the meantime go first
+            self.process_events()
+
+            try:
+                self.tick_handler(symbol, prices)
+            except Exception:
+                self.logError(traceback.format_exc())
+
+        return len(due)
+
+    def run(self):
+        while True:
+            with self.cond:
+                if self.stopped:
+                    return
+
+                if not self.events:
+                    timeout = self.next_timeout()
+
+                    if timeout is None or timeout > 0:
+                        self.cond.wait(timeout)
+
+                if self.stopped:
+                    return
+
+            self.process_events()
+            self.flush_due()
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
+
+    def get_metrics(self):
+        with self.cond:
+            metrics = dict(self.metrics)
+            metrics['ticks_pending'] = len(self.pending)
+            metrics['events_queued'] = len(self.events)
+
+        return metrics
+
+
+class EventDispatcher(Logger):
+    '''
+    Routes ticks and events to the workers by symbol, so events of a symbol are always executed in order.
+    '''
+    DEFAULT_WINDOW_MS = 100
+    DEFAULT_MAX_EVENTS = 10000
+
+    def __init__(self, tick_handler, window_ms=DEFAULT_WINDOW_MS, symbol_windows=None, workers=1,
+                 max_events=DEFAULT_MAX_EVENTS, clock=time.monotonic):
+        '''
+        :param tick_handler: tick_handler(symbol, prices) where prices is {PriceSource: {'b': bid, 'a': ask}}
+        :param window_ms: default batching window
+        :param symbol_windows: {symbol: window_ms}
+        :param workers: number of worker threads
+        :param max_events: queued events per worker above which the backlog is reported
+        :param clock: monotonic time source in seconds
+        '''
+        super().__init__()
+        self.window_ms = window_ms
+        self.symbol_windows = dict(symbol_windows) if symbol_windows else {}
+
+        self.workers = [DispatchWorker(i, tick_handler, self.get_window, max_events, clock)
+                        for i in range(max(1, workers))]
+
+    def set_window(self, symbol, window_ms):
+        self.symbol_windows[symbol] = window_ms
+
+    def get_window(self, symbol):
+        return self.symbol_windows.get(symbol, self.window_ms)
+
+    def worker(self, symbol) -> DispatchWorker:
+        if len(self.workers) == 1 or not symbol:
+            return self.workers[0]
+
+        return self.workers[zlib.crc32(symbol.encode()) % len(self.workers)]
+
+    def push(self, symbol, source, price, replace=True):
+        self.worker(symbol).push(symbol, source, price, replace)
+
+    def submit(self, symbol, fn, *args):
+        return self.worker(symbol).submit(fn, *args)
+
+    def discard(self, symbol):
+        self.worker(symbol).discard(symbol)
+
+    def flush_due(self, now=None):
+        dispatched = 0
+        for w in self.workers:
+            w.process_events()
+            dispatched += w.flush_due(now)
+        return dispatched
+
+    def is_alive(self):
+        return all(w.is_alive() for w in self.workers)
+
+    def start(self):
+        for w in self.workers:
+            if not w.is_alive():
+                w.start()
+
+    def stop(self):
+        for w in self.workers:
+            w.stop()
+
+    def get_metrics(self):
+        return [w.get_metrics() for w in self.workers]
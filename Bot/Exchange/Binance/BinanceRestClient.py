@@ -0,0 +1,58 @@
+from binance.client import Client
+from binance.exceptions import BinanceAPIException
+
+import Utils.Utils
+from Bot.Exchange.RequestGovernor import RequestGovernor
+from Bot.Exchange.RestTransport import RestTransport
+
+
+class BinanceRestClient(Client):
+    '''
+    Binance client whose session uses the pooled keep-alive transport, so it can be shared by concurrent requests.
+    Every request waits for the governor's budget first. A signed request rejected for its timestamp (-1021)
+    is repeated once after the server time offset is synced.
+    '''
+    TIMESTAMP_ERROR_CODE = -1021
+
+    def __init__(self, api_key=None, api_secret=None, testnet=False, transport: RestTransport = None,
+                 governor: RequestGovernor = None, resync_time=None, recv_window=None):
+        '''
+        :param resync_time: syncs timestamp_offset, e.g. ClockSync.resync
+        :param recv_window: ms a signed request is valid for after its timestamp, the exchange default if None
+        '''
+        self.transport = transport or RestTransport()
+        self.governor = governor or RequestGovernor()
+        self.resync_time = resync_time
+        self.recv_window = recv_window
+        super().__init__(api_key, api_secret, testnet=testnet)
+
+    def _init_session(self):
+        # called by the base constructor before the first request
+        url = Utils.Utils.get_rest_url()
+        if url:
+            self.API_URL = self.API_TESTNET_URL = url.rstrip('/')
+
+        session = self.transport.mount(super()._init_session())
+        session.hooks['response'].append(self.governor.on_response)
+        return session
+
+    def _request(self, method, uri, signed, force_params=False, **kwargs):
+        if signed and self.recv_window:
+            kwargs['data'] = dict(kwargs.get('data') or {})
+            kwargs['data'].setdefault('recvWindow', self.recv_window)
+
+        # the base client adds timestamp and signature to the data
+        data = dict(kwargs['data']) if isinstance(kwargs.get('data'), dict) else kwargs.get('data')
+
+        self.governor.acquire(method, uri, kwargs.get('data') or kwargs.get('params'))
+        try:
+            return super()._request(method, uri, signed, force_params, **kwargs)
+        except BinanceAPIException as bae:
+            if not signed or bae.code != BinanceRestClient.TIMESTAMP_ERROR_CODE or not self.resync_time:
+                raise
+
+        self.resync_time()
+
+        kwargs['data'] = data
+        self.governor.acquire(method, uri, kwargs.get('data') or kwargs.get('params'))
+        return super()._request(method, uri, signed, force_params, **kwargs)
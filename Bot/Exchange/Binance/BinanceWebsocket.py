@@ -1,10 +1,8 @@
 import functools
 import json
-import threading
 import traceback
-from threading import Thread
 import time
-from time import sleep
+from typing import List
 
 from binance.client import Client
 
@@ -17,85 +15,127 @@ import os
 import os.path
 
 from requests import ConnectionError
-from retrying import retry
 from websockets.connection import State
 
 import Utils.Utils
+from Bot.Exchange.Binance.FrameDecoder import FrameDecoder
+from Bot.Exchange.Binance.TickerShard import TickerShard
+from Bot.Exchange.FrameCapture import FrameCapture
+from Bot.Exchange.NetworkRuntime import NetworkRuntime
+from Bot.TradeEnums import PriceSource
 from Utils.Logger import Logger
 
 
-class BinanceWebsocket(Thread, Logger):
-    REFRESH_KEY_TIMEOUT = 30 * 60
+class BinanceWebsocket(Logger):
+    '''
+    Ticker and user data sockets hosted by the network runtime. Streams are started and stopped on the runtime's loop.
+    '''
+    # listen keys expire after 60 minutes without a keepalive
+    KEEPALIVE_INTERVAL = 30 * 60
+    # seconds the replaced user socket is kept open after the new one is connected
+    USER_WS_OVERLAP = 5
     WS_URL = 'wss://stream.binance.com:9443/'
     WS_TEST_URL = 'wss://testnet.binance.vision/'
-    __EVENT_LOOP = None
-
-    def __init__(self, client: Client):
-        Thread.__init__(self)
-        Logger.__init__(self)
-
+    STREAM_TYPES = {
+        PriceSource.TICKER: 'ticker',
+        PriceSource.BOOK_TICKER: 'bookTicker',
+        PriceSource.AGG_TRADE: 'aggTrade'
+    }
+    MAX_RECONNECT_DELAY = 30
+    HEALTH_CHECK_INTERVAL = 5
+    SHARD_SILENCE_TIMEOUT = 30
+    PING_TIMEOUT = 10
+
+    def __init__(self, client: Client, runtime: NetworkRuntime):
+        super().__init__()
 
         self.client = client
-        self.stop = False
+        self.runtime = runtime
+        self.loop = runtime.loop
+
+        # sockets are connected only after start()
+        self.stop = True
 
-        self.ticker_websocket: WebSocketClientProtocol = None
         self.user_webscoket: WebSocketClientProtocol = None
 
-        self.ticker_ws_future = None
         self.user_ws_future = None
+        self.replaced_user_ws_future = None
         self.mngmt_future = None
+        self.health_future = None
 
         self.connection_key = None
         self.user_info_cb = None
 
+        # frames received while user sockets overlap, so events delivered by both are handled once
+        self.user_overlap_until = 0
+        self.user_overlap_frames = set()
+
         self.ticker_cb = None
+        self.ticker_connected_cb = None
         self.symbols = None
 
-        if not BinanceWebsocket.__EVENT_LOOP:
-            self.loop = asyncio.get_event_loop()
-            BinanceWebsocket.__EVENT_LOOP = self.loop
-        else:
-            self.loop = BinanceWebsocket.__EVENT_LOOP
+        # streams requested by the client, spread across ticker connections
+        self.streams = set()
+        self.shards: List[TickerShard] = []
+        self.shard_id = 0
+        self.request_id = 0
+
+        self.decoder = FrameDecoder()
+        self.capture: FrameCapture = FrameCapture.create_from_env()
 
         self.time = None
 
-        self.name = 'Binance WebSocket Thread'
+    def get_url(self):
+        url = Utils.Utils.get_ws_url()
 
+        if url:
+            return url
 
-    def get_url(self):
         return BinanceWebsocket.WS_TEST_URL if Utils.Utils.is_simulation() else BinanceWebsocket.WS_URL
 
 
-    @retry(
-        stop_max_attempt_number=3,
-        wait_fixed=1000
-        # retry_on_exception=BinanceWebsocket.check_exception
-    )
-    def run(self):
-        try:
-            asyncio.set_event_loop(self.loop)
+    def is_running(self):
+        return not self.stop
+
+    def start(self):
+        '''
+        Connects configured ticker and user data streams
+        '''
+        self.stop = False
+        self.runtime.call_soon(self.start_streams)
+
+    def start_streams(self):
+        if self.stop:
+            return
+
+        if not self.mngmt_future or self.mngmt_future.done():
             self.start_management_loop()
 
-            # if not asyncio.get_event_loop().is_running():
-            asyncio.get_event_loop().run_forever()
-        finally:
-            # self.loop.close()
-            pass
+        if not self.health_future or self.health_future.done():
+            self.health_future = self.loop.create_task(self.shards_health_loop())
+
+        self.loop.create_task(self.rebalance_shards())
+
+        if self.user_info_cb:
+            self.start_user_info()
 
     def start_management_loop(self):
-        self.mngmt_future = asyncio.ensure_future(self.management_loop())
+        if self.stop:
+            return
+
+        self.mngmt_future = self.loop.create_task(self.management_loop())
         self.mngmt_future.add_done_callback(
             functools.partial(self.feature_finished, reconnect_fn=self.start_management_loop, name='management loop'))
 
-    @asyncio.coroutine
     async def management_loop(self):
         while True:
             try:
                 if self.stop:
                     return
 
-                if self.time and (time.time() - self.time) > BinanceWebsocket.REFRESH_KEY_TIMEOUT:
-                    self.start_user_info()
+                if self.time and (time.time() - self.time) > BinanceWebsocket.KEEPALIVE_INTERVAL:
+                    self.time = time.time()
+                    self.loop.create_task(self.keepalive_listen_key())
 
                 if self.user_webscoket:
                     if self.user_webscoket.state == State.OPEN:
@@ -103,53 +143,315 @@ class BinanceWebsocket(Thread, Logger):
                     elif self.user_webscoket.state == State.CLOSED:
                         self.start_user_info(force_reconnect=True)
 
-                if self.ticker_websocket and self.ticker_websocket.state == State.CLOSED:
-                    self.start_ticker()
+                for shard in self.shards:
+                    if not shard.is_running():
+                        self.start_shard(shard)
 
                 await asyncio.sleep(60)
             except asyncio.CancelledError:
-                pass
+                return
             except:
                 self.logError(traceback.format_exc())
 
-    def start_ticker(self, symbols=None, callback=None):
+    @classmethod
+    def stream_name(cls, symbol, source=PriceSource.TICKER):
+        return '{}@{}'.format(symbol.lower(), cls.STREAM_TYPES[source])
+
+    @classmethod
+    def stream_names(cls, symbols):
+        '''
+        :param symbols: symbols or (symbol, PriceSource) pairs
+        :return: set of stream names
+        '''
+        return {cls.stream_name(s) if isinstance(s, str) else cls.stream_name(*s) for s in symbols}
+
+    def get_ticker_url(self, streams):
+        if streams:
+            return os.path.join(self.get_url(), 'stream?streams=' + '/'.join(sorted(streams)))
+
+        return os.path.join(self.get_url(), 'ws/!ticker@arr')
+
+    def start_ticker(self, symbols=None, callback=None, connected_callback=None):
+        '''
+        :param connected_callback: called with symbols whose streams were (re)connected or subscribed,
+        their prices could be missed while the stream was down
+        '''
         if symbols:
             self.symbols = symbols
-        else:
-            symbols = self.symbols
+            self.streams = self.stream_names(symbols)
 
         if callback:
             self.ticker_cb = callback
 
-        if symbols:
-            url = os.path.join(self.get_url(),
-                               'stream?streams=' + '/'.join([s.lower() + '@ticker' for s in symbols]))
-        else:
-            url = os.path.join(self.get_url(), 'ws/!ticker@arr')
+        if connected_callback:
+            self.ticker_connected_cb = connected_callback
 
-        self.ticker_ws_future = asyncio.run_coroutine_threadsafe(self.websocket_handler(url, self.ticker_cb, True), self.loop)
+        if not self.stop:
+            self.runtime.submit(self.rebalance_shards())
 
-        self.ticker_ws_future.add_done_callback(
-            functools.partial(self.feature_finished, reconnect_fn=self.start_ticker, name='ticker websocket'))
+    def stop_ticker(self):
+        self.runtime.call(self.stop_ticker_future)
 
-    def start_user_info(self, callback=None, force_reconnect=False):
-        self.time = time.time()
+    def update_symbols(self, symbols):
+        """
+        Changes the set of ticker streams in place with SUBSCRIBE/UNSUBSCRIBE requests,
+        so ticker sockets stay connected for all other symbols.
+        """
+        self.symbols = symbols
+        self.streams = self.stream_names(symbols)
+
+        if not self.stop:
+            self.runtime.submit(self.rebalance_shards())
+
+    async def rebalance_shards(self):
+        """
+        Spreads streams across shards of at most WS_MAX_STREAMS streams each, merges underfilled shards
+        and brings shards' subscriptions in line with their streams. Runs only on the event loop thread.
+        """
+        try:
+            if self.stop:
+                return
+
+            streams = set(self.streams)
+            max_streams = Utils.Utils.get_ws_max_streams()
+
+            for shard in self.shards:
+                shard.streams &= streams
+
+            # if nobody listens, single shard is connected to "!ticker@arr"
+            if not self.shards:
+                self.create_shard()
+
+            # merge shards if streams fit into fewer connections
+            required_shards = max(1, -(-len(streams) // max_streams))
+            retired = []
+
+            while len(self.shards) > required_shards:
+                shard = min(self.shards, key=lambda sh: len(sh.streams))
+                self.shards.remove(shard)
+                retired.append(shard)
+
+                for stream in shard.streams:
+                    min(self.shards, key=lambda sh: len(sh.streams)).streams.add(stream)
+
+            assigned = set()
+            for shard in self.shards:
+                assigned |= shard.streams
+
+            for stream in sorted(streams - assigned):
+                shard = min(self.shards, key=lambda sh: len(sh.streams)) if self.shards else None
+
+                if not shard or len(shard.streams) >= max_streams:
+                    shard = self.create_shard()
+
+                shard.streams.add(stream)
+
+            for shard in self.shards:
+                if not shard.is_running():
+                    self.start_shard(shard)
+                elif shard.streams and not shard.combined:
+                    # "!ticker@arr" socket can't be switched to the combined streams without reconnection
+                    self.restart_shard(shard)
+                else:
+                    await self.sync_shard(shard)
+
+            # retired shards are closed only when their streams are subscribed by other shards
+            for shard in retired:
+                self.stop_shard(shard)
+        except:
+            self.logError(traceback.format_exc())
+
+    def create_shard(self):
+        self.shard_id += 1
+        shard = TickerShard(self.shard_id)
+        self.shards.append(shard)
+        return shard
+
+    def start_shard(self, shard: TickerShard):
+        if shard.stopped or self.stop:
+            return
+
+        shard.future = self.runtime.submit(self.shard_handler(shard))
+        shard.future.add_done_callback(functools.partial(self.shard_finished, shard))
+
+    def restart_shard(self, shard: TickerShard):
+        self.logInfo('Restarting {}'.format(shard))
+
+        if shard.future:
+            shard.future.cancel()
+
+        self.start_shard(shard)
+
+    def stop_shard(self, shard: TickerShard):
+        self.logInfo('Stopping {}'.format(shard))
+        shard.stopped = True
+
+        if shard.future:
+            shard.future.cancel()
+
+    def shard_finished(self, shard: TickerShard, future):
+        try:
+            if future.cancelled() or shard.stopped or self.stop or shard.future is not future:
+                return
+
+            exc = future.exception()
+            if exc:
+                self.logError('{} failed: {}'.format(shard, exc))
+            else:
+                ws = future.result()
+                if ws:
+                    self.logInfo('{} closed: {} - {}'.format(shard, ws.close_code, ws.close_reason))
+
+            shard.failures += 1
+            shard.reconnects += 1
+            delay = min(2 ** (shard.failures - 1), BinanceWebsocket.MAX_RECONNECT_DELAY)
+
+            self.logInfo('Reconnecting {} in {}s...'.format(shard, delay))
+            self.loop.call_later(delay, self.start_shard, shard)
+        except:
+            self.logError(traceback.format_exc())
+
+    async def shard_handler(self, shard: TickerShard):
+        streams = set(shard.streams)
+        url = self.get_ticker_url(streams)
+
+        async with websockets.connect(url, timeout=1) as websocket:
+            shard.on_connected(websocket, streams)
+            self.logInfo('{} Connected to "{}"'.format(shard, url))
+            self.streams_connected(streams)
+
+            # streams could be changed while connecting
+            await self.sync_shard(shard)
+
+            async for message in websocket:
+                if self.stop or shard.stopped:
+                    return websocket
+
+                shard.on_message()
+
+                if self.capture:
+                    self.capture.write(FrameCapture.TICKER, message)
+
+                msg = self.decoder.decode_ticker(message, shard.streams)
+
+                if msg is None:
+                    continue
+
+                if isinstance(msg, dict) and 'id' in msg:
+                    self.on_stream_request_result(msg)
+                    continue
+
+                if self.ticker_cb:
+                    self.ticker_cb(msg)
+
+        return websocket
+
+    async def sync_shard(self, shard: TickerShard):
+        if not shard.is_open() or not shard.combined:
+            return
+
+        streams = set(shard.streams)
+        unsubscribe = shard.active_streams - streams
+        subscribe = streams - shard.active_streams
+
+        # set before the requests are awaited, so a sync of the shard started meanwhile doesn't send them again.
+        # If a request fails, the socket is reconnected with the shard's streams
+        shard.active_streams = streams
+
+        if subscribe:
+            await self.send_stream_request(shard.websocket, 'SUBSCRIBE', subscribe)
+            self.streams_connected(subscribe)
 
+        if unsubscribe:
+            await self.send_stream_request(shard.websocket, 'UNSUBSCRIBE', unsubscribe)
+
+    def streams_connected(self, streams):
+        if not self.ticker_connected_cb or not streams:
+            return
+
+        try:
+            self.ticker_connected_cb(sorted({s.split('@')[0].upper() for s in streams}))
+        except:
+            self.logError(traceback.format_exc())
+
+    async def send_stream_request(self, ws: WebSocketClientProtocol, method, streams):
+        self.request_id += 1
+        self.logInfo('{} [{}]: {}'.format(method, self.request_id, ', '.join(sorted(streams))))
+        await ws.send(json.dumps({'method': method, 'params': sorted(streams), 'id': self.request_id}))
+
+    def on_stream_request_result(self, msg):
+        if msg.get('error'):
+            self.logError('Stream request [{}] failed: {}'.format(msg.get('id'), msg['error']))
+
+    async def shards_health_loop(self):
+        while not self.stop:
+            try:
+                await asyncio.sleep(BinanceWebsocket.HEALTH_CHECK_INTERVAL)
+
+                for shard in self.shards[:]:
+                    await self.check_shard_health(shard)
+            except asyncio.CancelledError:
+                return
+            except:
+                self.logError(traceback.format_exc())
+
+    async def check_shard_health(self, shard: TickerShard):
+        # quiet markets may not push anything for a while, so silent shards are pinged first
+        if not shard.is_open() or shard.silence() < BinanceWebsocket.SHARD_SILENCE_TIMEOUT:
+            return
+
+        try:
+            pong = await shard.websocket.ping()
+            await asyncio.wait_for(pong, BinanceWebsocket.PING_TIMEOUT)
+            shard.last_msg_time = time.time()
+        except (asyncio.TimeoutError, ConnectionClosed):
+            self.logError('{} is not responding. Reconnecting...'.format(shard))
+            self.restart_shard(shard)
+
+    def get_shards_health(self):
+        return [shard.health() for shard in self.shards]
+
+    def get_capture_metrics(self):
+        return self.capture.get_metrics() if self.capture else None
+
+    def start_user_info(self, callback=None, force_reconnect=False):
         if callback:
             self.user_info_cb = callback
 
-        get_key = asyncio.run_coroutine_threadsafe(self.refresh_listen_key(force_reconnect), self.loop)
+        if self.stop:
+            return
+
+        self.time = time.time()
+
+        get_key = self.runtime.submit(self.refresh_listen_key(force_reconnect))
         get_key.add_done_callback(self.listen_key_received)
 
-    @asyncio.coroutine
+    def stop_user_info(self):
+        self.runtime.call(self.stop_user_future)
+
     async def refresh_listen_key(self, force_reconnect: bool):
-        return (self.client.stream_get_listen_key(), force_reconnect)
+        # REST calls are blocking, so they are made by the loop's executor
+        key = await self.loop.run_in_executor(None, self.client.stream_get_listen_key)
+        return (key, force_reconnect)
+
+    async def keepalive_listen_key(self):
+        key = self.connection_key
+        if not key or self.stop:
+            return
+
+        try:
+            await self.loop.run_in_executor(None, functools.partial(self.client.stream_keepalive, key))
+            self.logInfo('Listen key kept alive')
+        except Exception as e:
+            # the key has expired, a new one replaces the user socket once it is received
+            self.logError('Listen key keepalive failed: {}'.format(e))
+            self.start_user_info()
 
     def listen_key_received(self, future: asyncio.Future):
         try:
             self.logInfo('Feature finished: "listen_key_received"')
 
-            if future.cancelled():
+            if future.cancelled() or self.stop:
                 return
 
             exc = future.exception()
@@ -158,30 +460,61 @@ class BinanceWebsocket(Thread, Logger):
 
                 if isinstance(exc, ConnectionError):
                     self.logInfo('Trying to reconnect...')
-                    sleep(1)
-                    self.start_user_info(force_reconnect=True)
+                    self.loop.call_later(1, functools.partial(self.start_user_info, force_reconnect=True))
 
                 return
 
             key, force_reconnect = future.result()
-            create_user_ws = force_reconnect
 
-            if key != self.connection_key or not self.user_ws_future or \
-                    self.user_ws_future.cancelled() or self.user_ws_future.done():
-                create_user_ws = True
-
-            if create_user_ws:
-                self.stop_user_future()
-                self.user_ws_future = asyncio.ensure_future(
-                    self.websocket_handler(os.path.join(self.get_url(), 'ws', key), self.user_info_cb))
-
-                self.user_ws_future.add_done_callback(
-                    functools.partial(self.feature_finished, reconnect_fn=functools.partial(self.start_user_info, force_reconnect=True), name='user websocket'))
+            if key != self.connection_key or force_reconnect or not self.is_user_socket_alive():
+                self.open_user_socket(key)
 
             self.connection_key = key
         except:
             self.logError(traceback.format_exc())
 
+    def is_user_socket_alive(self):
+        return self.user_ws_future and not self.user_ws_future.done() and \
+               (not self.user_webscoket or self.user_webscoket.state != State.CLOSED)
+
+    def open_user_socket(self, key):
+        '''
+        Connects the user data stream of the key. An open socket of the previous key is closed
+        only after the new one is connected, so no event is missed in between.
+        '''
+        replaced = self.user_ws_future if self.is_user_socket_alive() else None
+
+        if replaced:
+            if self.replaced_user_ws_future:
+                self.replaced_user_ws_future.cancel()
+
+            self.replaced_user_ws_future = replaced
+        else:
+            self.stop_user_future()
+
+        self.user_ws_future = self.loop.create_task(
+            self.websocket_handler(os.path.join(self.get_url(), 'ws', key), self.user_info_cb, replaced))
+
+        self.user_ws_future.add_done_callback(
+            functools.partial(self.feature_finished, reconnect_fn=functools.partial(self.reconnect_user_info, self.user_ws_future), name='user websocket'))
+
+    def reconnect_user_info(self, future):
+        # replaced sockets are not reconnected
+        if future is self.user_ws_future:
+            self.start_user_info(force_reconnect=True)
+
+    def is_duplicate_user_frame(self, message):
+        if self.loop.time() > self.user_overlap_until:
+            self.user_overlap_until = 0
+            self.user_overlap_frames.clear()
+            return False
+
+        if message in self.user_overlap_frames:
+            return True
+
+        self.user_overlap_frames.add(message)
+        return False
+
 
     def feature_finished(self, future: asyncio.Future, reconnect_fn=None, name=''):
         try:
@@ -193,13 +526,12 @@ class BinanceWebsocket(Thread, Logger):
             exc = future.exception()
             if exc:
                 if (isinstance(exc, ConnectionClosed) and exc.code > 1002) \
-                        or isinstance(exc, InvalidStatusCode, TypeError):
+                        or isinstance(exc, (InvalidStatusCode, TypeError)):
                     self.logError(exc)
 
                     if reconnect_fn and not self.stop:
                         self.logInfo('Trying to reconnect...')
-                        sleep(1)
-                        reconnect_fn()
+                        self.loop.call_later(1, reconnect_fn)
                     else:
                         self.logInfo('No reconnection function...')
                     return
@@ -215,51 +547,71 @@ class BinanceWebsocket(Thread, Logger):
 
 
     def stop_user_future(self):
+        if self.replaced_user_ws_future:
+            self.replaced_user_ws_future.cancel()
+            self.replaced_user_ws_future = None
+
         if self.user_ws_future:
             self.logInfo('Canceling User WebSocket')
             self.user_ws_future.cancel()
             self.user_ws_future = None
+            self.user_webscoket = None
 
     def stop_ticker_future(self):
-        if self.ticker_ws_future:
-            self.logInfo('Canceling Ticker WebSocket')
-            self.ticker_ws_future.cancel()
-            self.ticker_ws_future = None
+        if self.shards:
+            self.logInfo('Canceling Ticker WebSockets')
+
+        shards = self.shards
+        self.shards = []
 
-    @asyncio.coroutine
-    async def websocket_handler(self, url, callback, is_ticker = False):
+        for shard in shards:
+            self.stop_shard(shard)
+
+    async def websocket_handler(self, url, callback, replaced: asyncio.Future = None):
         if self.stop:
             return None
 
         async with websockets.connect(url, timeout=1) as websocket:
-            if is_ticker:
-                self.ticker_websocket = websocket
-            else:
-                self.user_webscoket = websocket
+            self.user_webscoket = websocket
 
             self.logInfo('Websocket Connected to "{}"'.format(url))
 
+            if replaced and not replaced.done():
+                self.user_overlap_until = self.loop.time() + BinanceWebsocket.USER_WS_OVERLAP
+                self.loop.call_later(BinanceWebsocket.USER_WS_OVERLAP, replaced.cancel)
+
             async for message in websocket:
                 if self.stop:
                     return websocket
 
+                if self.user_overlap_until and self.is_duplicate_user_frame(message):
+                    continue
+
+                if self.capture:
+                    self.capture.write(FrameCapture.USER, message)
+
                 if callback:
-                    callback(json.loads(message))
+                    callback(self.decoder.decode(message))
 
         return websocket
 
     def stop_sockets(self):
+        '''
+        Closes all sockets, the runtime keeps running
+        '''
         self.stop = True
+        self.runtime.call(self.stop_streams)
+
+        self.logInfo('Stopped')
 
+    def stop_streams(self):
         self.stop_ticker_future()
         self.stop_user_future()
 
         if self.mngmt_future:
             self.mngmt_future.cancel()
+            self.mngmt_future = None
 
-        self.loop.call_soon_threadsafe(self.loop.stop)
-
-        if threading.current_thread().ident != self.ident:
-            self.join(timeout=1)
-
-        self.logInfo('Stopped')
+        if self.health_future:
+            self.health_future.cancel()
+            self.health_future = None
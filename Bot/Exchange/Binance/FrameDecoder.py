@@ -0,0 +1,99 @@
+import json
+import os
+
+from Utils.Logger import Logger
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+JSON_BACKENDS = {'json': json.loads}
+
+if ujson:
+    JSON_BACKENDS['ujson'] = ujson.loads
+
+if orjson:
+    JSON_BACKENDS['orjson'] = orjson.loads
+
+
+def get_json_backend_name(name=None):
+    '''
+    :param name: preferred backend, otherwise JSON_BACKEND environment variable or the fastest installed one
+    '''
+    name = name if name else os.environ.get('JSON_BACKEND')
+
+    if name and name in JSON_BACKENDS:
+        return name
+
+    for backend in ['orjson', 'ujson', 'json']:
+        if backend in JSON_BACKENDS:
+            return backend
+
+
+class FrameDecoder(Logger):
+    COMBINED_STREAM_PREFIX = '{"stream":"'
+
+    ARR_SYMBOL_KEY = '"s":"{}"'
+
+    def __init__(self, backend=None):
+        super().__init__()
+        self.backend = get_json_backend_name(backend)
+        self.loads = JSON_BACKENDS[self.backend]
+
+        self.logInfo('Using "{}" JSON backend'.format(self.backend))
+
+    def decode(self, frame):
+        return self.loads(frame)
+
+    def decode_ticker(self, frame, streams):
+        '''
+        Decodes ticker socket frame skipping payloads of streams nobody listens to.
+        :param frame: raw text frame
+        :param streams: set of subscribed stream names, e.g. "btcusdt@ticker"
+        :return: decoded and projected message or None if frame has to be dropped
+        '''
+        if frame.startswith(FrameDecoder.COMBINED_STREAM_PREFIX):
+            start = len(FrameDecoder.COMBINED_STREAM_PREFIX)
+            stream = frame[start:frame.index('"', start)]
+
+            # frame for the stream which was just unsubscribed
+            if stream not in streams:
+                return None
+
+            msg = self.loads(frame)
+            msg['data'] = self.project(msg['data'])
+            return msg
+
+        if frame.startswith('['):
+            return self.decode_ticker_arr(frame, streams)
+
+        # stream request results and errors
+        return self.loads(frame)
+
+    def decode_ticker_arr(self, frame, streams):
+        tickers = []
+
+        # tickers are flat objects, so only objects of the listened symbols are cut out and decoded
+        for symbol in {s.split('@')[0].upper() for s in streams}:
+            idx = frame.find(FrameDecoder.ARR_SYMBOL_KEY.format(symbol))
+
+            if idx < 0:
+                continue
+
+            tickers.append(self.project(self.loads(frame[frame.rfind('{', 0, idx):frame.find('}', idx) + 1])))
+
+        return tickers
+
+    def project(self, d):
+        # 24h ticker has more than 20 fields, only bid and ask are used. bookTicker and aggTrade payloads are small
+        if d.get('e') == '24hrTicker':
+            return {'e': d['e'], 'E': d['E'], 's': d['s'], 'b': d['b'], 'a': d['a']}
+
+        return d
@@ -0,0 +1,62 @@
+import time
+
+from websockets import WebSocketClientProtocol
+from websockets.connection import State
+
+
+class TickerShard:
+    '''
+    One ticker websocket connection with its part of the subscribed streams and its health state.
+    '''
+    def __init__(self, id):
+        self.id = id
+
+        # streams assigned to the shard and streams its socket is subscribed to
+        self.streams = set()
+        self.active_streams = set()
+
+        self.websocket: WebSocketClientProtocol = None
+        self.future = None
+        self.combined = False
+        self.stopped = False
+
+        self.connected_at = None
+        self.last_msg_time = None
+        self.msg_count = 0
+        self.reconnects = 0
+        self.failures = 0
+
+    def on_connected(self, websocket, streams):
+        self.websocket = websocket
+        self.combined = len(streams) > 0
+        self.active_streams = streams
+        self.connected_at = time.time()
+        self.last_msg_time = self.connected_at
+        self.failures = 0
+
+    def on_message(self):
+        self.last_msg_time = time.time()
+        self.msg_count += 1
+
+    def is_open(self):
+        return self.websocket is not None and self.websocket.state == State.OPEN
+
+    def is_running(self):
+        return self.future is not None and not self.future.done()
+
+    def silence(self):
+        return time.time() - self.last_msg_time if self.last_msg_time else 0
+
+    def health(self):
+        return {
+            'id': self.id,
+            'open': self.is_open(),
+            'streams': len(self.streams),
+            'silence': round(self.silence(), 3),
+            'messages': self.msg_count,
+            'reconnects': self.reconnects,
+            'connected_at': self.connected_at
+        }
+
+    def __str__(self):
+        return 'Shard {} ({} streams)'.format(self.id, len(self.streams))
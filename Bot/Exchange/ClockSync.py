@@ -0,0 +1,137 @@
+import time
+import traceback
+from statistics import median
+from threading import Thread, Event, Lock
+
+from Utils.Logger import Logger
+
+
+class ClockSync(Thread, Logger):
+    '''
+    Tracks the offset of the exchange server time, signed requests are rejected (-1021) once local time drifts
+    out of their recvWindow. Every "interval" seconds server time is requested "samples" times, the median offset
+    of the round-trips is applied gradually, so timestamps don't jump, unless it differs by more than STEP_MS.
+    '''
+    # share of the measured change applied by a sync
+    SMOOTHING = 0.3
+    STEP_MS = 500
+    # a resync requested by a rejected request is skipped if the offset is newer
+    MIN_RESYNC_S = 1
+
+    def __init__(self, get_server_time, set_offset, interval=60, samples=5):
+        '''
+        :param get_server_time: returns {'serverTime': ms}, e.g. FXConnector.get_server_time
+        :param set_offset: applies the offset in ms to the timestamps of signed requests
+        '''
+        Thread.__init__(self)
+        Logger.__init__(self)
+
+        self.get_server_time = get_server_time
+        self.set_offset = set_offset
+        self.interval = interval
+        self.samples = max(1, samples)
+
+        self.lock = Lock()
+        self.offset = None
+        self.measured_offset = None
+        self.last_sync = None
+        self.last_resync = None
+        self.metrics = {'rtt_ms': None, 'min_rtt_ms': None, 'drift_ms_per_hour': 0., 'syncs': 0, 'resyncs': 0,
+                        'failures': 0}
+
+        self.stop_event = Event()
+
+        self.name = 'Clock Sync Thread'
+        self.daemon = True
+
+    def sample(self):
+        '''
+        :return: (offset, round-trip time) in ms
+        '''
+        sent = time.time()
+        server_time = self.get_server_time()['serverTime']
+        received = time.time()
+
+        # server time is assumed to be read in the middle of the round-trip
+        return server_time - (sent + received) * 500, (received - sent) * 1000
+
+    def sync(self, step=False):
+        '''
+        :param step: applies the measured offset at once
+        '''
+        # round-trips are measured without the lock, so resync checks and metrics don't wait for them
+        samples = []
+        error = None
+        failures = 0
+        for _ in range(self.samples):
+            try:
+                samples.append(self.sample())
+            except Exception as e:
+                failures += 1
+                error = e
+
+        with self.lock:
+            self.metrics['failures'] += failures
+
+            if not samples:
+                raise error
+
+            measured = median(s[0] for s in samples)
+            now = time.monotonic()
+
+            # offsets measured close together, e.g. by a resync, are too noisy for the drift
+            if self.measured_offset is not None and now - self.last_sync >= self.interval / 2:
+                drift = (measured - self.measured_offset) / (now - self.last_sync) * 3600
+                self.metrics['drift_ms_per_hour'] += ClockSync.SMOOTHING * (drift - self.metrics['drift_ms_per_hour'])
+
+            if step or self.offset is None or abs(measured - self.offset) > ClockSync.STEP_MS:
+                if self.offset is not None and abs(measured - self.offset) > ClockSync.STEP_MS:
+                    self.logWarning('Server time offset jumped from {:.0f}ms to {:.0f}ms'.format(self.offset, measured))
+                self.offset = measured
+            else:
+                self.offset += ClockSync.SMOOTHING * (measured - self.offset)
+
+            self.measured_offset = measured
+            self.last_sync = now
+            self.metrics['rtt_ms'] = round(median(s[1] for s in samples), 3)
+            self.metrics['min_rtt_ms'] = round(min(s[1] for s in samples), 3)
+            self.metrics['syncs'] += 1
+
+            self.set_offset(int(round(self.offset)))
+
+    def resync(self):
+        '''
+        Syncs at once unless the offset was just updated, e.g. by another rejected request
+        '''
+        with self.lock:
+            now = time.monotonic()
+
+            # a resync in progress hasn't updated last_sync yet
+            if any(t is not None and now - t < ClockSync.MIN_RESYNC_S for t in (self.last_sync, self.last_resync)):
+                return
+
+            self.last_resync = now
+            self.metrics['resyncs'] += 1
+
+        self.logWarning('Request timestamp is rejected, syncing server time')
+        self.sync(step=True)
+
+    def get_offset(self):
+        return int(round(self.offset)) if self.offset is not None else 0
+
+    def get_metrics(self):
+        with self.lock:
+            return dict(self.metrics,
+                        offset_ms=self.get_offset(),
+                        measured_offset_ms=round(self.measured_offset, 3) if self.measured_offset is not None else None,
+                        age_s=round(time.monotonic() - self.last_sync, 3) if self.last_sync is not None else None)
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.sync()
+            except Exception:
+                self.logError(traceback.format_exc())
@@ -0,0 +1,149 @@
+import atexit
+import gzip
+import os
+import queue
+import time
+import traceback
+from threading import Thread
+
+from Utils import Utils
+from Utils.Logger import Logger
+
+
+class FrameCapture(Thread, Logger):
+    '''
+    Writes received socket frames to rotated gzip journals on a background thread.
+    Line format: "<local receive time> <channel> <raw frame>". Frames are dropped if the buffer is full,
+    so capture never blocks the socket.
+    '''
+    TICKER = 'ticker'
+    USER = 'user'
+
+    FILE_PREFIX = 'frames-'
+    FILE_SUFFIX = '.gz'
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, max_seconds=3600, buffer_size=100000):
+        '''
+        :param path: directory for journal files
+        :param max_bytes: uncompressed size after which the journal is rotated
+        :param max_seconds: journal age after which it is rotated
+        :param buffer_size: max frames waiting to be written
+        '''
+        Thread.__init__(self)
+        Logger.__init__(self)
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.queue = queue.Queue(buffer_size)
+
+        self.file = None
+        self.file_name = None
+        self.file_bytes = 0
+        self.file_opened_at = 0
+
+        self.written = 0
+        self.dropped = 0
+        self.stopped = False
+
+        self.name = 'Frame Capture Thread'
+        self.daemon = True
+
+    @classmethod
+    def create_from_env(cls):
+        path = Utils.get_capture_dir()
+
+        if not path:
+            return None
+
+        capture = cls(path, Utils.get_capture_max_mb() * 1024 * 1024, Utils.get_capture_rotate_seconds())
+        capture.start()
+        atexit.register(capture.close)
+        return capture
+
+    def write(self, channel, frame):
+        try:
+            self.queue.put_nowait((time.time(), channel, frame))
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        os.makedirs(self.path, exist_ok=True)
+        self.logInfo('Capturing frames to "{}"'.format(self.path))
+
+        while not self.stopped or not self.queue.empty():
+            try:
+                item = self.queue.get(timeout=1)
+            except queue.Empty:
+                if self.file:
+                    self.file.flush()
+                continue
+
+            try:
+                self.write_line(*item)
+
+                # drain whatever is buffered without waking up per frame
+                while True:
+                    try:
+                        self.write_line(*self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+            except Exception:
+                self.logError(traceback.format_exc())
+
+        self.close_file()
+
+    def write_line(self, recv_time, channel, frame):
+        if not self.file or self.file_bytes >= self.max_bytes or \
+                time.time() - self.file_opened_at >= self.max_seconds:
+            self.rotate()
+
+        line = '{:.6f} {} {}\n'.format(recv_time, channel, frame).encode()
+        self.file.write(line)
+        self.file_bytes += len(line)
+        self.written += 1
+
+    def rotate(self):
+        self.close_file()
+
+        self.file_name = os.path.join(
+            self.path, '{}{}{}'.format(FrameCapture.FILE_PREFIX, time.strftime('%Y%m%d-%H%M%S'), FrameCapture.FILE_SUFFIX))
+
+        # files of the same second are appended as separate gzip members
+        self.file = gzip.open(self.file_name, 'ab', compresslevel=6)
+        self.file_bytes = 0
+        self.file_opened_at = time.time()
+
+        self.logInfo('Capture journal: {}'.format(self.file_name))
+
+    def close_file(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def close(self, timeout=5):
+        if self.stopped:
+            return
+
+        self.stopped = True
+
+        if self.is_alive():
+            self.join(timeout)
+
+    def get_metrics(self):
+        return {
+            'file': self.file_name,
+            'written': self.written,
+            'dropped': self.dropped,
+            'buffered': self.queue.qsize()
+        }
+
+    @staticmethod
+    def read(file_name):
+        '''
+        :return: generator of (receive time, channel, raw frame) of a journal file
+        '''
+        with gzip.open(file_name, 'rt') as f:
+            for line in f:
+                recv_time, channel, frame = line.rstrip('\n').split(' ', 2)
+                yield float(recv_time), channel, frame
@@ -0,0 +1,91 @@
+import asyncio
+import concurrent.futures
+import threading
+from threading import Thread
+
+from Utils.Logger import Logger
+
+
+class NetworkRuntime(Thread, Logger):
+    '''
+    Event loop thread which hosts all socket coroutines for the process lifetime.
+    Sockets are started and stopped on the running loop, the loop itself is never restarted.
+    '''
+    def __init__(self):
+        Thread.__init__(self)
+        Logger.__init__(self)
+
+        self.loop = asyncio.new_event_loop()
+
+        # blocking listen key requests share one thread, so restarted sockets don't grow the default pool
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='Network Executor')
+        self.loop.set_default_executor(self.executor)
+
+        self.name = 'Network Runtime Thread'
+        self.daemon = True
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+
+        try:
+            self.loop.run_forever()
+        finally:
+            for task in asyncio.all_tasks(self.loop):
+                task.cancel()
+
+            self.loop.close()
+            self.logInfo('Stopped')
+
+    def ensure_running(self):
+        if self.is_alive():
+            return
+
+        # a thread can only be started once, a stopped runtime is replaced by a new one
+        if self.is_stopped():
+            self.logError('Stopped runtime can not be restarted')
+            return
+
+        self.start()
+        self.logInfo('Started')
+
+    def is_stopped(self):
+        return self.ident is not None and not self.is_alive()
+
+    def in_runtime_thread(self):
+        return threading.current_thread() is self
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call_soon(self, fn, *args):
+        if self.in_runtime_thread():
+            return self.loop.call_soon(fn, *args)
+
+        return self.loop.call_soon_threadsafe(fn, *args)
+
+    def call(self, fn, *args, timeout=None):
+        '''
+        Executes fn on the loop and waits for the result
+        '''
+        if self.in_runtime_thread() or not self.is_alive():
+            return fn(*args)
+
+        future = concurrent.futures.Future()
+
+        def execute():
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+
+        self.loop.call_soon_threadsafe(execute)
+        return future.result(timeout)
+
+    def shutdown(self, timeout=1):
+        if not self.is_alive():
+            return
+
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+        if not self.in_runtime_thread():
+            self.join(timeout)
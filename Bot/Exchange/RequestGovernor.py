@@ -0,0 +1,236 @@
+import heapq
+import itertools
+import re
+import threading
+import time
+from contextlib import contextmanager
+from enum import IntEnum
+
+from requests import Response
+
+from Utils.Logger import Logger
+
+
+class RequestPriority(IntEnum):
+    # stop-loss placement and cancels
+    STOP_LOSS = 0
+    # entries and exits
+    ORDER = 1
+    # balances, exchange info and other refreshes
+    INFO = 2
+
+
+class RateLimit:
+    INTERVALS = {'SECOND': ('s', 1), 'MINUTE': ('m', 60), 'HOUR': ('h', 3600), 'DAY': ('d', 86400)}
+
+    def __init__(self, type, interval, interval_num, limit):
+        letter, seconds = RateLimit.INTERVALS[interval]
+
+        self.type = type
+        self.seconds = seconds * interval_num
+        self.limit = limit
+        # e.g. "x-mbx-used-weight-1m", "x-mbx-order-count-10s"
+        self.header = '{}-{}{}'.format('x-mbx-used-weight' if type == 'REQUEST_WEIGHT' else 'x-mbx-order-count',
+                                       interval_num, letter)
+        self.window = 0
+        self.used = 0
+
+    def roll(self, now):
+        # exchange counters are reset at interval boundaries
+        window = int(now // self.seconds)
+        if window != self.window:
+            self.window = window
+            self.used = 0
+
+    def delay(self, now, amount, share):
+        if not amount or self.used + amount <= self.limit * share:
+            return 0
+
+        return (self.window + 1) * self.seconds - now
+
+    def to_dict(self):
+        return {'type': self.type, 'seconds': self.seconds, 'limit': self.limit, 'used': self.used}
+
+
+class RequestGovernor(Logger):
+    '''
+    Keeps REST requests within the exchange's request weight and order count limits.
+    Requests wait for budget in priority order: low priority requests get only a share of each limit,
+    so under load balance and info refreshes are delayed first and stop-loss orders last.
+    Used weight and order counts are corrected by response headers, 429/418 responses stop all requests
+    for their "Retry-After" period.
+    '''
+    DEFAULT_RATE_LIMITS = [
+        {'rateLimitType': 'REQUEST_WEIGHT', 'interval': 'MINUTE', 'intervalNum': 1, 'limit': 1200},
+        {'rateLimitType': 'ORDERS', 'interval': 'SECOND', 'intervalNum': 10, 'limit': 50},
+        {'rateLimitType': 'ORDERS', 'interval': 'DAY', 'intervalNum': 1, 'limit': 160000}]
+
+    # share of each limit available to a priority
+    SHARES = {RequestPriority.STOP_LOSS: 1.0, RequestPriority.ORDER: 0.9, RequestPriority.INFO: 0.7}
+
+    # (method, path): weight, requests with a symbol parameter have the second weight
+    WEIGHTS = {
+        ('get', 'order'): 4,
+        ('get', 'orderList'): 4,
+        ('get', 'openOrders'): (80, 6),
+        ('get', 'allOrders'): 20,
+        ('get', 'account'): 20,
+        ('get', 'exchangeInfo'): 20,
+        ('get', 'ticker/bookTicker'): (4, 2),
+        ('get', 'ticker/price'): (4, 2),
+        ('delete', 'openOrders'): 1,
+        ('post', 'userDataStream'): 2,
+        ('put', 'userDataStream'): 2,
+    }
+    # orders counted by the order rate limits, an OCO counts as two
+    ORDER_REQUESTS = {('post', 'order'): 1, ('post', 'order/oco'): 2}
+
+    DEFAULT_RETRY_AFTER = 60
+
+    PATH_RE = re.compile(r'/v\d+/(.+)$')
+
+    def __init__(self, rate_limits=None, clock=time.time):
+        super().__init__()
+        self.clock = clock
+        self.cond = threading.Condition()
+        self.local = threading.local()
+
+        self.limits = []
+        self.set_rate_limits(rate_limits or RequestGovernor.DEFAULT_RATE_LIMITS)
+
+        self.waiting = []
+        self.tickets = itertools.count()
+        self.retry_until = 0
+
+        self.metrics = {p.name: {'requests': 0, 'delayed': 0, 'wait_time': 0.} for p in RequestPriority}
+        self.rejected = 0
+
+    def set_rate_limits(self, rate_limits):
+        '''
+        :param rate_limits: "rateLimits" of the exchange info
+        '''
+        limits = [RateLimit(l['rateLimitType'], l['interval'], l['intervalNum'], l['limit'])
+                  for l in rate_limits if l['rateLimitType'] in ('REQUEST_WEIGHT', 'ORDERS')]
+
+        with self.cond:
+            used = {l.header: (l.window, l.used) for l in self.limits}
+            for l in limits:
+                l.window, l.used = used.get(l.header, (0, 0))
+
+            self.limits = limits
+            self.cond.notify_all()
+
+    @contextmanager
+    def priority(self, priority: RequestPriority):
+        '''
+        Sets the priority of requests made by the current thread
+        '''
+        previous = getattr(self.local, 'priority', None)
+        self.local.priority = priority if previous is None else min(previous, priority)
+        try:
+            yield
+        finally:
+            self.local.priority = previous
+
+    def current_priority(self):
+        priority = getattr(self.local, 'priority', None)
+        return RequestPriority.INFO if priority is None else priority
+
+    @classmethod
+    def request_cost(cls, method, url, params=None):
+        '''
+        :return: (weight, orders) of the request
+        '''
+        m = cls.PATH_RE.search(url.split('?', 1)[0])
+        key = (method.lower(), m.group(1) if m else url)
+
+        weight = cls.WEIGHTS.get(key, 1)
+        if isinstance(weight, tuple):
+            weight = weight[1] if params and 'symbol' in params else weight[0]
+
+        return weight, cls.ORDER_REQUESTS.get(key, 0)
+
+    def acquire(self, method, url, params=None):
+        '''
+        Blocks until the request fits the limits for the current thread's priority
+        '''
+        weight, orders = self.request_cost(method, url, params)
+        priority = self.current_priority()
+        ticket = (priority, next(self.tickets))
+        started = self.clock()
+        delayed = False
+
+        with self.cond:
+            heapq.heappush(self.waiting, ticket)
+
+            try:
+                while True:
+                    delay = None
+                    if self.waiting[0] == ticket:
+                        delay = self.get_delay(self.clock(), priority, weight, orders)
+                        if delay <= 0:
+                            break
+
+                    if delay and not delayed:
+                        delayed = True
+                        self.logWarning('{} request {} {} is delayed {:.1f}s'.format(
+                            priority.name, method.upper(), url, delay))
+
+                    self.cond.wait(delay)
+            finally:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+                self.cond.notify_all()
+
+            for l in self.limits:
+                l.used += weight if l.type == 'REQUEST_WEIGHT' else orders
+
+            metrics = self.metrics[priority.name]
+            metrics['requests'] += 1
+            if delayed:
+                metrics['delayed'] += 1
+                metrics['wait_time'] += self.clock() - started
+
+    def get_delay(self, now, priority, weight, orders):
+        if now < self.retry_until:
+            return self.retry_until - now
+
+        share = RequestGovernor.SHARES[priority]
+        delay = 0
+
+        for l in self.limits:
+            l.roll(now)
+            delay = max(delay, l.delay(now, weight if l.type == 'REQUEST_WEIGHT' else orders, share))
+
+        return delay
+
+    def on_response(self, response: Response, *args, **kwargs):
+        '''
+        requests' response hook
+        '''
+        with self.cond:
+            now = self.clock()
+
+            for l in self.limits:
+                used = response.headers.get(l.header)
+                if used is not None:
+                    l.roll(now)
+                    l.used = int(used)
+
+            if response.status_code in (418, 429):
+                # 429 is a warning, repeated requests after it end with a 418 IP ban
+                retry_after = int(response.headers.get('Retry-After', RequestGovernor.DEFAULT_RETRY_AFTER))
+                self.retry_until = max(self.retry_until, now + retry_after)
+                self.rejected += 1
+                self.logError('Request rejected with {}, all requests are stopped for {}s'.format(
+                    response.status_code, retry_after))
+
+            self.cond.notify_all()
+
+    def get_metrics(self):
+        with self.cond:
+            return {'limits': [l.to_dict() for l in self.limits],
+                    'queued': len(self.waiting),
+                    'retry_after': max(self.retry_until - self.clock(), 0),
+                    'rejected': self.rejected,
+                    'priorities': {k: dict(v) for k, v in self.metrics.items()}}
@@ -0,0 +1,69 @@
+import concurrent.futures
+from collections import defaultdict
+import threading
+from threading import Lock, RLock
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+from Utils.Logger import Logger
+
+
+class RestTransport(Logger):
+    '''
+    Keep-alive connection pool shared by REST sessions and a thread pool for concurrent requests.
+    Requests of one symbol are serialized with per symbol locks, different symbols go in parallel.
+    '''
+    def __init__(self, pool_size=10):
+        super().__init__()
+        self.pool_size = pool_size
+
+        # pool_block makes extra threads wait for a warm connection instead of opening throwaway ones
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.local = threading.local()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='REST',
+                                                              initializer=self.init_pool_thread)
+
+        self.locks_lock = Lock()
+        self.symbol_locks = defaultdict(RLock)
+
+    def init_pool_thread(self):
+        self.local.pool_thread = True
+
+    def in_pool_thread(self):
+        return getattr(self.local, 'pool_thread', False)
+
+    def mount(self, session: Session):
+        session.mount('https://', self.adapter)
+        session.mount('http://', self.adapter)
+        return session
+
+    def symbol_lock(self, symbol) -> RLock:
+        with self.locks_lock:
+            return self.symbol_locks[symbol]
+
+    def submit(self, fn, *args, **kwargs) -> concurrent.futures.Future:
+        return self.executor.submit(fn, *args, **kwargs)
+
+    def map(self, fn, *iterables):
+        '''
+        Calls fn concurrently for every set of arguments
+        :return: list of results or raised exceptions in the order of the arguments
+        '''
+        # pool threads waiting for other pool threads could exhaust the pool, so they call fn themselves
+        if self.in_pool_thread():
+            return [self.call(fn, *args) for args in zip(*iterables)]
+
+        futures = [self.submit(fn, *args) for args in zip(*iterables)]
+        return [f.exception() or f.result() for f in futures]
+
+    @staticmethod
+    def call(fn, *args):
+        try:
+            return fn(*args)
+        except Exception as e:
+            return e
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+        self.adapter.close()
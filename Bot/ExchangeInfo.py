@@ -1,23 +1,51 @@
-from datetime import datetime
+import json
+import os
 from decimal import Decimal, ROUND_DOWN, ROUND_UP
+from threading import Lock
+
+from Utils import Clock
+from Utils.Logger import Logger
 
 
 class SymbolInfo:
+    '''
+    Trading rules of the symbol compiled from its exchange info filters.
+    Instances are shared by all strategies of the symbol, so they are immutable. A missing filter raises KeyError.
+    '''
     def __init__(self, symbol, filters):
-        self.symbol = symbol
+        '''
+        :param filters: {filter type: filter} of the symbol
+        '''
+        values = {
+            'symbol': symbol,
+            'filters': filters,
+
+            'minNotional': self.to_decimal(filters['MIN_NOTIONAL']['minNotional']),
+            'stepSize': self.to_decimal(filters['LOT_SIZE']['stepSize']),
+            'maxQty': self.to_decimal(filters['LOT_SIZE']['maxQty']),
+            'minQty': self.to_decimal(filters['LOT_SIZE']['minQty']),
+
+            'tickSize': self.to_decimal(filters['PRICE_FILTER']['tickSize']),
+            'maxPrice': self.to_decimal(filters['PRICE_FILTER']['maxPrice']),
+            'minPrice': self.to_decimal(filters['PRICE_FILTER']['minPrice']),
 
-        self.minNotional = Decimal(self.strip_zeros(filters['MIN_NOTIONAL']['minNotional']))
-        self.stepSize = Decimal(self.strip_zeros(filters['LOT_SIZE']['stepSize']))
-        self.maxQty = Decimal(self.strip_zeros(filters['LOT_SIZE']['maxQty']))
-        self.minQty = Decimal(self.strip_zeros(filters['LOT_SIZE']['minQty']))
+            'multipUp': self.to_decimal(filters['PERCENT_PRICE']['multiplierUp']),
+            'multipDown': self.to_decimal(filters['PERCENT_PRICE']['multiplierDown']),
+        }
 
-        self.tickSize = Decimal(self.strip_zeros(filters['PRICE_FILTER']['tickSize']))
-        self.maxPrice = Decimal(self.strip_zeros(filters['PRICE_FILTER']['maxPrice']))
-        self.minPrice = Decimal(self.strip_zeros(filters['PRICE_FILTER']['minPrice']))
+        for k, v in values.items():
+            object.__setattr__(self, k, v)
 
-        self.multipUp = Decimal(self.strip_zeros(filters['PERCENT_PRICE']['multiplierUp']))
-        self.multipDown = Decimal(self.strip_zeros(filters['PERCENT_PRICE']['multiplierDown']))
+    def __setattr__(self, key, value):
+        raise AttributeError('SymbolInfo of {} is immutable'.format(self.symbol))
 
+    @classmethod
+    def to_decimal(cls, s):
+        return Decimal(cls.strip_zeros(str(s)))
+
+    @classmethod
+    def strip_zeros(cls, s):
+        return s.rstrip('0') if '.' in s else s
 
     # def __init__(self, minPrice, maxPrice, tickSize, minQty, maxQty, stepSize, minNotional, **kvargs):
     #     self.minNotional = Decimal(self.strip_zeros(minNotional))
@@ -28,9 +56,6 @@ class SymbolInfo:
     #     self.maxPrice = Decimal(self.strip_zeros(maxPrice))
     #     self.minPrice = Decimal(self.strip_zeros(minPrice))
 
-    def strip_zeros(self, s):
-        return s.rstrip('0')
-
     def adjust_quanity(self, q, round_down=True):
         if q == 0:
             return 0
@@ -66,42 +91,132 @@ class SymbolInfo:
             .format(current_price * float(self.multipDown), current_price * float(self.multipUp))
 
 
-class ExchangeInfo:
+class ExchangeInfo(Logger):
+    '''
+    Exchange info shared by all strategies. SymbolInfo is compiled on update only for symbols with changed filters,
+    so lookups return the shared instance. Updates may carry only some symbols, others are kept.
+    '''
     __shared_state = {}
-    UPDATE_RATE_S = 30
 
     def __init__(self):
         self.__dict__ = self.__shared_state
         if not self.__dict__:
+            super().__init__()
             self.symbols = {}
+            self.symbol_infos = {}
             self.last_updated = None
+            # serializes updates, lookups don't take it
+            self.lock = Lock()
+
+    def update(self, info, partial=False):
+        '''
+        :param info: exchange info as returned by the exchange API
+        :param partial: info of some symbols only, e.g. requested with "symbols" parameter
+        '''
+        with self.lock:
+            if partial:
+                # only received symbols are replaced, each lookup sees either the previous or the new info
+                for s in info['symbols']:
+                    symbol_info = self.compile_symbol(s)
+
+                    if symbol_info:
+                        self.symbol_infos[s['symbol']] = symbol_info
+                    else:
+                        self.symbol_infos.pop(s['symbol'], None)
+
+                    self.symbols[s['symbol']] = s
+            else:
+                symbols = {s['symbol']: s for s in info['symbols']}
+                symbol_infos = {}
+
+                for symbol, s in symbols.items():
+                    symbol_info = self.compile_symbol(s)
+
+                    if symbol_info:
+                        symbol_infos[symbol] = symbol_info
+
+                # swapped at once, so lookups see either the previous or the new info
+                self.symbol_infos = symbol_infos
+                self.symbols = symbols
+
+            self.last_updated = Clock.now()
+
+    def compile_symbol(self, s):
+        '''
+        :return: SymbolInfo of the symbol, the current instance if its filters are unchanged, None if they are invalid
+        '''
+        symbol = s['symbol']
+        filters = {f['filterType']: f for f in s.get('filters', [])}
+        current = self.symbol_infos.get(symbol)
+
+        if current and current.filters == filters:
+            return current
+
+        try:
+            symbol_info = SymbolInfo(symbol, filters)
+        except KeyError as e:
+            # the symbol can't be traded without its filters, symbol_info() raises KeyError for it
+            self.logWarning('Filter {} of {} is missing'.format(e, symbol))
+            return None
+        except ArithmeticError as e:
+            self.logError('Invalid filters of {}: {}'.format(symbol, e))
+            return None
+
+        if current:
+            self.logInfo('Filters of {} changed: {}'.format(symbol, ExchangeInfo.diff_filters(current.filters, filters)))
+
+        return symbol_info
+
+    def save(self, path):
+        '''
+        Writes symbols to a temporary file which replaces the snapshot, so a crash never leaves it half written
+        '''
+        tmp_path = path + '.tmp'
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        with open(tmp_path, 'w') as f:
+            # copied at once, partial updates may add symbols meanwhile
+            json.dump({'symbols': list(self.symbols.values())}, f, separators=(',', ':'))
+
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        '''
+        :return: True if the snapshot was loaded
+        '''
+        if not os.path.exists(path):
+            return False
+
+        with open(path) as f:
+            self.update(json.load(f))
+
+        return True
+
+    @classmethod
+    def diff_filters(cls, old, new):
+        changes = []
+        for filter_type in sorted(set(old) | set(new)):
+            old_filter, new_filter = old.get(filter_type, {}), new.get(filter_type, {})
+
+            for k in sorted(set(old_filter) | set(new_filter)):
+                if old_filter.get(k) != new_filter.get(k):
+                    changes.append('{}.{}: {} -> {}'.format(filter_type, k, old_filter.get(k), new_filter.get(k)))
+
+        return ', '.join(changes)
+
+    def symbol_info(self, symbol) -> SymbolInfo:
+        symbol_info = self.symbol_infos.get(symbol)
 
-    def need_update(self):
-        if not self.last_updated:
-            return True
-
-        return (datetime.now() - self.last_updated).seconds >= ExchangeInfo.UPDATE_RATE_S
-
-    def update(self, info):
-        self.symbols = {s['symbol']: s for s in info['symbols']}
-        self.last_updated = datetime.now()
-
-    def symbol_info(self, symbol):
-        symbol_info = self.symbols.get(symbol)
-
-        props = {}
         if symbol_info is None:
             raise KeyError('Symbol "{}" not found in the Exchnage makrets info'.format(symbol))
 
-        for f in symbol_info['filters']:
-            filter_type = f['filterType']
-            f.pop(filter_type, None)
-            props[filter_type] = f
-
-        return SymbolInfo(symbol, props)
+        return symbol_info
 
     def has_symbol(self, symbol):
         return symbol in self.symbols
 
+    def missing_symbols(self, symbols):
+        return [s for s in symbols if s not in self.symbol_infos]
+
     def get_all_symbols(self):
-        return [{'s': s, 'b': info['baseAsset']} for (s, info) in self.symbols.items()]
+        return [{'s': s, 'b': info['baseAsset']} for (s, info) in list(self.symbols.items())]
@@ -0,0 +1,119 @@
+import traceback
+from threading import Thread, Event
+
+from Bot.ExchangeInfo import ExchangeInfo
+from Utils import Clock
+from Utils.Logger import Logger
+
+
+class ExchangeInfoRefresher(Thread, Logger):
+    '''
+    Refreshes ExchangeInfo in the background. Only traded symbols are requested on every refresh,
+    all symbols are requested once in a "full_interval". Each update is saved to the snapshot file,
+    so after a restart filters are served from it while the fresh info loads.
+    '''
+    def __init__(self, fetch, get_symbols, interval, full_interval, snapshot_path=None):
+        '''
+        :param fetch: returns exchange info of the list of symbols or all symbols, e.g. FXConnector.get_exchange_info
+        :param get_symbols: returns traded symbols
+        :param snapshot_path: file of the last exchange info, None disables the snapshot
+        '''
+        Thread.__init__(self)
+        Logger.__init__(self)
+
+        self.fetch = fetch
+        self.get_symbols = get_symbols
+        self.interval = interval
+        self.full_interval = full_interval
+        self.snapshot_path = snapshot_path
+
+        self.last_refresh = None
+        self.last_full_refresh = None
+        self.stop_event = Event()
+        self.stopped = False
+
+        self.name = 'Exchange Info Refresher Thread'
+        self.daemon = True
+
+    def load_snapshot(self):
+        '''
+        :return: True if the snapshot was loaded
+        '''
+        if not self.snapshot_path:
+            return False
+
+        try:
+            if ExchangeInfo().load(self.snapshot_path):
+                self.logInfo('Exchange info is loaded from {}'.format(self.snapshot_path))
+                return True
+        except Exception:
+            self.logError('Exchange info snapshot {} is not loaded: {}'.format(self.snapshot_path,
+                                                                             traceback.format_exc()))
+        return False
+
+    def ensure_symbols(self, symbols):
+        '''
+        Requests info of the symbols missing in ExchangeInfo on the calling thread
+        '''
+        missing = ExchangeInfo().missing_symbols(symbols)
+        if missing:
+            self.refresh(missing)
+
+    def refresh(self, symbols=None):
+        '''
+        :param symbols: symbols to request, all symbols if empty
+        '''
+        if symbols:
+            try:
+                ExchangeInfo().update(self.fetch(symbols), partial=True)
+            except Exception:
+                # the whole request fails if any of the symbols is unknown to the exchange
+                self.logError('Exchange info of {} is not received, requesting all symbols: {}'.format(
+                    ', '.join(symbols), traceback.format_exc()))
+                symbols = None
+
+        if not symbols:
+            ExchangeInfo().update(self.fetch(None))
+            self.last_full_refresh = self.last_refresh = Clock.monotonic()
+
+        self.save_snapshot()
+
+    def save_snapshot(self):
+        if not self.snapshot_path:
+            return
+
+        try:
+            ExchangeInfo().save(self.snapshot_path)
+        except Exception:
+            self.logError('Exchange info snapshot {} is not saved: {}'.format(self.snapshot_path,
+                                                                            traceback.format_exc()))
+
+    def need_full_refresh(self):
+        return self.last_full_refresh is None or Clock.monotonic() - self.last_full_refresh >= self.full_interval
+
+    def stop(self):
+        self.stopped = True
+        self.stop_event.set()
+
+    def run(self):
+        while not self.stopped:
+            # all symbols requested before the start are fresh for one interval, a snapshot is refreshed at once
+            if self.last_refresh is not None:
+                delay = self.interval - (Clock.monotonic() - self.last_refresh)
+                if delay > 0:
+                    self.stop_event.wait(delay)
+                    continue
+
+            try:
+                if self.need_full_refresh():
+                    self.refresh()
+                else:
+                    symbols = list(self.get_symbols())
+
+                    # refresh() requests all symbols if the list is empty
+                    if symbols:
+                        self.refresh(symbols)
+            except Exception:
+                self.logError(traceback.format_exc())
+
+            self.last_refresh = Clock.monotonic()
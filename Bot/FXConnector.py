@@ -1,24 +1,69 @@
-import time
+import functools
+import itertools
+import json
+import re
 
-from binance.exceptions import BinanceAPIException, BinanceOrderException
+from binance.exceptions import BinanceAPIException, BinanceOrderException, BinanceRequestException
+from requests import RequestException
 from retrying import retry
 
-from binance.client import Client
+from Bot.Exchange.Binance.BinanceRestClient import BinanceRestClient
 from Bot.Exchange.Binance.BinanceWebsocket import BinanceWebsocket
+from Bot.Exchange.ClockSync import ClockSync
+from Bot.Exchange.NetworkRuntime import NetworkRuntime
+from Bot.Exchange.RequestGovernor import RequestGovernor, RequestPriority
+from Bot.Exchange.RestTransport import RestTransport
+from Utils import Utils
 from Utils.Logger import Logger
 
 MAX_ATTEMPTS = 3
-DELAY = 1000
 
 def retry_on_exception(exc):
-    return isinstance(exc, (BinanceAPIException, BinanceOrderException))
+    return isinstance(exc, (BinanceAPIException, BinanceOrderException, BinanceRequestException, RequestException))
 
+# waits 0.5s, 1s, ... up to 4s plus up to 0.25s of jitter, so clients failed together don't retry together
 DEFAULT_RETRY_SETTINGS = {
     'stop_max_attempt_number': MAX_ATTEMPTS,
-    'wait_fixed': DELAY,
+    'wait_exponential_multiplier': 250,
+    'wait_exponential_max': 4000,
+    'wait_jitter_max': 250,
     'retry_on_exception': retry_on_exception
 }
 
+# UNKNOWN, DISCONNECTED, UNEXPECTED_RESP, TIMEOUT: the request may have been executed
+UNKNOWN_RESULT_CODES = (-1000, -1001, -1006, -1007)
+
+def is_order_result_unknown(exc):
+    '''
+    Order requests are retried only if the order might have been placed, rejected orders are not
+    '''
+    if isinstance(exc, BinanceAPIException):
+        return exc.status_code >= 500 or exc.code in UNKNOWN_RESULT_CODES or \
+               'duplicate order' in exc.message.lower()
+
+    return isinstance(exc, (BinanceRequestException, RequestException))
+
+# waits 0.1s, 0.2s, 0.4s plus up to 0.1s of jitter, a stop-loss can't wait long
+ORDER_RETRY_SETTINGS = {
+    'stop_max_attempt_number': 4,
+    'wait_exponential_multiplier': 50,
+    'wait_exponential_max': 1000,
+    'wait_jitter_max': 100,
+    'retry_on_exception': is_order_result_unknown
+}
+
+def request_priority(priority: RequestPriority):
+    '''
+    Requests made by the decorated method wait for the governor's budget with the priority
+    '''
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            with self.governor.priority(priority):
+                return fn(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
 class FXConnector(Logger):
     ORDER_STATUS_NEW = 'NEW'
     ORDER_STATUS_PARTIALLY_FILLED = 'PARTIALLY_FILLED'
@@ -28,6 +73,10 @@ class FXConnector(Logger):
     ORDER_STATUS_REJECTED = 'REJECTED'
     ORDER_STATUS_EXPIRED = 'EXPIRED'
 
+    LIST_ORDER_STATUS_EXECUTING = 'EXECUTING'
+    LIST_ORDER_STATUS_ALL_DONE = 'ALL_DONE'
+    LIST_ORDER_STATUS_REJECT = 'REJECT'
+
     SIDE_BUY = 'BUY'
     SIDE_SELL = 'SELL'
 
@@ -47,6 +96,10 @@ class FXConnector(Logger):
     ORDER_RESP_TYPE_RESULT = 'RESULT'
     ORDER_RESP_TYPE_FULL = 'FULL'
 
+    # client order ids of OCO orders are the list's client order id with a suffix
+    OCO_LIMIT_SUFFIX = 'L'
+    OCO_STOP_SUFFIX = 'S'
+
     def __init__(self, key=None, secret=None, simulation=False):
         super().__init__()
         self.__key = key
@@ -54,6 +107,13 @@ class FXConnector(Logger):
         self._simulation = simulation
         self._client = None #Client(key, secret)
         self.bs: BinanceWebsocket = None
+        self.runtime = NetworkRuntime()
+        self.transport = RestTransport(Utils.get_rest_pool_size())
+        self.governor = RequestGovernor()
+        # ACK returns as soon as the order is accepted, its fills are reported by the user stream
+        self.order_resp_type = Utils.get_order_resp_type()
+        self.clock_sync = ClockSync(self.get_server_time, self.set_timestamp_offset, Utils.get_clock_sync_interval_s(),
+                                    Utils.get_clock_sync_samples())
 
         # self.connection = None
         self.ticker_connection = None
@@ -62,25 +122,76 @@ class FXConnector(Logger):
     @property
     def client(self):
         if not self._client:
-            self._client = Client(self.__key, self.__secret, testnet=self._simulation)
+            self._client = BinanceRestClient(self.__key, self.__secret, self._simulation, self.transport,
+                                             self.governor, self.clock_sync.resync, Utils.get_recv_window_ms())
             self.test_connectivity()
 
         return self._client
 
 
     def test_connectivity(self):
-        res = self.get_server_time()
-        self.client.timestamp_offset = res['serverTime'] - int(time.time() * 1000)
+        self.clock_sync.sync(step=True)
 
+        if not self.clock_sync.is_alive():
+            self.clock_sync.start()
 
-    def listen_symbols(self, symbols, on_ticker_received, user_data_handler):
-        self.bs = BinanceWebsocket(self.client)
-        self.bs.start_ticker(symbols, on_ticker_received)
+    def set_timestamp_offset(self, offset):
+        self.client.timestamp_offset = offset
+
+
+    def submit(self, fn, *args, **kwargs):
+        '''
+        Runs the call on the REST thread pool, e.g. fx.submit(fx.cancel_order, sym, id)
+        :return: concurrent.futures.Future
+        '''
+        return self.transport.submit(fn, *args, **kwargs)
+
+    def get_timestamp_offset(self):
+        '''
+        :return: exchange server time minus local time in ms
+        '''
+        return getattr(self._client, 'timestamp_offset', 0) if self._client else 0
+
+    def listen_symbols(self, symbols, on_ticker_received, user_data_handler, on_ticker_connected=None):
+        # sockets of a stopped runtime can't be reopened, they are created on a new one
+        if self.runtime.is_stopped():
+            self.runtime = NetworkRuntime()
+            self.bs = None
+
+        self.runtime.ensure_running()
+
+        if not self.bs:
+            self.bs = BinanceWebsocket(self.client, self.runtime)
+
+        self.bs.start_ticker(symbols, on_ticker_received, on_ticker_connected)
         self.bs.start_user_info(user_data_handler)
 
         self.logInfo('Ticker and User WS initialized')
 
+    def update_symbols(self, symbols):
+        if not self.bs:
+            self.logWarning('Ticker WS is not initialized. Symbols are not updated')
+            return
+
+        # stopped sockets keep the symbols and subscribe them once started
+        self.bs.update_symbols(symbols)
+
+    def get_ticker_shards_health(self):
+        return self.bs.get_shards_health() if self.bs else []
+
+    def get_capture_metrics(self):
+        return self.bs.get_capture_metrics() if self.bs else None
+
+    def get_rest_metrics(self):
+        return self.governor.get_metrics()
+
+    def get_clock_metrics(self):
+        return self.clock_sync.get_metrics()
+
     def start_listening(self):
+        if self.bs.is_running():
+            return
+
         self.bs.start()
         self.logInfo('WS listening started')
 
@@ -90,6 +201,7 @@ class FXConnector(Logger):
             self.logInfo('Socket stopped')
 
     @retry(**DEFAULT_RETRY_SETTINGS)
+    @request_priority(RequestPriority.STOP_LOSS)
     def cancel_order(self, sym, id):
         '''
         :param sym:
@@ -110,18 +222,31 @@ class FXConnector(Logger):
             'type': 'LIMIT',
             'side': 'SELL'}
         '''
-        return self.client.cancel_order(symbol=sym, orderId=id)
+        with self.transport.symbol_lock(sym):
+            return self.client.cancel_order(symbol=sym, orderId=id)
 
     @retry(**DEFAULT_RETRY_SETTINGS)
+    @request_priority(RequestPriority.STOP_LOSS)
     def cancel_open_orders(self, sym):
-        orders = self.get_open_orders(sym)
-        if orders:
-            for order_id in orders:
-                self.client.cancel_order(symbol=sym, orderId=order_id)
-
-    @retry(**DEFAULT_RETRY_SETTINGS)
+        '''
+        Cancels all open orders of the symbol with a single request
+        :return: ids of canceled orders
+        '''
+        try:
+            canceled = self.cancel_open_orders_direct_api(sym)
+        except BinanceAPIException as bae:
+            # the symbol has no open orders
+            if bae.code == -2011:
+                return []
+            raise
+
+        # order lists are reported with their orders
+        return [r['orderId'] for o in canceled for r in o.get('orderReports', [o])]
+
+    @request_priority(RequestPriority.STOP_LOSS)
     def cancel_open_orders_direct_api(self, sym):
-        return self.client._delete('openOrders', True, data={'symbol': sym})
+        with self.transport.symbol_lock(sym):
+            return self.client._delete('openOrders', True, data={'symbol': sym})
         # self.client.cancel_open
         # orders = self.get_open_orders(sym)
         # if orders:
@@ -135,21 +260,44 @@ class FXConnector(Logger):
     def get_open_orders(self, sym):
         return [o['orderId'] for o in self.client.get_open_orders(symbol=sym)]
 
+    @retry(**DEFAULT_RETRY_SETTINGS)
+    def get_all_open_orders(self):
+        '''
+        Open orders of all symbols with a single request
+        :return: {symbol: {order id: order}}, order ids are unique only within the symbol
+        '''
+        orders = {}
+        for o in self.client.get_open_orders():
+            orders.setdefault(o['symbol'], {})[o['orderId']] = FXConnector.order_summary(o)
+
+        return orders
+
     @retry(**DEFAULT_RETRY_SETTINGS)
     def get_all_orders(self, sym, limit=500):
-        return {o['orderId']: {'status': o['status'],
-                               'price': o['price'],
-                               'stop_price': o['stopPrice'],
-                               'vol': o['origQty'],
-                               'vol_exec': o['executedQty']}
+        return {o['orderId']: FXConnector.order_summary(o)
                 for o in self.client.get_all_orders(symbol=sym, limit=limit)}
 
+    @classmethod
+    def order_summary(cls, o):
+        return {'status': o['status'],
+                'price': o['price'],
+                'stop_price': o['stopPrice'],
+                'vol': o['origQty'],
+                'vol_exec': o['executedQty']}
+
     @retry(**DEFAULT_RETRY_SETTINGS)
     def get_all_tickers(self):
         return self.client.get_all_tickers()
 
     @retry(**DEFAULT_RETRY_SETTINGS)
-    def get_orderbook_tickers(self, sym):
+    def get_orderbook_tickers(self, sym=None):
+        '''
+        :param sym: symbol, list of symbols or None for all symbols
+        :return: book ticker of the symbol or list of book tickers
+        '''
+        if isinstance(sym, (list, tuple, set)):
+            return self.client._get('ticker/bookTicker', version=self.client.PRIVATE_API_VERSION,
+                                    data={'symbols': json.dumps(sorted(sym), separators=(',', ':'))})
         if sym:
             return self.client._get('ticker/bookTicker', version=self.client.PRIVATE_API_VERSION, data={'symbol':sym})
         return self.client.get_orderbook_tickers()
@@ -158,37 +306,187 @@ class FXConnector(Logger):
     def get_order_status(self, sym, id):
         return self.client.get_order(symbol=sym, orderId=id)
 
-    # @retry(stop_max_attempt_number=MAX_ATTEMPTS, wait_fixed=DELAY)
-    def create_makret_order(self, sym, side, volume):
+    @classmethod
+    def client_order_id(cls, trade_id, target_key='m', attempt=0):
+        '''
+        Client order id of a new order: start of the trade id, key of the target and its attempt,
+        e.g. "3f2a9c1e7b5d4a08-x1-2". The same order gets the same id after a restart, so retries can find it.
+        '''
+        trade_id = re.sub('[^A-Za-z0-9]', '', trade_id)[:16]
+        return '{}-{}-{}'.format(trade_id, target_key, cls.to_base36(attempt))
+
+    @staticmethod
+    def to_base36(num):
+        digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+        res = ''
+        while num:
+            num, d = divmod(num, 36)
+            res = digits[d] + res
+        return res or '0'
+
+    def _submit_order(self, sym, client_id, place, find):
+        '''
+        Places the order and retries if its result is unknown (timeout, disconnect, 5xx).
+        Before a retry the order is looked up by its client order id, so it is never placed twice.
+        An order without a client order id is placed once.
+        :param find: returns the order by symbol and client order id or None
+        '''
+        if not client_id:
+            return place()
+
+        attempts = itertools.count()
+
+        @retry(**ORDER_RETRY_SETTINGS)
+        def submit():
+            if next(attempts):
+                order = find(sym, client_id)
+                if order:
+                    self.logInfo('Order {} was placed by a failed request'.format(client_id))
+                    return order
+
+                self.logWarning('Retrying order {}'.format(client_id))
+
+            return place()
+
+        return submit()
+
+    def find_order(self, sym, client_id):
+        try:
+            return self.client.get_order(symbol=sym, origClientOrderId=client_id)
+        except BinanceAPIException as bae:
+            # order does not exist
+            if bae.code == -2013:
+                return None
+            raise
+
+    def find_oco_order(self, sym, client_id):
+        try:
+            return self.client._get('orderList', True, data={'origClientOrderId': client_id})
+        except BinanceAPIException as bae:
+            if bae.code in (-2011, -2013):
+                return None
+            raise
+
+    def create_makret_order(self, sym, side, volume, priority=RequestPriority.ORDER, client_id=None):
+        '''
+        :param priority: RequestPriority.STOP_LOSS for stop-loss and emergency closes
+        :param client_id: client order id, see client_order_id. Without it the exchange assigns one
+        '''
         self.logInfo("Creating Market Order:{}; {} Vol:{:.08f}".format(side, sym, volume))
-        return self.client.create_order(
-            symbol=sym,
-            side=side,
-            type=FXConnector.ORDER_TYPE_MARKET,
-            quantity=FXConnector.format_number(volume))
+        with self.transport.symbol_lock(sym), self.governor.priority(priority):
+            return self._submit_order(sym, client_id, lambda: self.client.create_order(
+                symbol=sym,
+                side=side,
+                type=FXConnector.ORDER_TYPE_MARKET,
+                quantity=FXConnector.format_number(volume),
+                newClientOrderId=client_id,
+                newOrderRespType=self.order_resp_type), self.find_order)
+
+    @request_priority(RequestPriority.ORDER)
+    def create_limit_order(self, sym, side, price, volume, client_id=None):
+        with self.transport.symbol_lock(sym):
+            return self._create_limit_order(sym, side, price, volume, client_id)
+
+    @request_priority(RequestPriority.ORDER)
+    def create_limit_orders(self, sym, orders):
+        '''
+        Places limit orders of the symbol concurrently, so a batch takes about one round-trip
+        :param orders: [{'side': side, 'price': price, 'volume': volume, 'client_id': optional client order id}]
+        :return: placed orders or raised exceptions in the order of orders
+        '''
+        return self._place_orders(sym, orders, lambda o: self._create_limit_order(sym, o['side'], o['price'],
+                                                                                  o['volume'], o.get('client_id')))
+
+    @request_priority(RequestPriority.STOP_LOSS)
+    def create_oco_orders(self, sym, orders):
+        '''
+        Places OCO orders of the symbol concurrently, each one is a limit order and a stop-limit order of the same volume
+        :param orders: [{'side': side, 'price': price, 'stop_price': stop_price, 'stop_limit_price': stop_limit_price,
+                         'volume': volume, 'client_id': optional client order id of the list}]
+        :return: placed order lists or raised exceptions in the order of orders
+        '''
+        return self._place_orders(sym, orders, lambda o: self._create_oco_order(
+            sym, o['side'], o['price'], o['stop_price'], o['stop_limit_price'], o['volume'], o.get('client_id')))
+
+    def _place_orders(self, sym, orders, place):
+        priority = self.governor.current_priority()
 
-    # @retry(stop_max_attempt_number=MAX_ATTEMPTS, wait_fixed=DELAY)
-    def create_limit_order(self, sym, side, price, volume):
+        def place_with_priority(order):
+            with self.governor.priority(priority):
+                return place(order)
+
+        with self.transport.symbol_lock(sym):
+            return self.transport.map(place_with_priority, orders)
+
+    def _create_limit_order(self, sym, side, price, volume, client_id=None):
         self.logInfo("Creating Limit Order:{}; {} Vol:{:.08f}, Limit Price {:.08f}".format(side, sym, volume, price))
-        return self.client.create_order(
+        return self._submit_order(sym, client_id, lambda: self.client.create_order(
             symbol=sym,
             side=side,
             type=FXConnector.ORDER_TYPE_LIMIT,
             timeInForce=FXConnector.TIME_IN_FORCE_GTC,
             quantity=FXConnector.format_number(volume),
-            price=FXConnector.format_number(price))
+            price=FXConnector.format_number(price),
+            newClientOrderId=client_id,
+            newOrderRespType=self.order_resp_type), self.find_order)
 
-    # @retry(stop_max_attempt_number=MAX_ATTEMPTS, wait_fixed=DELAY)
-    def create_stop_order(self, sym, side, stop_price, price, volume):
+    @request_priority(RequestPriority.STOP_LOSS)
+    def create_stop_order(self, sym, side, stop_price, price, volume, client_id=None):
         self.logInfo("Creating Stop Order:{}; {} Vol:{:.08f}, Trigger Price {:.08f}, Limit Price {:.08f}".format(side, sym, volume, stop_price, price))
-        return self.client.create_order(
+        with self.transport.symbol_lock(sym):
+            return self._submit_order(sym, client_id, lambda: self.client.create_order(
+                symbol=sym,
+                side=side,
+                type=FXConnector.ORDER_TYPE_STOP_LOSS_LIMIT,
+                timeInForce=FXConnector.TIME_IN_FORCE_GTC,
+                quantity=FXConnector.format_number(volume),
+                stopPrice=FXConnector.format_number(stop_price),
+                price=FXConnector.format_number(price),
+                newClientOrderId=client_id,
+                newOrderRespType=self.order_resp_type), self.find_order)
+
+    def _create_oco_order(self, sym, side, price, stop_price, stop_limit_price, volume, client_id=None):
+        if not client_id:
+            raise ValueError('OCO order requires a client order id, its orders are told apart by it')
+
+        self.logInfo("Creating OCO Order:{}; {} Vol:{:.08f}, Limit Price {:.08f}, Trigger Price {:.08f}, "
+                     "Stop Limit Price {:.08f}".format(side, sym, volume, price, stop_price, stop_limit_price))
+        return self._submit_order(sym, client_id, lambda: self.client.create_oco_order(
             symbol=sym,
             side=side,
-            type=FXConnector.ORDER_TYPE_STOP_LOSS_LIMIT,
-            timeInForce=FXConnector.TIME_IN_FORCE_GTC,
             quantity=FXConnector.format_number(volume),
+            price=FXConnector.format_number(price),
             stopPrice=FXConnector.format_number(stop_price),
-            price=FXConnector.format_number(price))
+            stopLimitPrice=FXConnector.format_number(stop_limit_price),
+            stopLimitTimeInForce=FXConnector.TIME_IN_FORCE_GTC,
+            listClientOrderId=client_id,
+            limitClientOrderId=client_id + FXConnector.OCO_LIMIT_SUFFIX,
+            stopClientOrderId=client_id + FXConnector.OCO_STOP_SUFFIX,
+            newOrderRespType=self.order_resp_type), self.find_oco_order)
+
+    @classmethod
+    def get_oco_order_ids(cls, order_list):
+        '''
+        :param order_list: placed OCO order
+        :return: (limit order id, stop order id)
+        '''
+        if order_list.get('orderReports'):
+            ids = {r['type']: r['orderId'] for r in order_list['orderReports']}
+            return ids[FXConnector.ORDER_TYPE_LIMIT_MAKER], ids[FXConnector.ORDER_TYPE_STOP_LOSS_LIMIT]
+
+        # ACK responses and lists found by client order id have no reports,
+        # their orders are told apart by client order ids
+        ids = {o['clientOrderId'][-1:]: o['orderId'] for o in order_list['orders']}
+        return ids[FXConnector.OCO_LIMIT_SUFFIX], ids[FXConnector.OCO_STOP_SUFFIX]
+
+    @retry(**DEFAULT_RETRY_SETTINGS)
+    @request_priority(RequestPriority.STOP_LOSS)
+    def cancel_oco_order(self, sym, list_id):
+        '''
+        Cancels both orders of the OCO
+        '''
+        with self.transport.symbol_lock(sym):
+            return self.client._delete('orderList', True, data={'symbol': sym, 'orderListId': list_id})
 
     # # @retry(stop_max_attempt_number=MAX_ATTEMPTS, wait_fixed=DELAY)
     # def create_test_stop_order(self, sym, side, price, volume):
@@ -225,8 +523,20 @@ class FXConnector(Logger):
         return {}
 
     @retry(**DEFAULT_RETRY_SETTINGS)
-    def get_exchange_info(self):
-        return self.client.get_exchange_info()
+    def get_exchange_info(self, symbols=None):
+        '''
+        :param symbols: list of symbols, info of all symbols if empty
+        '''
+        if symbols:
+            info = self.client._get('exchangeInfo', version=self.client.PRIVATE_API_VERSION,
+                                    data={'symbols': json.dumps(sorted(symbols), separators=(',', ':'))})
+        else:
+            info = self.client.get_exchange_info()
+
+        if info.get('rateLimits'):
+            self.governor.set_rate_limits(info['rateLimits'])
+
+        return info
         # info = self.client.get_exchange_info()
         #
         # symbol_info = None
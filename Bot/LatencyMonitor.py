@@ -0,0 +1,159 @@
+import time
+from bisect import bisect_left
+from threading import Lock
+
+from Utils.Logger import Logger
+
+
+class LatencyHistogram:
+    BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    def __init__(self):
+        self.counts = [0] * (len(LatencyHistogram.BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+
+    def add(self, ms):
+        self.counts[bisect_left(LatencyHistogram.BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, p):
+        '''
+        :return: upper bound of the bucket the percentile falls into
+        '''
+        if not self.count:
+            return 0
+
+        rank = self.count * p / 100
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return LatencyHistogram.BUCKETS_MS[i] if i < len(LatencyHistogram.BUCKETS_MS) else round(self.max, 3)
+
+        return round(self.max, 3)
+
+    def to_dict(self):
+        buckets = {'<={}'.format(b): c for b, c in zip(LatencyHistogram.BUCKETS_MS, self.counts)}
+        buckets['>{}'.format(LatencyHistogram.BUCKETS_MS[-1])] = self.counts[-1]
+
+        return {
+            'count': self.count,
+            'avg': round(self.total / self.count, 3) if self.count else 0,
+            'max': round(self.max, 3),
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'buckets': buckets
+        }
+
+    def summary(self):
+        return 'n={} avg={:.1f} p50<={} p99<={} max={:.1f}'.format(
+            self.count, self.total / self.count if self.count else 0, self.percentile(50), self.percentile(99), self.max)
+
+
+class LatencyMonitor(Logger):
+    '''
+    Latency of price updates in ms per symbol and per stream:
+    exchange event time -> socket receive -> dispatch to strategies -> strategies done.
+    '''
+    EXCHANGE_TO_RECEIVE = 'exchange_to_receive'
+    RECEIVE_TO_DISPATCH = 'receive_to_dispatch'
+    DISPATCH_TO_DONE = 'dispatch_to_done'
+
+    STAGES = [EXCHANGE_TO_RECEIVE, RECEIVE_TO_DISPATCH, DISPATCH_TO_DONE]
+
+    def __init__(self, log_interval=60, get_time_offset=None, clock=time.time):
+        '''
+        :param log_interval: seconds between summaries in the log, 0 disables them
+        :param get_time_offset: returns exchange server time minus local time in ms
+        '''
+        super().__init__()
+        self.log_interval = log_interval
+        self.get_time_offset = get_time_offset
+        self.clock = clock
+
+        self.lock = Lock()
+        self.symbols = {}
+        self.streams = {}
+
+        # histograms since the last summary
+        self.interval = {}
+        self.last_log_time = clock()
+
+    @staticmethod
+    def stream_name(symbol, source):
+        return '{}@{}'.format(symbol, source.value)
+
+    def retain(self, streams):
+        '''
+        Drops histograms of symbols and streams which are no longer traded, so they don't pile up in a long run
+        :param streams: traded (symbol, PriceSource) pairs
+        '''
+        symbols = {symbol for symbol, source in streams}
+        names = {self.stream_name(symbol, source) for symbol, source in streams}
+
+        with self.lock:
+            for container, keep in ((self.symbols, symbols), (self.streams, names), (self.interval, names)):
+                for key in [k for k in container if k not in keep]:
+                    del container[key]
+
+    def histograms(self, container, key):
+        if key not in container:
+            container[key] = {stage: LatencyHistogram() for stage in LatencyMonitor.STAGES}
+
+        return container[key]
+
+    def record_tick(self, symbol, source, price, dispatch_time, done_time):
+        '''
+        :param price: price with "E" exchange event time in ms and "t" local receive time in seconds
+        '''
+        recv_time = price.get('t')
+        if recv_time is None:
+            return
+
+        stream = self.stream_name(symbol, source)
+
+        latencies = [(LatencyMonitor.RECEIVE_TO_DISPATCH, (dispatch_time - recv_time) * 1000),
+                     (LatencyMonitor.DISPATCH_TO_DONE, (done_time - dispatch_time) * 1000)]
+
+        if price.get('E'):
+            offset = self.get_time_offset() if self.get_time_offset else 0
+            latencies.append((LatencyMonitor.EXCHANGE_TO_RECEIVE, max(recv_time * 1000 + offset - price['E'], 0)))
+
+        with self.lock:
+            for histograms in (self.histograms(self.symbols, symbol),
+                               self.histograms(self.streams, stream),
+                               self.histograms(self.interval, stream)):
+                for stage, ms in latencies:
+                    histograms[stage].add(ms)
+
+        self.log_summary()
+
+    def log_summary(self, force=False):
+        if not self.log_interval and not force:
+            return
+
+        now = self.clock()
+        if not force and now - self.last_log_time < self.log_interval:
+            return
+
+        with self.lock:
+            interval = self.interval
+            self.interval = {}
+            self.last_log_time = now
+
+        for stream, histograms in sorted(interval.items()):
+            self.logInfo('Latency {}: {}'.format(
+                stream, '; '.join('{} {}'.format(stage, histograms[stage].summary())
+                                  for stage in LatencyMonitor.STAGES if histograms[stage].count)))
+
+    def get_metrics(self):
+        with self.lock:
+            return {
+                'symbols': {k: {stage: h.to_dict() for stage, h in v.items()} for k, v in self.symbols.items()},
+                'streams': {k: {stage: h.to_dict() for stage, h in v.items()} for k, v in self.streams.items()}
+            }
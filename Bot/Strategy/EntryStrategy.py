@@ -1,7 +1,6 @@
 import traceback
 
 from binance.exceptions import BinanceAPIException
-from datetime import datetime
 
 from Bot.AccountBalances import AccountBalances
 from Bot.FXConnector import FXConnector
@@ -9,6 +8,7 @@ from Bot.Strategy.SmartOrder import SmartOrder
 from Bot.Strategy.TradingStrategy import TradingStrategy
 from Bot.Target import Target, PriceHelper
 from Bot.Trade import Trade
+from Utils import Clock
 
 
 class EntryStrategy(TradingStrategy):
@@ -122,7 +122,8 @@ class EntryStrategy(TradingStrategy):
                         self.symbol(),
                         self.trade_side().name,
                         self.exchange_info.adjust_quanity(
-                            self.exchange_info.adjust_quanity(vol))
+                            self.exchange_info.adjust_quanity(vol)),
+                        client_id=self.client_order_id(self.current_target)
                     )
 
                     currency_balance = self.get_balance_for_side(self.trade_side().is_sell())
@@ -188,7 +189,8 @@ class EntryStrategy(TradingStrategy):
                     side=self.trade_side().name,
                     stop_price=self.exchange_info.adjust_price(trigger_order_price),
                     price=self.exchange_info.adjust_price(limit),
-                    volume=self.exchange_info.adjust_quanity(vol)
+                    volume=self.exchange_info.adjust_quanity(vol),
+                    client_id=self.client_order_id(self.current_target)
                 )
 
                 # just update cash while balance is not updated through API
@@ -209,7 +211,8 @@ class EntryStrategy(TradingStrategy):
                         self.symbol(),
                         self.trade_side().name,
                         self.exchange_info.adjust_quanity(
-                            self.exchange_info.adjust_quanity(vol))
+                            self.exchange_info.adjust_quanity(vol)),
+                        client_id=self.client_order_id(self.current_target)
                     )
                 else:
                     raise
@@ -225,7 +228,7 @@ class EntryStrategy(TradingStrategy):
                 status = self.fx.cancel_order(self.symbol(), self.current_target.id)
 
                 if status['status'] == 'CANCELED':
-                    canceled_time = datetime.now()
+                    canceled_time = Clock.now()
                     self.current_target.set_canceled()
                     self.trigger_target_updated()
 
@@ -1,5 +1,6 @@
 from binance.exceptions import BinanceAPIException
 
+from Bot.AccountBalances import AccountBalances
 from Bot.Strategy.EntryStrategy import ExitStrategy
 from Bot.TradeEnums import OrderStatus
 from Bot.FXConnector import FXConnector
@@ -9,8 +10,13 @@ from Bot.Value import Value
 
 
 class PlaceOrderStrategy(TradingStrategy):
-    def __init__(self, trade: Trade, fx: FXConnector, trade_updated=None, nested=False, exchange_info=None, balance=None):
+    def __init__(self, trade: Trade, fx: FXConnector, trade_updated=None, nested=False, exchange_info=None, balance=None,
+                 stop_prices=None):
+        '''
+        :param stop_prices: returns (stop price, stop limit price) for OCO orders or None to place limit orders
+        '''
         super().__init__(trade, fx, trade_updated, nested, exchange_info, balance)
+        self.stop_prices = stop_prices
         self.strategy_exit = None
         self.init_smart_exit()
         if self.assign_calculated_volume(self.trade_targets()):
@@ -43,6 +49,8 @@ class PlaceOrderStrategy(TradingStrategy):
             if self.strategy_exit:
                 self.strategy_exit.execute(new_price)
 
+            self.cancel_outdated_oco_orders(targets)
+
             if self.validate_all_orders(targets):
                 return
 
@@ -136,13 +144,73 @@ class PlaceOrderStrategy(TradingStrategy):
         self.logInfo('Orders to be posted: {}'.format(orders))
         return orders
 
+    def get_oco_stop_prices(self, placed_stop=0):
+        return self.stop_prices(placed_stop) if self.stop_prices else None
+
+    def cancel_outdated_oco_orders(self, targets):
+        '''
+        Cancels placed exits whose stop differs from the current stop-loss, they are placed again with the new stop
+        '''
+        outdated = []
+        for t in targets:
+            if not t.is_active() or not t.has_id() or t.is_smart():
+                continue
+
+            stop = self.get_oco_stop_prices(t.stop_price)
+            if stop and stop[0] != t.stop_price:
+                outdated.append(t)
+
+        version = AccountBalances().version
+
+        for t in outdated:
+            self.logInfo('Replacing {} to move its stop-loss'.format(t))
+
+            if t.is_oco():
+                self.fx.cancel_oco_order(self.symbol(), t.list_id)
+            else:
+                self.fx.cancel_order(self.symbol(), t.id)
+
+            t.set_canceled()
+
+        if outdated:
+            self.self_update_balances(version)
+            self.trigger_target_updated()
+
     def place_orders(self, allocations):
-        for a in allocations:
-            target = a.pop('target', None)
-            order = self.fx.create_limit_order(sym=self.symbol(), **a)
-            target.set_active(order['orderId'])
+        targets = [a.pop('target', None) for a in allocations]
+        error = None
+
+        for target, a in zip(targets, allocations):
+            a['client_id'] = self.client_order_id(target)
+
+        stop = self.get_oco_stop_prices()
+        if stop:
+            for a in allocations:
+                a['stop_price'], a['stop_limit_price'] = stop
+
+            placed = self.fx.create_oco_orders(self.symbol(), allocations)
+        else:
+            placed = self.fx.create_limit_orders(self.symbol(), allocations)
+
+        for target, order in zip(targets, placed):
+            if isinstance(order, Exception):
+                self.logError('Failed to place {}: {}'.format(target, order))
+                error = error or order
+                continue
+
+            if stop:
+                order_id, stop_id = FXConnector.get_oco_order_ids(order)
+                target.set_active(order_id)
+                target.set_oco(order['orderListId'], stop_id, stop[0])
+            else:
+                target.set_active(order['orderId'])
+
+        # placed orders are saved even if some of the ladder failed
         self.trigger_target_updated()
 
+        if error:
+            raise error
+
     def on_order_status_changed(self, t, data):
         if not t.is_exit_target():
             return
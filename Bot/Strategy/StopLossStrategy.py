@@ -1,6 +1,7 @@
 from binance.exceptions import BinanceAPIException
 
 from Bot.AccountBalances import AccountBalances
+from Bot.Exchange.RequestGovernor import RequestPriority
 from Bot.FXConnector import FXConnector
 from Bot.Strategy.TradingStrategy import TradingStrategy
 from Bot.Target import Target
@@ -38,7 +39,10 @@ class StopLossStrategy(TradingStrategy):
         price = self.get_single_price(new_price)
 
         self.adjust_stoploss_price(price)
-        self.adjust_stoploss_order(price)
+
+        # OCO exits carry the stop-loss, a separate order is needed only while no exit protects the position
+        if not self.has_oco_exits():
+            self.adjust_stoploss_order(price)
 
         self.save_last_sl()
         self.log_stoploss()
@@ -48,6 +52,9 @@ class StopLossStrategy(TradingStrategy):
             self.trade.sl_settings.last_stoploss = self.current_stop_loss
             self.trigger_target_updated()
 
+    def has_oco_exits(self):
+        return self.trade.is_oco_exit() and any(t.is_active() and t.is_oco() for t in self.trade.exit.targets)
+
     def is_stoploss_order_active(self):
         return self.initial_sl().is_active()
 
@@ -61,10 +68,14 @@ class StopLossStrategy(TradingStrategy):
         treshold = self.get_sl_treshold()
 
         if self.last_sl != self.current_stop_loss or self.last_th != treshold:
-            self.logInfo('{}SL:{:.08f}. Will be placed if price drops to: {:.08f}'.format(
-                'TRAILING ' if self.trade.sl_settings.is_trailing() else '',
-                self.current_stop_loss,
-                treshold))
+            if self.has_oco_exits():
+                self.logInfo('{}SL:{:.08f}. Placed with OCO exit targets'.format(
+                    'TRAILING ' if self.trade.sl_settings.is_trailing() else '', self.current_stop_loss))
+            else:
+                self.logInfo('{}SL:{:.08f}. Will be placed if price drops to: {:.08f}'.format(
+                    'TRAILING ' if self.trade.sl_settings.is_trailing() else '',
+                    self.current_stop_loss,
+                    treshold))
             self.last_th = treshold
             self.last_sl = self.current_stop_loss
 
@@ -133,8 +144,9 @@ class StopLossStrategy(TradingStrategy):
         else:
             self.exit_threshold = 0
 
+            version = AccountBalances().version
             if self.cancel_stoploss_orders():
-                AccountBalances().update_balances(self.fx.get_all_balances_dict())
+                self.self_update_balances(version)
 
     def get_sl_treshold(self):
         threshold = self.trade.sl_settings.zone_entry.get_val(self.current_stop_loss)
@@ -158,8 +170,9 @@ class StopLossStrategy(TradingStrategy):
             #     order = self.fx.create_test_stop_order(self.symbol(), self.trade_side().name, self.current_stop_loss, 50)
             #     order['orderId'] = 2333123
             # else:
-            self.cancel_all_orders()
-            AccountBalances().update_balances(self.fx.get_all_balances_dict())
+            version = AccountBalances().version
+            canceled = self.cancel_all_orders()
+            self.self_update_balances(version if canceled else None)
 
             price = self.exchange_info.adjust_price(self.get_sl_limit_price())
             bal = self.trade.get_cap(self.get_balance_for_side().avail)
@@ -174,13 +187,16 @@ class StopLossStrategy(TradingStrategy):
                     side=self.trade_side().name,
                     stop_price=self.exchange_info.adjust_price(self.current_stop_loss),
                     price=price,
-                    volume=volume
+                    volume=volume,
+                    client_id=self.client_order_id(self.initial_sl())
                 )
             except BinanceAPIException as sl_exception:
                 if sl_exception.message.lower().find('would trigger immediately') > -1:
                     order = self.fx.create_makret_order(self.symbol(),
                                                         self.trade_side().name,
-                                                        volume)
+                                                        volume,
+                                                        RequestPriority.STOP_LOSS,
+                                                        self.client_order_id(self.initial_sl()))
                 else:
                     raise
 
@@ -197,25 +213,42 @@ class StopLossStrategy(TradingStrategy):
     def initial_sl(self):
         return self.trade.get_initial_stop()
 
-    def get_sl_limit_price(self):
-        return self.current_stop_loss + (
-         -1 if self.trade.is_sell() else 1) * self.trade.sl_settings.limit_price_threshold.get_val(
-         self.current_stop_loss)
+    def get_sl_limit_price(self, stop_loss=None):
+        if stop_loss is None:
+            stop_loss = self.current_stop_loss
+
+        return stop_loss + (
+         -1 if self.trade.is_sell() else 1) * self.trade.sl_settings.limit_price_threshold.get_val(stop_loss)
+
+    def get_oco_stop_prices(self, placed_stop=0):
+        '''
+        :param placed_stop: stop price of an already placed OCO order
+        :return: (stop price, stop limit price) for OCO orders or None if there is no stop-loss yet.
+        A trailing stop keeps placed_stop until it moves by the zone entry, so OCO orders aren't replaced on every tick
+        '''
+        stop = self.current_stop_loss
+        if not stop:
+            return None
+
+        if placed_stop and self.trade.sl_settings.is_trailing() and \
+                abs(stop - placed_stop) < self.trade.sl_settings.zone_entry.get_val(placed_stop):
+            stop = placed_stop
+
+        return self.exchange_info.adjust_price(stop), self.exchange_info.adjust_price(self.get_sl_limit_price(stop))
 
     def cancel_all_orders(self):
         self.logInfo('canceling all orders...')
 
-        ids = self.fx.get_open_orders(self.symbol())
-        active_targets = self.trade.get_all_active_placed_targets()
+        ids = self.fx.cancel_open_orders(self.symbol())
+        active_targets = {t.id: t for t in self.trade.get_all_active_placed_targets()}
 
         for id in ids:
-            self.fx.cancel_order(self.symbol(), id)
             self.logInfo('Order {} canceled'.format(id))
-            try:
-                tgt = next(t for t in active_targets if t.id == id)
-                tgt.set_canceled()
-            except StopIteration:
-                pass
+
+            if id in active_targets:
+                active_targets[id].set_canceled()
+
+        return ids
 
     def cancel_stoploss_orders(self):
         target: Target = self.trade.sl_settings.initial_target
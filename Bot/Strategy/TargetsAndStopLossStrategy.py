@@ -1,6 +1,7 @@
 from binance.exceptions import BinanceAPIException
 
 from Bot.AccountBalances import AccountBalances
+from Bot.Exchange.RequestGovernor import RequestPriority
 from Bot.FXConnector import FXConnector
 from Bot.TradeEnums import OrderStatus
 from Bot.Strategy.EntryStrategy import EntryStrategy, ExitStrategy
@@ -12,8 +13,11 @@ from Bot.Trade import Trade
 
 
 class TargetsAndStopLossStrategy(TradingStrategy):
-    def __init__(self, trade: Trade, fx: FXConnector, trade_updated=None, balance=None):
-        super().__init__(trade=trade, fx=fx, trade_updated=trade_updated, balance=balance)
+    def __init__(self, trade: Trade, fx: FXConnector, trade_updated=None, balance=None, open_orders=None):
+        '''
+        :param open_orders: {order id: order} of the symbol's open orders, see TradingStrategy.validate_target_orders
+        '''
+        super().__init__(trade=trade, fx=fx, trade_updated=trade_updated, balance=balance, open_orders=open_orders)
 
         if trade.has_stoploss() or trade.has_stoploss_in_last_completed_target():
             self.create_sl_strategy(trade)
@@ -41,13 +45,19 @@ class TargetsAndStopLossStrategy(TradingStrategy):
 
     def create_exit_strategy(self, trade):
         self.strategy_exit = PlaceOrderStrategy(trade, self.fx, self.trade_updated, True, self.exchange_info,
-                                                self.balance)
+                                                self.balance, self.get_oco_stop_prices)
         # if trade.exit.type.is_smart():
         #     self.strategy_exit = ExitStrategy(trade, self.fx, self.trade_updated, True, self.exchange_info,
         #                                       self.balance)
         # elif trade.exit.type.is_target():
 
 
+    def get_oco_stop_prices(self, placed_stop=0):
+        if not self.trade.is_oco_exit() or not self.strategy_sl:
+            return None
+
+        return self.strategy_sl.get_oco_stop_prices(placed_stop)
+
     def update_trade(self, trade: Trade):
         super().update_trade(trade)
         self.last_execution_price = 0
@@ -121,7 +131,7 @@ class TargetsAndStopLossStrategy(TradingStrategy):
             if t.is_entry_target():
                 # validate balance and activate trade only if there are trading targets
                 if self.strategy_exit:
-                    AccountBalances().update_balances(self.fx.get_all_balances_dict())
+                    self.self_update_balances(data.get('balances_version'))
                     self.trade.cap = self.get_balance_for_side().avail
                     self.trade.set_active()
                     self.trigger_target_updated()
@@ -162,9 +172,10 @@ class TargetsAndStopLossStrategy(TradingStrategy):
 
     def emergent_close_position(self):
         try:
-            self.cancel_all_open_orders()
+            version = AccountBalances().version
+            canceled = self.cancel_all_open_orders()
 
-            AccountBalances().update_balances(self.fx.get_all_balances_dict())
+            self.self_update_balances(version if canceled else None)
 
             # price = self.exchange_info.adjust_price(self.get_sl_limit_price())
             bal = self.trade.get_cap(self.get_balance_for_side().avail)
@@ -180,9 +191,13 @@ class TargetsAndStopLossStrategy(TradingStrategy):
                 'Closing positions ({}): {}, v: {:.08f}'.format(self.symbol(), self.trade_side(), adjusted_vol))
 
             if adjusted_vol > 0:
+                # a close after a partial fill or a restart must not be taken for the previous one
+                self.trade.close_attempts += 1
                 order = self.fx.create_makret_order(self.symbol(),
                                                     self.trade_side().name,
-                                                    adjusted_vol)
+                                                    adjusted_vol,
+                                                    RequestPriority.STOP_LOSS,
+                                                    self.client_order_id())
 
             self.logInfo('Positions [{}] Closed'.format(self.symbol()))
             self.trade.set_completed()
@@ -1,5 +1,3 @@
-from datetime import datetime
-
 from binance.exceptions import BinanceAPIException
 
 from Bot.ExchangeInfo import ExchangeInfo
@@ -14,20 +12,17 @@ from Utils.Logger import Logger
 
 
 class TradingStrategy(Logger):
-    EXCHANGE_INFO_REFRESH_S = 60
-
     def __init__(self,
                  trade: Trade,
                  fx: FXConnector,
                  trade_updated=None,
                  nested=False,
                  exchange_info=None,
-                 balance: Balance=None):
+                 balance: Balance=None,
+                 open_orders=None):
         self.trade: Trade = trade
         self.fx = fx
         self.balance: Balance = balance if balance else Balance()
-        self._exchange_info = None
-        self._exchange_info_last_update = datetime.now()
         self.simulate = Utils.is_simulation()
         self.trade_updated = trade_updated
         self.last_execution_price = 0
@@ -40,16 +35,12 @@ class TradingStrategy(Logger):
             if balance:
                 self.balance = balance
         else:
-            self.init()
+            self.init(open_orders=open_orders)
 
     @property
     def exchange_info(self):
-        if not self._exchange_info or \
-                (datetime.now() - self._exchange_info_last_update).seconds >= TradingStrategy.EXCHANGE_INFO_REFRESH_S:
-            self._exchange_info = ExchangeInfo().symbol_info(self.symbol())
-            self._exchange_info_last_update = datetime.now()
-
-        return self._exchange_info
+        # compiled once per exchange info update and shared by all strategies of the symbol
+        return ExchangeInfo().symbol_info(self.symbol())
 
     def _get_logger_name(self):
         return '{}({})'.format(self.__class__.__name__, self.symbol())
@@ -58,12 +49,12 @@ class TradingStrategy(Logger):
         self.trade = trade
         self.init(True)
 
-    def init(self, force_cancel_open_orders=False):
+    def init(self, force_cancel_open_orders=False, open_orders=None):
         # #TODO: make one call for each symbols
         # if not force_cancel_open_orders:
         #     self.exchange_info = self.fx.get_exchange_info(self.symbol())
         # self.exchange_info = self.ExchangeInfo().symbol_info(self.symbol())
-        self.validate_target_orders(force_cancel_open_orders)
+        self.validate_target_orders(force_cancel_open_orders, open_orders)
 
     def is_completed(self):
         return self.trade.is_completed()
@@ -71,8 +62,18 @@ class TradingStrategy(Logger):
     def trade_side(self):
         return self.trade.side
 
-    def self_update_balances(self):
-        AccountBalances().update_balances(self.fx.get_all_balances_dict())
+    def self_update_balances(self, version=None):
+        '''
+        :param version: balances version read before orders were changed, see AccountBalances.refresh
+        '''
+        AccountBalances().refresh(self.fx.get_all_balances_dict, version, asset=self.trade.asset)
+
+    def client_order_id(self, target: Target = None):
+        '''
+        :param target: None for a market close of the trade
+        '''
+        return FXConnector.client_order_id(self.trade.id, self.trade.target_key(target),
+                                           target.attempts if target is not None else self.trade.close_attempts)
 
     def asset(self):
         return self.trade.asset.upper()
@@ -86,60 +87,110 @@ class TradingStrategy(Logger):
     def symbol(self):
         return self.trade.symbol
 
+    def price_source(self):
+        return self.trade.get_price_source()
+
     def emergent_close_position(self):
         raise NotImplementedError('Strategy does not support this method')
 
-    def on_execution_rpt(self, data):
+    def on_execution_rpt(self, data, target: Target = None):
+        '''
+        :param target: target of the order if it is already known, otherwise active targets are searched
+        '''
         self.logInfo('Execution Rpt: {}'.format(data))
         orderId = data['orderId']
 
-        tgts = self.trade.get_all_active_placed_targets()
+        tgts = [target] if target else self.trade.get_all_active_placed_targets()
 
         for t in tgts:
-            if t.id == orderId:
+            if t.has_order_id(orderId):
+                # the other order of an OCO expires when one fills, the list status tells if it ended unfilled
+                if t.is_oco() and data['status'] != FXConnector.ORDER_STATUS_FILLED:
+                    break
+
+                if orderId == t.stop_id:
+                    self.logInfo('Stop-loss of {} is filled'.format(t))
+
                 if self._update_trade_target_status_change(t, data['status']):
                     self.last_execution_price = 0
                     self.trigger_target_updated()
                     self.on_order_status_changed(t, data)
                 break
 
+    def on_list_status(self, data, target: Target = None):
+        '''
+        Exits placed as OCO orders are placed again when their list is done or rejected without a fill
+        :param target: target of the list if it is already known, otherwise active targets are searched
+        '''
+        self.logInfo('List Status: {}'.format(data))
+
+        if data['status'] not in [FXConnector.LIST_ORDER_STATUS_ALL_DONE, FXConnector.LIST_ORDER_STATUS_REJECT]:
+            return
+
+        tgts = [target] if target else self.trade.get_all_active_placed_targets()
+
+        for t in tgts:
+            if t.list_id == data['listId']:
+                if t.is_completed():
+                    break
+
+                # the fill may be reported after the list status
+                status = FXConnector.ORDER_STATUS_CANCELED
+                if data['status'] == FXConnector.LIST_ORDER_STATUS_ALL_DONE:
+                    status = self.get_oco_status(t, {})
+
+                if self._update_trade_target_status_change(t, status):
+                    self.last_execution_price = 0
+                    self.trigger_target_updated()
+                    self.on_order_status_changed(t, data)
+                break
+
+    def get_oco_status(self, t: Target, orders):
+        '''
+        :param orders: {order id: {'status': status}} of known orders, others are requested
+        :return: FILLED if either order of the OCO is filled, otherwise the status of the limit order
+        '''
+        statuses = [orders[i]['status'] if i in orders else self.fx.get_order_status(self.symbol(), i)['status']
+                    for i in (t.id, t.stop_id)]
+
+        return FXConnector.ORDER_STATUS_FILLED if FXConnector.ORDER_STATUS_FILLED in statuses else statuses[0]
+
     def on_order_status_changed(self, t: Target, data):
         pass
 
-    def validate_target_orders(self, force_cancel_open_orders=False):
-        NEW_STATUSES = [FXConnector.ORDER_STATUS_NEW, FXConnector.ORDER_STATUS_PARTIALLY_FILLED]
+    def validate_target_orders(self, force_cancel_open_orders=False, open_orders=None):
+        '''
+        Open orders of placed targets are canceled, so the targets are placed again. Other orders were filled or
+        canceled while the bot was stopped, only their statuses are requested.
+        :param open_orders: {order id: order} of the symbol's open orders, e.g. from FXConnector.get_all_open_orders.
+        Requested if None
+        '''
+        active_trade_targets = self.trade.get_all_active_placed_targets()
 
-        open_exchange_orders = {}
-        recent_orders = {}
         try:
-            recent_orders = self.fx.get_all_orders(self.symbol())
-            open_exchange_orders = {k: v for k, v in recent_orders.items() if (v['status'] in NEW_STATUSES)}
-
+            if open_orders is None and active_trade_targets:
+                open_orders = {i: {'status': FXConnector.ORDER_STATUS_NEW}
+                               for i in self.fx.get_open_orders(self.symbol())}
         except BinanceAPIException as bae:
             self.logError(str(bae))
             return
 
-        active_trade_targets = self.trade.get_all_active_placed_targets()
-
         update_required = False
 
-
         for active_trade_target in active_trade_targets:
-            if active_trade_target.id not in open_exchange_orders:
-                active_trade_target.set_canceled()
-                update_required = True
-            else:
+            if active_trade_target.id in open_orders:
+                status = open_orders[active_trade_target.id]['status']
                 self.fx.cancel_order(self.symbol(), active_trade_target.id)
 
-                active_trade_target.set_canceled()
-
                 if active_trade_target.is_smart():
                     active_trade_target.best_price = 0
+            else:
+                status = self.get_closed_order_status(active_trade_target, open_orders)
 
-                update_required = True
+            active_trade_target.set_canceled()
+            update_required = True
 
-            update_required |= self._update_trade_target_status_change(
-                active_trade_target, recent_orders.get(active_trade_target.id, {}).get('status', 'UNKNOWN'))
+            update_required |= self._update_trade_target_status_change(active_trade_target, status)
 
         if force_cancel_open_orders:
             self.cancel_all_open_orders()
@@ -147,9 +198,19 @@ class TradingStrategy(Logger):
         if update_required:
             self.trigger_target_updated()
 
+    def get_closed_order_status(self, t: Target, open_orders):
+        try:
+            if t.is_oco():
+                return self.get_oco_status(t, open_orders)
+
+            return self.fx.get_order_status(self.symbol(), t.id)['status']
+        except BinanceAPIException as bae:
+            self.logError('Status of {} is unknown: {}'.format(t, bae))
+            return 'UNKNOWN'
+
     def cancel_all_open_orders(self):
         self.logInfo('Cancelling all Open orders for "{}"'.format(self.symbol()))
-        self.fx.cancel_open_orders(self.symbol())
+        return self.fx.cancel_open_orders(self.symbol())
 
     def _update_trade_target_status_change(self, t: Target, status: str) -> bool:
         if status == FXConnector.ORDER_STATUS_FILLED:
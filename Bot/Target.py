@@ -24,6 +24,14 @@ class Target(CustomSerializable):
         cv = kvargs.get('calculated_volume', None)
         self.calculated_volume = float(cv) if cv else None
 
+        # exit placed as an OCO: the limit order is "id", the protective stop leg is "stop_id"
+        self.list_id = kvargs.get('list_id')
+        self.stop_id = kvargs.get('stop_id')
+        self.stop_price = float(kvargs.get('stop_price', 0))
+
+        # orders of the target canceled so far, the next order gets a new client order id
+        self.attempts = int(kvargs.get('attempts', 0))
+
     def s2b(self, s):
         return Utils.s2b(s)
 
@@ -49,13 +57,28 @@ class Target(CustomSerializable):
     def set_canceled(self):
         self.status = OrderStatus.NEW
         self.id = None
+        self.attempts += 1
         self.calculated_volume = None
+        self.list_id = None
+        self.stop_id = None
+        self.stop_price = 0
 
     def set_active(self, id=None):
         self.status = OrderStatus.ACTIVE
         if id:
             self.id = id
 
+    def set_oco(self, list_id, stop_id, stop_price):
+        self.list_id = list_id
+        self.stop_id = stop_id
+        self.stop_price = stop_price
+
+    def is_oco(self):
+        return self.list_id is not None
+
+    def has_order_id(self, id):
+        return id is not None and id in (self.id, self.stop_id)
+
     def has_custom_stop(self):
         return self.sl != 0
 
@@ -88,6 +111,8 @@ class Target(CustomSerializable):
         desc += ' ;Stoploss:{}'.format(self.sl)
         desc += ' ;Status:{}'.format(self.status)
         desc += ' ;ID:{}'.format(self.id)
+        if self.is_oco():
+            desc += ' ;OCO:{}; Stop ID:{}@{:.08f}'.format(self.list_id, self.stop_id, self.stop_price)
         return desc
         # '(abs vol: {:.08f})'.format(self.calculated_volume) if self.vol.is_rel() and self.calculated_volume else ''
 
@@ -125,6 +150,14 @@ class Target(CustomSerializable):
         if self.calculated_volume:
             d['calculated_volume'] = self.format_float(self.calculated_volume)
 
+        if self.is_oco():
+            d['list_id'] = self.list_id
+            d['stop_id'] = self.stop_id
+            d['stop_price'] = self.format_float(self.stop_price)
+
+        if self.attempts:
+            d['attempts'] = self.attempts
+
         return d
 
 
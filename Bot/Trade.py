@@ -2,9 +2,10 @@ from collections import OrderedDict
 import uuid
 from typing import List
 from Bot.EntryExitSettings import EntryExitSettings
-from Bot.TradeEnums import Side
+from Bot.TradeEnums import Side, PriceSource
 from Bot.StopLossSettings import StopLossSettings
 from Bot.Target import *
+from Utils import Utils
 
 
 class Trade(CustomSerializable):
@@ -32,6 +33,12 @@ class Trade(CustomSerializable):
 
         self.cap = float(kvargs.get('cap')) if kvargs.get('cap') else None
 
+        price_source = kvargs.get('price_source')
+        self.price_source = PriceSource(price_source.lower()) if price_source else None
+
+        # market closes sent so far, each one gets a new client order id
+        self.close_attempts = int(kvargs.get('close_attempts', 0))
+
         self.id = kvargs.get('id', None)
 
         if not self.id:
@@ -55,12 +62,21 @@ class Trade(CustomSerializable):
     def is_sell(self):
         return self.side.is_sell()
 
+    def get_price_source(self) -> PriceSource:
+        return self.price_source if self.price_source else PriceSource(Utils.get_price_source())
+
     def has_entry(self):
         return self.entry is not None
 
     def has_exit(self):
         return self.exit is not None
 
+    def is_oco_exit(self):
+        '''
+        exit targets are placed as OCO orders with the stop-loss, smart targets still need a separate stop-loss order
+        '''
+        return self.has_exit() and self.exit.oco and not self.exit.get_all_smart_targets()
+
     def has_stoploss(self):
         return self.sl_settings is not None and self.sl_settings.initial_target
 
@@ -80,6 +96,22 @@ class Trade(CustomSerializable):
             return self.sl_settings.initial_target
         return None
 
+    def target_key(self, target: Target = None):
+        '''
+        :return: short key of the target in the trade: "e0" entry, "x1" exit, "sl" stop-loss, "m" for other orders
+        '''
+        if target is not None:
+            if self.has_stoploss() and target is self.sl_settings.initial_target:
+                return 'sl'
+
+            for prefix, settings in (('e', self.entry), ('x', self.exit)):
+                if settings:
+                    for i, t in enumerate(settings.targets):
+                        if t is target:
+                            return '{}{}'.format(prefix, i)
+
+        return 'm'
+
     def serializable_dict(self):
         d = OrderedDict()
 
@@ -92,6 +124,12 @@ class Trade(CustomSerializable):
         if self.cap:
             d['cap'] = self.format_float(self.cap)
 
+        if self.price_source:
+            d['price_source'] = self.price_source
+
+        if self.close_attempts:
+            d['close_attempts'] = self.close_attempts
+
         if self.entry:
             d['entry'] = self.entry
 
@@ -32,6 +32,21 @@ class Side(Enum):
         if self == Side.BUY:
             return Side.SELL
         return Side.BUY
+
+class PriceSource(Enum):
+    TICKER = 'ticker'
+    BOOK_TICKER = 'book_ticker'
+    AGG_TRADE = 'agg_trade'
+
+    def is_ticker(self):
+        return self == PriceSource.TICKER
+
+    def is_book_ticker(self):
+        return self == PriceSource.BOOK_TICKER
+
+    def is_agg_trade(self):
+        return self == PriceSource.AGG_TRADE
+
 #
 # class Entry(Enum):
 #     SMART = 'smart'
@@ -1,19 +1,25 @@
 import traceback
-from datetime import datetime as dt
 from threading import RLock
 from typing import List
 
 from Bot.AccountBalances import AccountBalances
 from Bot.ExchangeInfo import ExchangeInfo
+from Bot.ExchangeInfoRefresher import ExchangeInfoRefresher
 from Bot.FXConnector import FXConnector
+from Bot.LatencyMonitor import LatencyMonitor
 from Bot.Strategy.TargetsAndStopLossStrategy import TargetsAndStopLossStrategy
 from Bot.Strategy.TradingStrategy import TradingStrategy
+from Bot.EventDispatcher import EventDispatcher
 from Bot.Trade import Trade
+from Bot.TradeEnums import PriceSource
+from Utils import Clock
+from Utils import Utils
 from Utils.Logger import Logger
 
 
 class TradeHandler(Logger):
-    def __init__(self, trades: List[Trade], fx: FXConnector, trade_updated_handler=None):
+    def __init__(self, trades: List[Trade], fx: FXConnector, trade_updated_handler=None,
+                 exchange_info_snapshot=None):
         super().__init__()
         self.fx = fx
         self.balances = AccountBalances()
@@ -37,15 +43,39 @@ class TradeHandler(Logger):
 
         self.strategies_dict = {}
         self.tradeid_strategy_dict = {}
-        self.trade_info_ticker_buf = {}
 
-        self.process_delay = 500
-        self.last_ts = dt.now()
+        # exchange order id -> (strategy, target) of placed targets, and order ids of each trade
+        self.order_index = {}
+        self.trade_order_ids = {}
+
+        self.dispatcher = EventDispatcher(self.on_symbol_prices,
+                                          Utils.get_tick_window_ms(EventDispatcher.DEFAULT_WINDOW_MS),
+                                          Utils.get_symbol_tick_windows(),
+                                          Utils.get_dispatch_workers(),
+                                          Utils.get_dispatch_queue_size(EventDispatcher.DEFAULT_MAX_EVENTS),
+                                          Clock.monotonic)
+        self.exchange_info = ExchangeInfoRefresher(fx.get_exchange_info, lambda: list(self.strategies_dict.keys()),
+                                                   Utils.get_exchange_info_refresh_s(),
+                                                   Utils.get_exchange_info_full_refresh_s(),
+                                                   exchange_info_snapshot)
+        self.latency = LatencyMonitor(Utils.get_latency_log_interval(), fx.get_timestamp_offset, Clock.time)
+
         self.first_processing = True
         self.socket_message_rcvd = False
         self.paused = False
 
+        # strategies of a symbol are executed under its lock, self.lock only guards the strategy maps
         self.lock = RLock()
+        self.symbol_locks = {}
+
+    def symbol_lock(self, symbol):
+        lock = self.symbol_locks.get(symbol)
+
+        if lock is None:
+            with self.lock:
+                lock = self.symbol_locks.setdefault(symbol, RLock())
+
+        return lock
 
     def pause(self):
         self.logInfo('Pausing trade handler')
@@ -56,67 +86,141 @@ class TradeHandler(Logger):
         self.paused = False
 
     def process_initial_prices(self):
+        if not self.first_processing:
+            return
+
+        self.first_processing = False
+        self.resync_prices(list(self.strategies_dict.keys()))
+
+    def on_ticker_connected(self, symbols):
+        # called on the network thread, REST request is made by the REST pool, so dispatch workers keep executing
+        # strategies and the prices are pushed to the workers of their symbols
+        self.fx.submit(self.resync_prices, symbols)
+
+    def resync_prices(self, symbols):
+        '''
+        Pulls book tickers of subscribed symbols and pushes them through the dispatcher,
+        so prices missed while a stream was down are handled without waiting for the next tick
+        '''
         try:
-            if not self.first_processing:
+            symbols = [s for s in symbols if s in self.strategies_dict]
+            if not symbols:
                 return
 
-            self.first_processing = False
+            tickers = self.fx.get_orderbook_tickers(symbols)
+            recv_time = Clock.time()
+
+            for t in tickers:
+                price = {'b': float(t['bidPrice']), 'a': float(t['askPrice']), 'E': None, 't': recv_time}
 
-            tickers = self.fx.get_orderbook_tickers()
-            # tickers = self.fx.get_all_tickers()
-            # prices = {t['symbol']: float(t['price']) for t in tickers}
+                for source in {s.price_source() for s in self.strategies_dict.get(t['symbol'], [])}:
+                    # a tick received while the request was in flight is newer than the snapshot
+                    self.dispatcher.push(t['symbol'], source, dict(price), replace=False)
 
-            prices = {t['symbol']: {'b': float(t['bidPrice']), 'a': float(t['askPrice'])} for t in tickers}
-            self.execute_strategies(prices)
+            self.logInfo('Prices resynced: {}'.format(', '.join(symbols)))
         except Exception:
             self.logError(traceback.format_exc())
 
     def start_listening(self):
         # self.init_trades()
+        if not self.dispatcher.is_alive():
+            self.dispatcher.start()
+
+        if not self.exchange_info.is_alive():
+            self.exchange_info.start()
+
         self.fx.start_listening()
-        self.last_ts = dt.now()
+
+    def set_tick_window(self, symbol, window_ms):
+        self.dispatcher.set_window(symbol, window_ms)
+
+    def get_dispatcher_metrics(self):
+        return self.dispatcher.get_metrics()
+
+    def get_latency_metrics(self):
+        return self.latency.get_metrics()
 
     def remove_strategy(self, strategy: TradingStrategy, api_call=False):
-        if strategy in self.strategies:
-            self.strategies.remove(strategy)
+        with self.lock:
+            if strategy in self.strategies:
+                self.strategies.remove(strategy)
 
-        sym = strategy.symbol()
-        if sym in self.strategies_dict:
-            if len(self.strategies_dict[sym]) > 1:
-                self.strategies_dict[sym].remove(strategy)
-            else:
-                self.strategies_dict.pop(sym, None)
+            sym = strategy.symbol()
+            if sym in self.strategies_dict:
+                if len(self.strategies_dict[sym]) > 1:
+                    self.strategies_dict[sym].remove(strategy)
+                else:
+                    self.strategies_dict.pop(sym, None)
+
+            if sym not in self.strategies_dict:
+                self.dispatcher.discard(sym)
+
+            if strategy.trade.id in self.tradeid_strategy_dict:
+                self.tradeid_strategy_dict.pop(strategy.trade.id, None)
 
-        if strategy.trade.id in self.tradeid_strategy_dict:
-            self.tradeid_strategy_dict.pop(strategy.trade.id, None)
+        self.unindex_orders(strategy)
 
         if api_call:
             strategy.set_trade_removed()
 
         strategy.cancel_all_open_orders()
-        self.fx.listen_symbols([s.symbol() for s in self.strategies], self.listen_handler, self.user_data_handler)
-        self.socket_message_rcvd = False
+
+        streams = self.get_price_streams()
+        self.fx.update_symbols(streams)
+        self.latency.retain(streams)
 
     def add_new_strategy(self, strategy: TradingStrategy, listen_symbols=True):
-        self.strategies.append(strategy)
+        with self.lock:
+            self.strategies.append(strategy)
 
-        sym = strategy.symbol()
-        if sym in self.strategies_dict:
-            self.strategies_dict[sym].append(strategy)
-        else:
-            self.strategies_dict[sym] = [strategy]
+            sym = strategy.symbol()
+            if sym in self.strategies_dict:
+                self.strategies_dict[sym].append(strategy)
+            else:
+                self.strategies_dict[sym] = [strategy]
 
-        self.tradeid_strategy_dict[strategy.trade.id] = strategy
+            self.tradeid_strategy_dict[strategy.trade.id] = strategy
 
-        # self.balances.update_balances(self.fx.get_all_balances_dict())
+        self.index_orders(strategy)
 
-        if ExchangeInfo().need_update():
-            ExchangeInfo().update(self.fx.get_exchange_info())
+        # self.balances.update_balances(self.fx.get_all_balances_dict())
 
         if listen_symbols:
-            self.fx.listen_symbols([s.symbol() for s in self.strategies], self.listen_handler, self.user_data_handler)
+            self.fx.update_symbols(self.get_price_streams())
 
-        self.socket_message_rcvd = False
+    def index_orders(self, strategy: TradingStrategy):
+        with self.lock:
+            self.unindex_orders(strategy)
+
+            # both orders of an OCO route to its target
+            order_ids = [(i, t) for t in strategy.trade.get_all_active_placed_targets() for i in (t.id, t.stop_id)
+                         if i is not None]
+            for order_id, t in order_ids:
+                self.order_index[order_id] = (strategy, t)
+
+            self.trade_order_ids[strategy.trade.id] = [order_id for order_id, t in order_ids]
+
+    def unindex_orders(self, strategy: TradingStrategy):
+        with self.lock:
+            for order_id in self.trade_order_ids.pop(strategy.trade.id, []):
+                if self.order_index.get(order_id, (None,))[0] is strategy:
+                    self.order_index.pop(order_id)
+
+    def route_order(self, symbol, order_id):
+        '''
+        :return: [(strategy, target)] of the order, or all strategies of the symbol with no target if it is not indexed
+        '''
+        strategy, target = self.order_index.get(order_id, (None, None))
+
+        if strategy and target.has_order_id(order_id) and not target.is_completed() and strategy.symbol() == symbol \
+                and self.tradeid_strategy_dict.get(strategy.trade.id) is strategy:
+            return [(strategy, target)]
+
+        return [(s, None) for s in self.strategies_dict.get(symbol, [])]
+
+    def get_price_streams(self):
+        with self.lock:
+            return list({(s.symbol(), s.price_source()) for s in self.strategies})
 
     # def init_strategies(self):
     #     # self.strategies_dict = {s.symbol(): s for s in self.strategies}
@@ -144,78 +248,133 @@ class TradeHandler(Logger):
         self.fx.stop_listening()
 
     def user_data_handler(self, msg):
+        # called on the websocket thread, so only balances are updated here and executions are queued
         try:
             if msg['e'] == 'outboundAccountPosition':
                 self.balances.update_balances(
-                    {bal['a']: {'f': float(bal['f']), 'l': float(bal['l'])} for bal in msg['B']})
+                    {bal['a']: {'f': float(bal['f']), 'l': float(bal['l'])} for bal in msg['B']}, msg.get('u'))
+            elif msg['e'] == 'balanceUpdate':
+                self.balances.apply_delta(msg['a'], float(msg['d']), msg.get('T'))
             elif msg['e'] == 'executionReport':
-                sym = msg['s']
-
-                if sym in self.strategies_dict:
-                    for s in self.strategies_dict[sym]:
-                        s.on_execution_rpt(
-                            {'orderId': msg['i'],
-                             'status': msg['X'],
-                             'symbol': sym,
-                             'side': msg['S'],
-                             'vol': msg['q'],
-                             'price': msg['p'],
-                             'stop_price': msg['P']})
-                    # self.strategies_dict[sym].on_execution_rpt(
-                    #     {'orderId': msg['i'],
-                    #      'status': msg['X'],
-                    #      'symbol': sym,
-                    #      'side': msg['S'],
-                    #      'vol': msg['q'],
-                    #      'price': msg['p'],
-                    #      'stop_price': msg['P']})
+                if msg['s'] in self.strategies_dict:
+                    # balances changed by the execution are reported after it
+                    msg['balances_version'] = self.balances.version
+                    self.dispatcher.submit(msg['s'], self.on_execution_report, msg)
+            elif msg['e'] == 'listStatus':
+                if msg['s'] in self.strategies_dict:
+                    self.dispatcher.submit(msg['s'], self.on_list_status, msg)
         except Exception as e:
             self.logError(traceback.format_exc())
             # self.logger.error(str(e))
 
+    def on_execution_report(self, msg):
+        sym = msg['s']
+
+        with self.symbol_lock(sym):
+            routed = self.route_order(sym, msg['i'])
+
+            for s, target in routed:
+                s.on_execution_rpt(
+                    {'orderId': msg['i'],
+                     'status': msg['X'],
+                     'symbol': sym,
+                     'side': msg['S'],
+                     'vol': msg['q'],
+                     'price': msg['p'],
+                     'stop_price': msg['P'],
+                     'list_id': msg.get('g', -1),
+                     'balances_version': msg.get('balances_version')}, target)
+
+                # the order was missed by the index, e.g. its target changed without a trade update
+                if target is None:
+                    self.index_orders(s)
+
+            self.check_strategies_status(sym)
+
+    def on_list_status(self, msg):
+        sym = msg['s']
+
+        with self.symbol_lock(sym):
+            # lists are routed by their orders
+            routed = self.route_order(sym, msg['O'][0]['i'] if msg.get('O') else None)
+
+            for s, target in routed:
+                s.on_list_status(
+                    {'listId': msg['g'],
+                     'status': msg['L'],
+                     'type': msg['l'],
+                     'symbol': sym}, target)
+
+            self.check_strategies_status(sym)
+
     def listen_handler(self, msg):
         try:
             if self.paused:
                 return
 
+            recv_time = Clock.time()
+
             if not self.socket_message_rcvd:
                 self.confirm_socket_msg_rcvd()
 
-            delta = dt.now() - self.last_ts
             if isinstance(msg, list):
                 for ticker in msg:
                     if ticker['s'] in self.strategies_dict and ticker['e'] == '24hrTicker':
-                        self.trade_info_ticker_buf[ticker['s']] = {'b': float(ticker['b']), 'a': float(ticker['a'])}
+                        self.dispatcher.push(ticker['s'], *self.parse_price(ticker, recv_time))
             else:
                 d = msg['data']
 
                 if 'error' in (msg.get('e', None), d.get('e', None)):
                     self.logError(msg)
                     return
-                elif d['e'] == '24hrTicker':
-                    self.trade_info_ticker_buf[d['s']] = {'b': float(d['b']), 'a': float(d['a'])}
-
-            if ExchangeInfo().need_update():
-                ExchangeInfo().update(self.fx.get_exchange_info())
 
-            if (delta.seconds * 1000 + (delta).microseconds / 1000) > self.process_delay:
-                self.last_ts = dt.now()
-                self.check_strategies_status()
-                prices = dict(self.trade_info_ticker_buf)
-                self.trade_info_ticker_buf = {}
-                self.execute_strategies(prices)
+                source, price = self.parse_price(d, recv_time)
+                if source:
+                    self.dispatcher.push(d['s'], source, price)
 
         except Exception as e:
             self.logError(traceback.print_exc())
 
-    def execute_strategies(self, prices):
-        with self.lock:
-            for s in self.strategies:
-                if s.symbol() in prices and not s.paused:
-                    s.execute(prices[s.symbol()])
+    def parse_price(self, d, recv_time=None):
+        '''
+        :return: price source and price with exchange event time "E" (ms) and local receive time "t" (s)
+        '''
+        event = d.get('e')
+
+        if event == '24hrTicker':
+            return PriceSource.TICKER, {'b': float(d['b']), 'a': float(d['a']), 'E': d['E'], 't': recv_time}
+
+        if event == 'aggTrade':
+            price = float(d['p'])
+            return PriceSource.AGG_TRADE, {'b': price, 'a': price, 'E': d['E'], 't': recv_time}
+
+        # bookTicker payload has neither an event type nor an event time
+        if event is None and 'u' in d:
+            return PriceSource.BOOK_TICKER, {'b': float(d['b']), 'a': float(d['a']), 'E': None, 't': recv_time}
+
+        return None, None
+
+    def on_symbol_prices(self, symbol, prices):
+        if self.paused:
+            return
 
-    def check_strategies_status(self):
-        for s in self.strategies[:]:
+        dispatch_time = Clock.time()
+
+        with self.symbol_lock(symbol):
+            for s in self.strategies_dict.get(symbol, [])[:]:
+                if self.handle_completed_strategy(s):
+                    continue
+
+                price = prices.get(s.price_source())
+                if price and not s.paused:
+                    s.execute(price)
+
+        done_time = Clock.time()
+        for source, price in prices.items():
+            self.latency.record_tick(symbol, source, price, dispatch_time, done_time)
+
+    def check_strategies_status(self, symbol=None):
+        for s in (self.strategies if symbol is None else self.strategies_dict.get(symbol, []))[:]:
             self.handle_completed_strategy(s)
 
     def handle_completed_strategy(self, s):
@@ -227,18 +386,15 @@ class TradeHandler(Logger):
         if not strategy:
             return
 
-        with self.lock:
+        with self.symbol_lock(strategy.symbol()):
             self.logInfo('Removing trade [{}]'.format(strategy.symbol()))
-            try:
-                self.stop_listening()
-                self.remove_strategy(strategy, api_call)
-            finally:
-                self.start_listening()
+            self.remove_strategy(strategy, api_call)
 
     def force_reconnect_sockets(self):
         with self.lock:
             self.stop_listening()
-            self.fx.listen_symbols([s.symbol() for s in self.strategies], self.listen_handler, self.user_data_handler)
+            self.fx.listen_symbols(self.get_price_streams(), self.listen_handler, self.user_data_handler,
+                                   self.on_ticker_connected)
             self.start_listening()
 
     def get_strategy_by_id(self, id) -> TradingStrategy:
@@ -249,21 +405,23 @@ class TradeHandler(Logger):
         strategy.emergent_close_position()
 
     def remove_trade_by_id(self, id, api_call=False, close_trade=False):
-        with self.lock:
-            self.remove_trade_by_strategy(self.tradeid_strategy_dict.get(id, None), api_call)
+        self.remove_trade_by_strategy(self.tradeid_strategy_dict.get(id, None), api_call)
 
     def add_trades(self, trades: [Trade], start_listening=True):
         self.logInfo('Adding {} trades to the TradeHandler.'.format(len(trades)))
         # try:
         self.stop_listening()
 
-        # if not ExchangeInfo().has_all_symbol(self.strategies_dict.keys()):
-        ExchangeInfo().update(self.fx.get_exchange_info())
-        AccountBalances().update_balances(self.fx.get_all_balances_dict())
+        self.load_exchange_info([t.symbol for t in trades])
+        self.balances.refresh(self.fx.get_all_balances_dict, force=True)
+
+        open_orders = self.get_open_orders_snapshot(trades)
 
         for trade in trades:
-            new_strategy = TargetsAndStopLossStrategy(trade, self.fx, self.order_updated_handler,
-                                                      self.balances.get_balance(trade.asset))
+            new_strategy = TargetsAndStopLossStrategy(trade, self.fx, self.on_trade_updated,
+                                                      self.balances.get_balance(trade.asset),
+                                                      open_orders.get(trade.symbol, {}) if open_orders is not None
+                                                      else None)
             self.logInfo(new_strategy.describe())
 
             if self.handle_completed_strategy(new_strategy):
@@ -272,7 +430,8 @@ class TradeHandler(Logger):
 
             self.add_new_strategy(new_strategy, listen_symbols=False)
 
-        self.fx.listen_symbols([s.symbol() for s in self.strategies], self.listen_handler, self.user_data_handler)
+        self.fx.listen_symbols(self.get_price_streams(), self.listen_handler, self.user_data_handler,
+                               self.on_ticker_connected)
 
         if start_listening:
             self.start_listening()
@@ -281,25 +440,50 @@ class TradeHandler(Logger):
         # finally:
 
 
+    def get_open_orders_snapshot(self, trades):
+        '''
+        Open orders of all symbols are requested at once instead of per trade
+        :return: {symbol: {order id: order}}, None if strategies should request their symbols
+        '''
+        if not any(t.get_all_active_placed_targets() for t in trades):
+            return {}
+
+        try:
+            return self.fx.get_all_open_orders()
+        except Exception:
+            self.logError(traceback.format_exc())
+            return None
+
+    def load_exchange_info(self, symbols):
+        '''
+        Serves filters from the snapshot if it has all symbols, the refresher requests the fresh info after the start
+        '''
+        if not ExchangeInfo().symbols and not self.exchange_info.load_snapshot():
+            self.exchange_info.refresh()
+        else:
+            self.exchange_info.ensure_symbols(symbols)
+
     def updated_trade(self, trade: Trade):
-        with self.lock:
+        with self.symbol_lock(trade.symbol):
             if trade.id in self.tradeid_strategy_dict:
                 # find by ID
                 # self.strategies_dict[trade.symbol].update_trade(trade)
                 existing_strategy = self.tradeid_strategy_dict[trade.id]
                 existing_strategy.update_trade(trade)
+                self.index_orders(existing_strategy)
 
                 if self.handle_completed_strategy(self.tradeid_strategy_dict[trade.id]):
                     self.logInfo('Strategy is completed [{}]'.format(trade.symbol))
                     return
 
-                self.balances.update_balances(self.fx.get_all_balances_dict())
+                self.balances.refresh(self.fx.get_all_balances_dict)
                 self.logInfo('Updating trade [{}]'.format(trade.symbol))
                 # self.logInfo(existing_strategy.describe())
             else:
                 self.logInfo('Adding trade [{}]'.format(trade.symbol))
+                self.exchange_info.ensure_symbols([trade.symbol])
 
-                new_strategy = TargetsAndStopLossStrategy(trade, self.fx, self.order_updated_handler,
+                new_strategy = TargetsAndStopLossStrategy(trade, self.fx, self.on_trade_updated,
                                                       self.balances.get_balance(trade.asset))
 
                 self.logInfo(new_strategy.describe())
@@ -308,16 +492,20 @@ class TradeHandler(Logger):
                     self.logInfo('Strategy is completed [{}]'.format(new_strategy.symbol()))
                     return
 
-                try:
-                    self.stop_listening()
-                    self.add_new_strategy(new_strategy)
-                finally:
-                    self.start_listening()
+                self.add_new_strategy(new_strategy)
 
     def confirm_socket_msg_rcvd(self):
         self.socket_message_rcvd = True
         self.logInfo('WebSocket message received')
 
+    def on_trade_updated(self, trade, need_cloud_sync):
+        # strategies report every target change here, so order ids are re-indexed before the trade is saved
+        strategy = self.tradeid_strategy_dict.get(trade.id)
+        if strategy:
+            self.index_orders(strategy)
+
+        self.fire_trade_updated(trade, need_cloud_sync)
+
     def fire_trade_updated(self, trade, need_cloud_sync):
         if self.order_updated_handler:
             self.order_updated_handler(trade, need_cloud_sync)
@@ -74,7 +74,8 @@ class ConsoleLauncher(Logger):
         self.trade_handler = TradeHandler(
             trades,
             self.fx,
-            lambda trade, cloud_sync: self.on_trade_updated_by_handler(trade, cloud_sync)
+            lambda trade, cloud_sync: self.on_trade_updated_by_handler(trade, cloud_sync),
+            Utils.get_exchange_info_snapshot()
         )
 
         self.init_file_watch_list()
@@ -0,0 +1,410 @@
+import json
+
+from binance.exceptions import BinanceAPIException
+
+from Utils import Clock
+from Utils.Logger import Logger
+
+
+class ReplayClient(Logger):
+    '''
+    In-process exchange with the part of binance Client API used by FXConnector.
+    Orders are matched against replayed bid/ask prices and fills are reported as user data events.
+    '''
+    PRIVATE_API_VERSION = 'v3'
+
+    OPEN_STATUSES = ['NEW', 'PARTIALLY_FILLED']
+
+    def __init__(self, exchange_info, balances, user_data_handler=None):
+        '''
+        :param exchange_info: exchange info as returned by the exchange API
+        :param balances: {asset: free balance}
+        '''
+        super().__init__()
+        self.exchange_info = exchange_info
+        self.symbols = {s['symbol']: s for s in exchange_info['symbols']}
+        self.balances = {asset: {'f': float(free), 'l': 0.} for asset, free in balances.items()}
+        self.user_data_handler = user_data_handler
+
+        self.timestamp_offset = 0
+        self.prices = {}
+        self.orders = {}
+        self.open_orders = {}
+        self.order_id = 0
+        self.order_lists = {}
+        self.order_list_id = 0
+        self.list_client_ids = {}
+
+        self.stats = {'placed': 0, 'filled': 0, 'canceled': 0, 'rejected': 0}
+
+    @staticmethod
+    def error(code, msg):
+        return BinanceAPIException(None, 400, json.dumps({'code': code, 'msg': msg}))
+
+    @staticmethod
+    def fmt(num):
+        return '{:.8f}'.format(num)
+
+    def timestamp(self):
+        return int(Clock.time() * 1000)
+
+    def balance(self, asset):
+        return self.balances.setdefault(asset, {'f': 0., 'l': 0.})
+
+    def get_server_time(self):
+        return {'serverTime': self.timestamp()}
+
+    def stream_get_listen_key(self):
+        return 'replay'
+
+    def get_exchange_info(self):
+        return self.exchange_info
+
+    def get_account(self):
+        return {'balances': [{'asset': a, 'free': self.fmt(b['f']), 'locked': self.fmt(b['l'])}
+                             for a, b in self.balances.items()]}
+
+    def get_asset_balance(self, asset):
+        b = self.balance(asset)
+        return {'asset': asset, 'free': self.fmt(b['f']), 'locked': self.fmt(b['l'])}
+
+    def get_all_tickers(self):
+        return [{'symbol': s, 'price': self.fmt(p['b'])} for s, p in self.prices.items()]
+
+    def get_orderbook_tickers(self):
+        return [self.book_ticker(s) for s in self.prices]
+
+    def book_ticker(self, symbol):
+        p = self.prices.get(symbol, {'b': 0, 'a': 0})
+        return {'symbol': symbol, 'bidPrice': self.fmt(p['b']), 'askPrice': self.fmt(p['a'])}
+
+    def _get(self, path, signed=False, version=None, **kwargs):
+        if path == 'ticker/bookTicker':
+            data = kwargs['data']
+            if 'symbols' in data:
+                return [self.book_ticker(s) for s in json.loads(data['symbols']) if s in self.prices]
+
+            return self.book_ticker(data['symbol'])
+
+        if path == 'orderList':
+            client_id = kwargs['data']['origClientOrderId']
+            list_id = next((i for i, c in self.list_client_ids.items() if c == client_id), None)
+            if list_id is None:
+                raise self.error(-2011, 'Order list does not exist.')
+
+            return self.order_list(list_id)
+
+        if path == 'exchangeInfo':
+            symbols = json.loads(kwargs['data']['symbols'])
+            if any(s not in self.symbols for s in symbols):
+                raise self.error(-1121, 'Invalid symbol.')
+
+            return dict(self.exchange_info, symbols=[self.symbols[s] for s in symbols])
+
+        raise self.error(-1000, 'Replay client does not support GET {}'.format(path))
+
+    def _delete(self, path, signed=False, version=None, **kwargs):
+        if path == 'openOrders':
+            symbol = kwargs['data']['symbol']
+            orders = [o for o in self.open_orders.values() if o['symbol'] == symbol]
+            if not orders:
+                raise self.error(-2011, 'Unknown order sent.')
+
+            # OCO orders are canceled as lists
+            list_ids = list(dict.fromkeys(o['orderListId'] for o in orders if o['orderListId'] != -1))
+            return [self.cancel_order(symbol=symbol, orderId=o['orderId']) for o in orders if o['orderListId'] == -1] + \
+                   [self.cancel_order_list(symbol, list_id) for list_id in list_ids]
+
+        if path == 'orderList':
+            data = kwargs['data']
+            return self.cancel_order_list(data['symbol'], int(data['orderListId']))
+
+        raise self.error(-1000, 'Replay client does not support DELETE {}'.format(path))
+
+    def get_open_orders(self, symbol=None):
+        return [dict(o) for o in self.open_orders.values() if not symbol or o['symbol'] == symbol]
+
+    def get_all_orders(self, symbol, limit=500):
+        return [dict(o) for o in self.orders.values() if o['symbol'] == symbol][-limit:]
+
+    def get_order(self, symbol, orderId=None, origClientOrderId=None):
+        if origClientOrderId:
+            # the latest order with the client order id
+            order = next((o for o in reversed(list(self.orders.values())) if o['clientOrderId'] == origClientOrderId),
+                         None)
+        else:
+            order = self.orders.get(orderId)
+
+        if not order or order['symbol'] != symbol:
+            raise self.error(-2013, 'Order does not exist.')
+
+        return dict(order)
+
+    def create_order(self, symbol, side, type, quantity, price=None, stopPrice=None, timeInForce=None,
+                     newClientOrderId=None, newOrderRespType=None, **kwargs):
+        if symbol not in self.symbols:
+            raise self.error(-1121, 'Invalid symbol.')
+
+        qty = float(quantity)
+        limit = float(price) if price else 0.
+
+        if type == 'MARKET':
+            p = self.prices.get(symbol)
+            if not p:
+                raise self.error(-1013, 'No replayed price for {}.'.format(symbol))
+            limit = p['a'] if side == 'BUY' else p['b']
+
+        order = self.new_order(symbol, side, type, qty, limit, price, stopPrice, timeInForce, newClientOrderId)
+
+        if type == 'MARKET':
+            self.fill(order, limit)
+        else:
+            self.match(symbol)
+
+        if newOrderRespType == 'ACK':
+            return {k: order[k] for k in ('symbol', 'orderId', 'orderListId', 'clientOrderId', 'transactTime')}
+
+        return dict(order)
+
+    def create_oco_order(self, symbol, side, quantity, price, stopPrice, stopLimitPrice, stopLimitTimeInForce=None,
+                         listClientOrderId=None, limitClientOrderId=None, stopClientOrderId=None,
+                         newOrderRespType=None, **kwargs):
+        if symbol not in self.symbols:
+            raise self.error(-1121, 'Invalid symbol.')
+
+        qty, limit, stop, stop_limit = float(quantity), float(price), float(stopPrice), float(stopLimitPrice)
+        p = self.prices.get(symbol)
+
+        # the limit order must not fill and the stop must not trigger right away
+        if p and ((side == 'SELL' and not limit > p['b'] > stop) or (side == 'BUY' and not limit < p['a'] < stop)):
+            self.stats['rejected'] += 1
+            raise self.error(-2010, 'The relationship of the prices for the orders is not correct.')
+
+        self.order_list_id += 1
+        list_id = self.order_list_id
+
+        # both orders share the funds, they are locked with the stop order
+        orders = [self.new_order(symbol, side, 'STOP_LOSS_LIMIT', qty, max(limit, stop_limit) if side == 'BUY' else 0,
+                                 stopLimitPrice, stopPrice, stopLimitTimeInForce, stopClientOrderId, list_id),
+                  self.new_order(symbol, side, 'LIMIT_MAKER', qty, None, price, None, 'GTC', limitClientOrderId, list_id)]
+        self.order_lists[list_id] = orders
+        self.list_client_ids[list_id] = listClientOrderId or 'replaylist{}'.format(list_id)
+
+        self.report_list(list_id, 'EXEC_STARTED', 'EXECUTING')
+        self.match(symbol)
+
+        if newOrderRespType == 'ACK':
+            return self.order_list(list_id)
+
+        return dict(self.order_list(list_id), orderReports=[dict(o) for o in orders])
+
+    def new_order(self, symbol, side, type, qty, lock_price, price, stopPrice, timeInForce, newClientOrderId,
+                  list_id=-1):
+        '''
+        :param lock_price: funds are locked for the limit price, None if the funds are locked by another order of the list
+        '''
+        info = self.symbols[symbol]
+        amount = 0.
+
+        # client order ids are unique among open orders
+        if newClientOrderId and any(o['clientOrderId'] == newClientOrderId for o in self.open_orders.values()):
+            self.stats['rejected'] += 1
+            raise self.error(-2010, 'Duplicate order sent.')
+
+        if lock_price is not None:
+            asset, amount = (info['quoteAsset'], qty * lock_price) if side == 'BUY' else (info['baseAsset'], qty)
+            bal = self.balance(asset)
+
+            if bal['f'] < amount - 1e-12:
+                self.stats['rejected'] += 1
+                raise self.error(-2010, 'Account has insufficient balance for requested action.')
+
+            bal['f'] -= amount
+            bal['l'] += amount
+
+        self.order_id += 1
+        order = {'symbol': symbol,
+                 'orderId': self.order_id,
+                 'orderListId': list_id,
+                 'clientOrderId': newClientOrderId or 'replay{}'.format(self.order_id),
+                 'transactTime': self.timestamp(),
+                 'price': self.fmt(float(price) if price else 0.),
+                 'origQty': self.fmt(qty),
+                 'executedQty': self.fmt(0.),
+                 'cummulativeQuoteQty': self.fmt(0.),
+                 'status': 'NEW',
+                 'timeInForce': timeInForce or 'GTC',
+                 'type': type,
+                 'side': side,
+                 'stopPrice': self.fmt(float(stopPrice) if stopPrice else 0.),
+                 'triggered': stopPrice is None,
+                 'locked': amount}
+
+        self.orders[order['orderId']] = order
+        self.open_orders[order['orderId']] = order
+        self.stats['placed'] += 1
+        self.report(order)
+
+        return order
+
+    def cancel_order(self, symbol, orderId):
+        order = self.open_orders.get(orderId)
+        if not order or order['symbol'] != symbol:
+            raise self.error(-2011, 'Unknown order sent.')
+
+        # canceling an order of an OCO cancels the whole list
+        if order['orderListId'] != -1:
+            self.cancel_order_list(symbol, order['orderListId'])
+            return dict(order)
+
+        self.open_orders.pop(orderId)
+        self.unlock(order)
+
+        order['status'] = 'CANCELED'
+        self.stats['canceled'] += 1
+        self.report(order)
+        self.report_balances(symbol)
+
+        return dict(order)
+
+    def cancel_order_list(self, symbol, list_id):
+        orders = [o for o in self.order_lists.get(list_id, []) if o['orderId'] in self.open_orders]
+        if not orders or orders[0]['symbol'] != symbol:
+            raise self.error(-2011, 'Unknown order sent.')
+
+        for order in orders:
+            self.open_orders.pop(order['orderId'])
+            self.unlock(order)
+            order['status'] = 'CANCELED'
+            self.stats['canceled'] += 1
+            self.report(order)
+
+        self.report_list(list_id, 'ALL_DONE', 'ALL_DONE')
+        self.report_balances(symbol)
+
+        return dict(self.order_list(list_id), orderReports=[dict(o) for o in self.order_lists[list_id]])
+
+    def order_list(self, list_id):
+        orders = self.order_lists[list_id]
+        done = all(o['orderId'] not in self.open_orders for o in orders)
+
+        return {'orderListId': list_id,
+                'contingencyType': 'OCO',
+                'listStatusType': 'ALL_DONE' if done else 'EXEC_STARTED',
+                'listOrderStatus': 'ALL_DONE' if done else 'EXECUTING',
+                'listClientOrderId': self.list_client_ids[list_id],
+                'transactionTime': self.timestamp(),
+                'symbol': orders[0]['symbol'],
+                'orders': [{'symbol': o['symbol'], 'orderId': o['orderId'], 'clientOrderId': o['clientOrderId']}
+                           for o in orders]}
+
+    def unlock(self, order):
+        info = self.symbols[order['symbol']]
+        bal = self.balance(info['quoteAsset'] if order['side'] == 'BUY' else info['baseAsset'])
+        bal['l'] -= order['locked']
+        bal['f'] += order['locked']
+        order['locked'] = 0.
+
+    def on_price(self, symbol, bid, ask):
+        self.prices[symbol] = {'b': bid, 'a': ask}
+        self.match(symbol)
+
+    def match(self, symbol):
+        p = self.prices.get(symbol)
+        if not p:
+            return
+
+        for order in [o for o in self.open_orders.values() if o['symbol'] == symbol]:
+            # the other order of a filled OCO has expired
+            if order['orderId'] not in self.open_orders:
+                continue
+
+            buy = order['side'] == 'BUY'
+            stop = float(order['stopPrice'])
+
+            if not order['triggered']:
+                # stop loss sell triggers when bid falls to the stop price, buy when ask rises to it
+                order['triggered'] = p['b'] <= stop if not buy else p['a'] >= stop
+
+                if not order['triggered']:
+                    continue
+
+            limit = float(order['price'])
+            if buy and p['a'] <= limit:
+                self.fill(order, limit)
+            elif not buy and p['b'] >= limit:
+                self.fill(order, limit)
+
+    def fill(self, order, price):
+        info = self.symbols[order['symbol']]
+        qty = float(order['origQty'])
+        base, quote = self.balance(info['baseAsset']), self.balance(info['quoteAsset'])
+
+        # the other order of the OCO expires and releases the shared funds
+        siblings = [o for o in self.order_lists.get(order['orderListId'], [])
+                    if o is not order and o['orderId'] in self.open_orders]
+        for sibling in siblings:
+            self.open_orders.pop(sibling['orderId'])
+            self.unlock(sibling)
+            sibling['status'] = 'EXPIRED'
+            self.report(sibling)
+
+        self.unlock(order)
+
+        if order['side'] == 'BUY':
+            quote['f'] -= qty * price
+            base['f'] += qty
+        else:
+            base['f'] -= qty
+            quote['f'] += qty * price
+
+        order['status'] = 'FILLED'
+        order['executedQty'] = order['origQty']
+        order['cummulativeQuoteQty'] = self.fmt(qty * price)
+        self.open_orders.pop(order['orderId'], None)
+        self.stats['filled'] += 1
+
+        self.report(order)
+        if order['orderListId'] != -1:
+            self.report_list(order['orderListId'], 'ALL_DONE', 'ALL_DONE')
+        self.report_balances(order['symbol'])
+
+    def report(self, order):
+        if self.user_data_handler:
+            self.user_data_handler({'e': 'executionReport',
+                                    'E': self.timestamp(),
+                                    's': order['symbol'],
+                                    'c': order['clientOrderId'],
+                                    'S': order['side'],
+                                    'o': order['type'],
+                                    'q': order['origQty'],
+                                    'p': order['price'],
+                                    'P': order['stopPrice'],
+                                    'X': order['status'],
+                                    'i': order['orderId'],
+                                    'g': order['orderListId'],
+                                    'z': order['executedQty']})
+
+    def report_list(self, list_id, status_type, order_status):
+        if self.user_data_handler:
+            order_list = self.order_list(list_id)
+            self.user_data_handler({'e': 'listStatus',
+                                    'E': self.timestamp(),
+                                    's': order_list['symbol'],
+                                    'g': list_id,
+                                    'c': order_list['contingencyType'],
+                                    'l': status_type,
+                                    'L': order_status,
+                                    'r': 'NONE',
+                                    'C': order_list['listClientOrderId'],
+                                    'T': self.timestamp(),
+                                    'O': [{'s': o['symbol'], 'i': o['orderId'], 'c': o['clientOrderId']}
+                                          for o in order_list['orders']]})
+
+    def report_balances(self, symbol):
+        if self.user_data_handler:
+            info = self.symbols[symbol]
+            self.user_data_handler({'e': 'outboundAccountPosition',
+                                    'E': self.timestamp(),
+                                    'B': [{'a': a, 'f': self.fmt(self.balance(a)['f']), 'l': self.fmt(self.balance(a)['l'])}
+                                          for a in (info['baseAsset'], info['quoteAsset'])]})
@@ -0,0 +1,174 @@
+'''
+Replays captured socket frames (see FrameCapture) through TradeHandler as fast as possible.
+Time comes from a virtual clock moved by the frames' receive timestamps and orders are matched by ReplayClient.
+
+Usage: python main.py replay <journal file or CAPTURE_DIR> [--trades PATH] [--exchange-info FILE]
+                             [--balances FILE] [--balance AMOUNT]
+'''
+import argparse
+import glob
+import itertools
+import json
+import os
+import time
+from os.path import isdir, isfile, join
+
+from Bot.ConfigLoader import ConfigLoader
+from Bot.Exchange.Binance.FrameDecoder import FrameDecoder
+from Bot.Exchange.FrameCapture import FrameCapture
+from Bot.TradeHandler import TradeHandler
+from Replay.ReplayClient import ReplayClient
+from Replay.ReplayFXConnector import ReplayFXConnector
+from Utils import Clock
+from Utils.Logger import Logger
+
+
+class ReplayEngine(Logger):
+    def __init__(self, journals, trades, exchange_info, balances):
+        super().__init__()
+        self.journals = journals
+        self.trades = trades
+
+        self.clock = Clock.VirtualClock()
+        self.client = ReplayClient(exchange_info, balances)
+        self.fx = ReplayFXConnector(self.client)
+        self.decoder = FrameDecoder()
+
+        self.stats = {'ticker': 0, 'user': 0, 'skipped': 0, 'trade_updates': 0}
+
+    def on_trade_updated(self, trade, need_cloud_sync):
+        self.stats['trade_updates'] += 1
+
+    def frames(self):
+        return itertools.chain.from_iterable(FrameCapture.read(j) for j in self.journals)
+
+    def run(self):
+        frames = self.frames()
+        first = next(frames, None)
+
+        if not first:
+            self.logError('No frames to replay')
+            return
+
+        real_clock = Clock.get_clock()
+        Clock.set_clock(self.clock)
+
+        try:
+            self.clock.set(first[0])
+
+            th = TradeHandler(self.trades, self.fx, self.on_trade_updated)
+            th.add_trades(self.trades, start_listening=False)
+
+            started = time.perf_counter()
+            cpu_started = time.process_time()
+
+            for recv_time, channel, frame in itertools.chain([first], frames):
+                self.clock.set(recv_time)
+
+                if channel == FrameCapture.TICKER:
+                    self.replay_ticker(th, frame)
+                elif channel == FrameCapture.USER:
+                    self.stats['user'] += 1
+                    th.user_data_handler(self.decoder.decode(frame))
+
+                th.dispatcher.flush_due(self.clock.monotonic())
+
+            th.dispatcher.flush_due(float('inf'))
+
+            self.report(th, first[0], time.perf_counter() - started, time.process_time() - cpu_started)
+        finally:
+            Clock.set_clock(real_clock)
+
+    def replay_ticker(self, th: TradeHandler, frame):
+        msg = self.decoder.decode_ticker(frame, self.fx.streams)
+
+        # frames of streams none of the trades listens to and stream request results
+        if not msg or (isinstance(msg, dict) and 'id' in msg):
+            self.stats['skipped'] += 1
+            return
+
+        self.stats['ticker'] += 1
+
+        # the exchange matches resting orders before the bot sees the price
+        for d in (msg if isinstance(msg, list) else [msg['data']]):
+            source, price = th.parse_price(d)
+
+            if source:
+                self.client.on_price(d['s'], price['b'], price['a'])
+
+        th.listen_handler(msg)
+
+    def report(self, th: TradeHandler, start_time, elapsed, cpu):
+        frames = self.stats['ticker'] + self.stats['user'] + self.stats['skipped']
+        span = self.clock.time() - start_time
+
+        self.logInfo('Replayed {} frames ({} ticker, {} user, {} skipped) covering {:.0f}s in {:.2f}s: '
+                     '{:.0f} frames/s, {:.1f} CPU us/frame, {:.0f}x real time'.format(
+                        frames, self.stats['ticker'], self.stats['user'], self.stats['skipped'], span, elapsed,
+                        frames / elapsed if elapsed else 0, cpu * 1e6 / frames if frames else 0,
+                        span / elapsed if elapsed else 0))
+
+        self.logInfo('Orders: {}; trade updates: {}; active trades: {}/{}'.format(
+            ', '.join('{} {}'.format(k, v) for k, v in self.client.stats.items()),
+            self.stats['trade_updates'], len(th.strategies), len(self.trades)))
+
+        for trade in self.trades:
+            self.logInfo('{} [{}]: {}'.format(trade.symbol, trade.id, trade.status.name))
+
+        self.logInfo('Balances: {}'.format(
+            ', '.join('{} {:.8f}'.format(a, b['f'] + b['l']) for a, b in sorted(self.client.balances.items()))))
+
+
+def list_journals(path):
+    if isdir(path):
+        return sorted(glob.glob(join(path, '{}*{}'.format(FrameCapture.FILE_PREFIX, FrameCapture.FILE_SUFFIX))))
+
+    return [path]
+
+
+def load_trades(path):
+    # trade files are only read, ConfigLoader.load_trade_list would rename them
+    files = [path] if isfile(path) else \
+        sorted(join(path, f) for f in os.listdir(path) if isfile(join(path, f)) and f.lower().endswith('json'))
+
+    loader = ConfigLoader()
+    return [t for f in files for t in (loader.load_trade_list_fromfile(f) or [])]
+
+
+def default_balances(exchange_info, trades, amount):
+    symbols = {s['symbol']: s for s in exchange_info['symbols']}
+
+    balances = {}
+    for t in trades:
+        if t.symbol in symbols:
+            balances[symbols[t.symbol]['baseAsset']] = amount
+            balances[symbols[t.symbol]['quoteAsset']] = amount
+
+    return balances
+
+
+def replay(argv, trades_path):
+    parser = argparse.ArgumentParser(prog='main.py replay')
+    parser.add_argument('journal', help='capture journal file or directory')
+    parser.add_argument('--trades', default=trades_path, help='trade file or directory')
+    parser.add_argument('--exchange-info', help='exchange info JSON, by default exchange_info.json next to journals')
+    parser.add_argument('--balances', help='JSON with free balances {"BTC": 1.5}')
+    parser.add_argument('--balance', type=float, default=1000, help='free balance of traded assets if no --balances')
+    args = parser.parse_args(argv)
+
+    journals = list_journals(args.journal)
+    info_path = args.exchange_info or join(args.journal if isdir(args.journal) else os.path.dirname(args.journal),
+                                           'exchange_info.json')
+
+    with open(info_path) as f:
+        exchange_info = json.load(f)
+
+    trades = load_trades(args.trades)
+
+    if args.balances:
+        with open(args.balances) as f:
+            balances = json.load(f)
+    else:
+        balances = default_balances(exchange_info, trades, args.balance)
+
+    ReplayEngine(journals, trades, exchange_info, balances).run()
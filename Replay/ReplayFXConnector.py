@@ -0,0 +1,50 @@
+from Bot.Exchange.Binance.BinanceWebsocket import BinanceWebsocket
+from Bot.Exchange.RestTransport import RestTransport
+from Bot.FXConnector import FXConnector
+from Replay.ReplayClient import ReplayClient
+
+
+def no_retry(method):
+    # replayed exchange errors are deterministic, retrying them only waits for nothing
+    return getattr(method, '__wrapped__', method)
+
+
+class ReplayFXConnector(FXConnector):
+    '''
+    FXConnector backed by the in-process ReplayClient. Sockets are not opened, frames are fed by the ReplayEngine.
+    '''
+    cancel_order = no_retry(FXConnector.cancel_order)
+    cancel_open_orders = no_retry(FXConnector.cancel_open_orders)
+    get_open_orders = no_retry(FXConnector.get_open_orders)
+    get_all_orders = no_retry(FXConnector.get_all_orders)
+    get_all_open_orders = no_retry(FXConnector.get_all_open_orders)
+    get_all_tickers = no_retry(FXConnector.get_all_tickers)
+    get_orderbook_tickers = no_retry(FXConnector.get_orderbook_tickers)
+    get_order_status = no_retry(FXConnector.get_order_status)
+    get_balance = no_retry(FXConnector.get_balance)
+    get_all_balances = no_retry(FXConnector.get_all_balances)
+    get_all_balances_dict = no_retry(FXConnector.get_all_balances_dict)
+    get_exchange_info = no_retry(FXConnector.get_exchange_info)
+    cancel_oco_order = no_retry(FXConnector.cancel_oco_order)
+
+    def __init__(self, client: ReplayClient):
+        super().__init__()
+        self._client = client
+        self.streams = set()
+
+    def _place_orders(self, sym, orders, place):
+        # the replayed exchange is driven by the replay thread only, so batches are placed in order
+        return [RestTransport.call(place, o) for o in orders]
+
+    def listen_symbols(self, symbols, on_ticker_received, user_data_handler, on_ticker_connected=None):
+        self.streams = BinanceWebsocket.stream_names(symbols)
+        self._client.user_data_handler = user_data_handler
+
+    def update_symbols(self, symbols):
+        self.streams = BinanceWebsocket.stream_names(symbols)
+
+    def start_listening(self):
+        pass
+
+    def stop_listening(self):
+        pass
@@ -0,0 +1,58 @@
+import time as _time
+from datetime import datetime
+
+
+class RealClock:
+    def time(self):
+        return _time.time()
+
+    def monotonic(self):
+        return _time.monotonic()
+
+    def now(self):
+        return datetime.now()
+
+
+class VirtualClock:
+    '''
+    Clock which is moved forward explicitly, e.g. by timestamps of replayed frames
+    '''
+    def __init__(self, start=0.):
+        self.current = start
+
+    def time(self):
+        return self.current
+
+    def monotonic(self):
+        return self.current
+
+    def now(self):
+        return datetime.fromtimestamp(self.current)
+
+    def set(self, ts):
+        # time never goes back, even if frames of different journals interleave
+        self.current = max(self.current, ts)
+
+
+_clock = RealClock()
+
+
+def set_clock(clock):
+    global _clock
+    _clock = clock
+
+
+def get_clock():
+    return _clock
+
+
+def time():
+    return _clock.time()
+
+
+def monotonic():
+    return _clock.monotonic()
+
+
+def now():
+    return _clock.now()
@@ -21,3 +21,91 @@ def s2b(s):
 
 def is_simulation():
     return s2b(os.environ.get("SIMULTATE", False))
+
+def get_price_source():
+    return os.environ.get("PRICE_SOURCE", 'ticker').lower()
+
+def get_tick_window_ms(default):
+    return int(os.environ.get("TICK_WINDOW_MS", default))
+
+def get_symbol_tick_windows():
+    """
+    :return: per symbol batching windows from TICK_SYMBOL_WINDOWS_MS="BTCUSDT:0,ETHBTC:250"
+    """
+    windows = {}
+    for item in os.environ.get("TICK_SYMBOL_WINDOWS_MS", '').split(','):
+        if ':' in item:
+            symbol, window = item.split(':', 1)
+            windows[symbol.strip().upper()] = int(window)
+    return windows
+
+def get_ws_max_streams():
+    return int(os.environ.get("WS_MAX_STREAMS", 200))
+
+def get_dispatch_workers():
+    return max(1, int(os.environ.get("DISPATCH_WORKERS", 1)))
+
+def get_dispatch_queue_size(default):
+    return int(os.environ.get("DISPATCH_QUEUE_SIZE", default))
+
+def get_latency_log_interval():
+    return int(os.environ.get("LATENCY_LOG_INTERVAL", 60))
+
+def get_capture_dir():
+    return os.environ.get("CAPTURE_DIR")
+
+def get_capture_max_mb():
+    return int(os.environ.get("CAPTURE_MAX_MB", 64))
+
+def get_capture_rotate_seconds():
+    return int(os.environ.get("CAPTURE_ROTATE_SECONDS", 3600))
+
+def get_ws_url():
+    """
+    :return: websocket API base URL override, e.g. "ws://localhost:9443/" for a local stand-in server
+    """
+    return os.environ.get("WS_URL")
+
+def get_rest_url():
+    """
+    :return: REST API base URL override, e.g. "http://localhost:9080/api" for a local stand-in server
+    """
+    return os.environ.get("REST_URL")
+
+def get_rest_pool_size():
+    return int(os.environ.get("REST_POOL_SIZE", 10))
+
+def get_exchange_info_refresh_s():
+    return int(os.environ.get("EXCHANGE_INFO_REFRESH_S", 30))
+
+def get_exchange_info_full_refresh_s():
+    return int(os.environ.get("EXCHANGE_INFO_FULL_REFRESH_S", 3600))
+
+def get_exchange_info_snapshot():
+    """
+    :return: file of the last exchange info used for warm starts, empty EXCHANGE_INFO_SNAPSHOT disables it
+    """
+    return os.environ.get("EXCHANGE_INFO_SNAPSHOT", os.path.join(os.environ.get('CONF_DIR', 'Conf/'),
+                                                                 'exchange_info.json')) or None
+
+def get_order_resp_type():
+    """
+    :return: response type of placed orders: ACK (default), RESULT or FULL
+    """
+    resp_type = os.environ.get("ORDER_RESP_TYPE", 'ACK').upper()
+    if resp_type not in ('ACK', 'RESULT', 'FULL'):
+        raise ValueError('ORDER_RESP_TYPE must be ACK, RESULT or FULL, got "{}"'.format(resp_type))
+    return resp_type
+
+def get_clock_sync_interval_s():
+    return int(os.environ.get("CLOCK_SYNC_INTERVAL_S", 60))
+
+def get_clock_sync_samples():
+    return int(os.environ.get("CLOCK_SYNC_SAMPLES", 5))
+
+def get_recv_window_ms():
+    """
+    :return: RECV_WINDOW_MS sent with signed requests (max 60000), the exchange default (5000) if not set
+    """
+    recv_window = os.environ.get("RECV_WINDOW_MS")
+    return min(int(recv_window), 60000) if recv_window else None
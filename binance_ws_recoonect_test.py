@@ -6,15 +6,18 @@ import os
 import os.path
 
 from Bot.Exchange.Binance.BinanceWebsocket import BinanceWebsocket
+from Bot.Exchange.NetworkRuntime import NetworkRuntime
 
 
 def main():
 
     client = Client(os.environ.get('KEY'), os.environ.get('SECRET'))
+    runtime = NetworkRuntime()
+    runtime.ensure_running()
 
     for _ in range(1, 10):
         print('Creating BinanceWebsocketThread instance')
-        bwst = BinanceWebsocket(client)
+        bwst = BinanceWebsocket(client, runtime)
 
         # signal.signal(signal.SIGINT, lambda sig, frame: bwst.stop_ws())
         # signal.signal(signal.SIGTERM, lambda sig, frame: bwst.stop_ws())
@@ -24,7 +27,7 @@ def main():
 
         print('sleep')
         sleep(10)
-        bwst.stop_ticker_future()
+        bwst.stop_ticker()
         bwst.start_ticker(['ETHBTC'], callback=lambda msg: print(msg))
         sleep(10)
         bwst.stop_sockets()
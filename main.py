@@ -45,6 +45,11 @@ def main():
             get_input_for_targets()
             return
 
+        elif sys.argv[1] == 'replay':
+            from Replay.ReplayEngine import replay
+            replay(sys.argv[2:], TRADE_PORTFOLIO_PATH)
+            return
+
     launcher.start_bot()
 
     if api_mode: